@@ -1,15 +1,29 @@
 # app.py
-from flask import Flask, request, render_template, jsonify, send_from_directory, redirect, session, url_for
+from flask import Flask, request, render_template, jsonify, redirect, session, url_for, Response, stream_with_context
 import os
 import time
 import uuid
 import secrets
+import json
+import atexit
+import queue
 import threading
+import multiprocessing
 from dotenv import load_dotenv
-from detector import ImageDetector
+from detector_pool import DetectorPool, InProcessDetector
+from batch_scheduler import MicroBatchScheduler
 from google_auth import create_flow, login_required, create_refresh_endpoint
-from google_api_client import GoogleAPIClient, create_user_resources
+from google_api_client import create_user_resources, apply_resources_to_session, build_service
+from google_client_pool import client_pool
+from credential_manager import credential_manager
+from resource_cache import resource_cache, is_not_found_error, is_auth_error
+import google_transport
 from google_drive_handler import GoogleDriveHandler
+from job_manager import JobManager
+from image_store import ProcessedImageStore
+from upload_queue import UploadQueue
+from sheets_writer import SheetsWriteBuffer
+from result_cache import ResultCache, config_version
 
 # โหลดตัวแปรจากไฟล์ .env สำหรับการพัฒนาในเครื่อง
 load_dotenv()
@@ -26,52 +40,126 @@ def before_request():
         url = request.url.replace('http://', 'https://', 1)
         return redirect(url, code=301)
 
+    # ID ของโฟลเดอร์/Sheets ถูกค้นหาใหม่หลัง API ตอบ 404 - อัปเดต session ที่ยังถือค่าเก่า
+    if 'sheet_id' in session:
+        resources = resource_cache.get(session.get('user_email'))
+        if resources and resources['version'] != session.get('resources_version'):
+            apply_resources_to_session(resources)
+
 # กำหนดค่า Secret Key จาก environment variable หรือสร้างแบบสุ่ม
 app.secret_key = os.environ.get('SECRET_KEY')
 
-# สร้างโฟลเดอร์สำหรับเก็บไฟล์อัปโหลดชั่วคราว
-UPLOAD_FOLDER = os.path.join(os.environ.get('TMPDIR', './'), 'uploads')
-PROCESSED_FOLDER = os.path.join(os.environ.get('TMPDIR', './'), 'processed')
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(PROCESSED_FOLDER, exist_ok=True)
-
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['PROCESSED_FOLDER'] = PROCESSED_FOLDER
-
 # สร้าง detector เพียงครั้งเดียวสำหรับทั้งแอป
-detector = ImageDetector({
+DETECTOR_CONFIG = {
     'model_path': 'bestMR.pt',
-    'use_gpu': True
-})
+    'use_gpu': True,
+    'backend': os.environ.get('INFERENCE_BACKEND', 'torch'),  # torch / onnx / openvino
+    'precision': os.environ.get('INFERENCE_PRECISION', 'fp32'),  # fp32 / fp16 / int8
+    'ocr_stats_path': os.environ.get('OCR_STATS_PATH', 'ocr_stats.json'),
+    'ocr_prune': os.environ.get('OCR_PRUNE', 'false').lower() == 'true',
+    'ocr_prune_explore_rate': float(os.environ.get('OCR_PRUNE_EXPLORE_RATE', 0.05)),
+    'ocr_crop_cache': os.environ.get('OCR_CROP_CACHE', 'true').lower() == 'true',
+    'ocr_crop_cache_classes': os.environ.get('OCR_CROP_CACHE_CLASSES', 'roomN').split(','),
+    'pair_assignment': os.environ.get('PAIR_ASSIGNMENT', 'hungarian')  # hungarian / greedy
+}
 
-# *** เพิ่ม: ฟังก์ชันสำหรับลบไฟล์หลังจาก delay ***
-def schedule_file_cleanup(file_paths, delay_seconds=60):
-    """
-    กำหนดเวลาลบไฟล์หลังจาก delay_seconds วินาที
-    
-    Args:
-        file_paths (list): รายการเส้นทางไฟล์ที่จะลบ
-        delay_seconds (int): เวลาหน่วงก่อนลบไฟล์ (วินาที)
-    """
-    def cleanup_files():
-        time.sleep(delay_seconds)
-        for file_path in file_paths:
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    print(f"🧹 Cleaned up file: {file_path}")
-                else:
-                    print(f"⚠️ File not found for cleanup: {file_path}")
-            except Exception as e:
-                print(f"❌ Error cleaning up file {file_path}: {e}")
-    
-    # เริ่ม thread สำหรับลบไฟล์
-    cleanup_thread = threading.Thread(target=cleanup_files)
-    cleanup_thread.daemon = True  # ทำให้ thread หยุดเมื่อโปรแกรมหลักหยุด
-    cleanup_thread.start()
+# ข้อความตอบกลับเมื่อแถวถูกเก็บในบัฟเฟอร์แล้วแต่ยังไม่ถูกเขียนลง Sheets
+QUEUED_MESSAGE = 'รับข้อมูลแล้ว ระบบจะบันทึกลง Google Sheets อัตโนมัติภายในไม่กี่วินาที'
 
-# สร้าง refresh endpoint
-create_refresh_endpoint(app)
+# โหมดการประมวลผล: single = คู่ห้อง/มิเตอร์ที่ดีที่สุดคู่เดียว, panel = ทุกคู่ในภาพ (แผงมิเตอร์)
+PROCESS_MODES = ('single', 'panel')
+
+# จำนวน worker process ของ detector (0 = ใช้ detector ใน process หลัก)
+DETECTOR_WORKERS = int(os.environ.get('DETECTOR_WORKERS', 0))
+# เวลารอผลจาก detector สูงสุดต่อภาพ (วินาที) - request ไม่ค้างตลอดไปถ้า worker ไม่ตอบ
+DETECTOR_TIMEOUT = float(os.environ.get('DETECTOR_TIMEOUT', 120))
+
+detector = None
+upload_queue = None
+sheets_writer = None
+result_cache = None
+processed_images = None
+job_manager = None
+sse_slots = None
+if multiprocessing.parent_process() is None:  # ไม่สร้างซ้ำใน worker process (spawn import โมดูลหลักใหม่)
+    if DETECTOR_WORKERS > 0:
+        detector = DetectorPool(
+            DETECTOR_CONFIG,
+            num_workers=DETECTOR_WORKERS,
+            torch_threads=int(os.environ.get('DETECTOR_TORCH_THREADS', 0)) or None,
+            max_queue=int(os.environ.get('DETECTOR_QUEUE_SIZE', 32)),
+            max_jobs_per_worker=int(os.environ.get('DETECTOR_MAX_JOBS', 500)),
+            max_rss_mb=int(os.environ.get('DETECTOR_MAX_RSS_MB', 0)) or None
+        )
+    else:
+        detector = InProcessDetector(DETECTOR_CONFIG)
+
+    # รวม request ที่เข้ามาพร้อมกันเป็น batch เดียวของ YOLO (0 = ปิด)
+    BATCH_WINDOW_MS = float(os.environ.get('BATCH_WINDOW_MS', 0))
+    if BATCH_WINDOW_MS > 0:
+        detector = MicroBatchScheduler(
+            detector,
+            window_ms=BATCH_WINDOW_MS,
+            max_batch=int(os.environ.get('BATCH_MAX_SIZE', 8)),
+            concurrency=max(DETECTOR_WORKERS, 1)
+        )
+
+    # คิวอัปโหลดไปยัง Google Drive แบบ background (เก็บใน SQLite ไม่หายเมื่อรีสตาร์ท)
+    if os.environ.get('UPLOAD_QUEUE_ENABLED', 'true').lower() == 'true':
+        upload_queue = UploadQueue(
+            db_path=os.environ.get('UPLOAD_QUEUE_DB', 'upload_queue.db'),
+            spool_dir=os.environ.get('UPLOAD_SPOOL_DIR', 'upload_spool'),
+            num_workers=int(os.environ.get('UPLOAD_WORKERS', 2)),
+            resource_cache=resource_cache,
+            retention_seconds=int(os.environ.get('UPLOAD_RETENTION', 7 * 24 * 3600))
+        )
+        atexit.register(upload_queue.stop)
+
+    # บัฟเฟอร์แถวของแต่ละผู้ใช้ แล้วเขียนลง Sheets ทีละหลายแถว (0 แถว = เขียนทันทีทีละแถว)
+    SHEETS_BUFFER_ROWS = int(os.environ.get('SHEETS_BUFFER_ROWS', 20))
+    if SHEETS_BUFFER_ROWS > 0:
+        sheets_writer = SheetsWriteBuffer(
+            max_rows=SHEETS_BUFFER_ROWS,
+            max_age=float(os.environ.get('SHEETS_BUFFER_MAX_AGE', 5)),
+            upload_queue=upload_queue,
+            link_column_index=UploadQueue.LINK_COLUMN_INDEX,
+            resource_cache=resource_cache,
+            db_path=os.environ.get('SHEETS_BUFFER_DB', 'sheets_buffer.db') or None
+        )
+        atexit.register(sheets_writer.stop)
+
+    # แคชผลลัพธ์ตาม hash ของภาพ (ภาพที่ส่งซ้ำได้ผลลัพธ์และลิงก์เดิมทันที)
+    if os.environ.get('RESULT_CACHE_ENABLED', 'true').lower() == 'true':
+        result_cache = ResultCache(
+            config_version(DETECTOR_CONFIG),
+            max_entries=int(os.environ.get('RESULT_CACHE_SIZE', 256)),
+            max_bytes=int(os.environ.get('RESULT_CACHE_MAX_MB', 64)) * 1024 * 1024,
+            db_path=os.environ.get('RESULT_CACHE_DB') or None,
+            ttl_seconds=int(os.environ.get('RESULT_CACHE_TTL', 7 * 24 * 3600))
+        )
+
+    # ภาพที่ประมวลผลแล้ว (JPEG) เก็บในหน่วยความจำแทนการเขียนลงดิสก์
+    processed_images = ProcessedImageStore(
+        ttl_seconds=int(os.environ.get('PROCESSED_IMAGE_TTL', 300)),
+        max_bytes=int(os.environ.get('PROCESSED_IMAGE_MAX_MB', 256)) * 1024 * 1024
+    )
+
+    # งานประมวลผลแบบ asynchronous (POST /jobs)
+    job_manager = JobManager(
+        max_workers=int(os.environ.get('JOB_WORKERS', 4)),
+        ttl_seconds=int(os.environ.get('JOB_TTL_SECONDS', 600)),
+        max_pending=int(os.environ.get('JOB_MAX_PENDING', 32))
+    )
+
+    # แต่ละ SSE stream ถือ thread ของ waitress ไว้ตลอดงาน จึงจำกัดจำนวน stream พร้อมกัน
+    # ให้น้อยกว่าจำนวน thread (WAITRESS_THREADS ใน server.py) - ที่เกินจะได้ 503 และ client เปลี่ยนไปใช้ polling
+    sse_slots = threading.BoundedSemaphore(int(os.environ.get('JOB_SSE_MAX_STREAMS', 4)))
+
+    # สร้าง refresh endpoint
+    create_refresh_endpoint(app)
+
+    # หยุด worker และบันทึกสถิติ OCR ลงไฟล์ก่อนปิดโปรแกรม
+    atexit.register(detector.shutdown)
 
 @app.route('/')
 def index():
@@ -147,29 +235,55 @@ def callback():
         session['credentials_created_at'] = time.time()
         
         # กำหนดค่าเริ่มต้นสำหรับข้อมูลผู้ใช้
-        session['user_email'] = 'default_user@example.com'
+        # (user_email เป็น key ของแคชต่อผู้ใช้ทั้งหมด จึงห้ามใช้ค่าคงที่ที่ผู้ใช้หลายคนใช้ร่วมกัน)
+        session['user_email'] = None
         session['user_name'] = 'Default User'
+        subject = None
         
-        try:
-            # พยายามใช้ People API ถ้าเป็นไปได้
-            from google.oauth2.credentials import Credentials
-            from googleapiclient.discovery import build
+        # อ่าน email และชื่อจาก id_token ที่ได้มาพร้อม token (scope openid) - ไม่ต้องเรียก API เพิ่ม
+        # id_token ได้รับจาก token endpoint ของ Google โดยตรงผ่าน HTTPS จึงไม่ต้องตรวจลายเซ็นซ้ำ
+        claims = {}
+        if getattr(credentials, 'id_token', None):
+            try:
+                from google.auth import jwt
+                claims = jwt.decode(credentials.id_token, verify=False)
+            except Exception as token_error:
+                print(f"Warning: Could not decode id_token: {token_error}")
+        if claims.get('email'):
+            session['user_email'] = claims['email']
+            session['user_name'] = claims.get('name') or claims['email']
+        else:
+            try:
+                # ไม่มี id_token - ใช้ People API แทน (discovery document แคชไว้ทั้ง process)
+                from google.oauth2.credentials import Credentials
             
-            credentials_obj = Credentials(**session['credentials'])
-            people_service = build('people', 'v1', credentials=credentials_obj)
-            profile = people_service.people().get(
-                resourceName='people/me',
-                personFields='emailAddresses,names'
-            ).execute()
+                credentials_obj = Credentials(**session['credentials'])
+                people_service = build_service('people', 'v1', credentials_obj)
+                profile = people_service.people().get(
+                    resourceName='people/me',
+                    personFields='emailAddresses,names'
+                ).execute()
             
-            if 'emailAddresses' in profile:
-                session['user_email'] = profile['emailAddresses'][0]['value']
+                if 'emailAddresses' in profile:
+                    session['user_email'] = profile['emailAddresses'][0]['value']
+                if profile.get('resourceName'):
+                    subject = profile['resourceName'].split('/')[-1]
             
-            if 'names' in profile:
-                session['user_name'] = profile['names'][0]['displayName']
-        except Exception as people_error:
-            print(f"Warning: Could not fetch user profile: {people_error}")
-            # ทำงานต่อไปแม้ว่าจะไม่สามารถดึงข้อมูลผู้ใช้ได้
+                if 'names' in profile:
+                    session['user_name'] = profile['names'][0]['displayName']
+            except Exception as people_error:
+                print(f"Warning: Could not fetch user profile: {people_error}")
+                # ทำงานต่อไปแม้ว่าจะไม่สามารถดึงข้อมูลผู้ใช้ได้
+        
+        if not session['user_email']:
+            # ไม่ได้ email: ใช้ subject ID ของ Google (ไม่ซ้ำกันระหว่างผู้ใช้) หรือ id เฉพาะของการล็อกอินนี้
+            # เพื่อไม่ให้ credentials / client / ID ของไฟล์ถูกแชร์ระหว่างผู้ใช้ผ่านแคช
+            subject = claims.get('sub') or subject
+            session['user_email'] = f"google-user-{subject}" if subject else f"anonymous-{uuid.uuid4()}"
+            print(f"⚠️ ไม่พบ email ของผู้ใช้ ใช้ {session['user_email']} เป็นตัวระบุแทน")
+        
+        # เก็บ credentials พร้อมเวลาหมดอายุในแคช เพื่อต่ออายุล่วงหน้าใน background
+        credential_manager.register(session['user_email'], session['credentials'], credentials.expiry)
         
         # สร้างโฟลเดอร์และ Sheets สำหรับผู้ใช้
         folder_id, sheet_id = create_user_resources(session.get('user_email', 'unknown'))
@@ -183,6 +297,8 @@ def callback():
 
 @app.route('/logout')
 def logout():
+    client_pool.discard(session.get('user_email'))
+    credential_manager.discard(session.get('user_email'))
     session.clear()
     return redirect(url_for('login_page'))
 
@@ -210,26 +326,39 @@ def get_user_info():
     
     return jsonify(user_info)
 
-@app.route('/uploads/<filename>')
-@login_required
-def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-
 @app.route('/processed/<filename>')
 @login_required
 def processed_file(filename):
-    return send_from_directory(app.config['PROCESSED_FOLDER'], filename)
+    # ภาพที่ประมวลผลแล้วเก็บอยู่ในหน่วยความจำ (ดู store_processed_image)
+    image_data = processed_images.get(filename)
+    if image_data is None:
+        return jsonify({'error': 'ไม่พบภาพ หรือภาพหมดอายุแล้ว'}), 404
+    return Response(image_data, mimetype='image/jpeg')
+
+@app.route('/api/ocr-stats')
+@login_required
+def ocr_stats():
+    """สถิติว่าวิธี OCR ใด (ภาพ × config) ให้ผลลัพธ์ที่ถูกเลือกบ่อยแค่ไหน แยกตาม class"""
+    return jsonify(detector.get_ocr_stats())
+
+@app.route('/api/detector-status')
+@login_required
+def detector_status():
+    """สถานะของ detector (จำนวน worker, งานที่รอ และ metrics ของ micro-batching ถ้าเปิดใช้)"""
+    return jsonify(dict(detector.get_status(),
+                        processed_images=processed_images.stats(),
+                        result_cache=result_cache.stats() if result_cache else None))
 
 def create_google_client_with_session_update():
     """
-    สร้าง GoogleAPIClient และอัปเดต session หาก credentials ถูกต่ออายุ
+    ดึง GoogleAPIClient ของผู้ใช้จาก client pool และอัปเดต session หาก credentials ถูกต่ออายุ
     """
     print(f"📊 Session before: {session.get('credentials', {}).get('token', 'None')[:20]}...")
     
     # เก็บ token เดิมไว้เปรียบเทียบ
     old_token = session.get('credentials', {}).get('token', '')
     
-    google_client = GoogleAPIClient(oauth_credentials=session['credentials'])
+    google_client = client_pool.get(session.get('user_email'), session['credentials'])
     
     # ตรวจสอบว่า credentials ถูกอัปเดตหรือไม่
     updated_credentials = google_client.get_updated_credentials()
@@ -239,7 +368,7 @@ def create_google_client_with_session_update():
         # เปรียบเทียบ token - update เฉพาะเมื่อ token เปลี่ยน
         if old_token != new_token:
             print(f"📊 Session after: {new_token[:20]}...")
-            session['credentials'] = updated_credentials
+            session['credentials'] = dict(updated_credentials)
             session.permanent = True
             session['credentials_refreshed_at'] = time.time()
             print("✅ Session updated with refreshed credentials")
@@ -262,27 +391,32 @@ def process():
         return jsonify({'error': 'ไม่ได้เลือกไฟล์'})
     
     if file:
-        # สร้างชื่อไฟล์แบบสุ่มเพื่อป้องกันการซ้ำกัน (สำหรับ temp storage)
+        # สร้างชื่อไฟล์แบบสุ่มเพื่อป้องกันการซ้ำกัน (ใช้เป็นชื่อไฟล์บน Google Drive)
         file_ext = os.path.splitext(file.filename)[1]
         temp_filename = str(uuid.uuid4()) + file_ext
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], temp_filename)
         
-        # บันทึกไฟล์
-        file.save(file_path)
+        # อ่านไฟล์เข้าหน่วยความจำโดยตรง (ไม่บันทึกลงดิสก์)
+        image_bytes = file.read()
+        mode = get_process_mode()
         
         # ประมวลผลภาพ
         try:
-            results = detector.process_image(file_path, app.config['PROCESSED_FOLDER'])
-            
-            # *** รวบรวมไฟล์ที่ต้องลบ ***
-            files_to_cleanup = [file_path]  # ไฟล์ต้นฉบับที่อัปโหลด
+            try:
+                results, cache_key = process_with_cache(image_bytes, mode=mode)
+            except queue.Full:
+                return jsonify({'error': 'ระบบกำลังประมวลผลภาพจำนวนมาก กรุณาลองใหม่อีกครั้ง', 'busy': True}), 503
             
-            if results.get('processed_image_path') and os.path.exists(results['processed_image_path']):
-                files_to_cleanup.append(results['processed_image_path'])  # ไฟล์ภาพที่ประมวลผลแล้ว
+            # เก็บภาพที่ประมวลผลแล้วไว้ในหน่วยความจำ (สำหรับ /processed/<filename> และอัปโหลด)
+            processed_image = store_processed_image(results)
             
             # *** อัปโหลดไปยัง Google Drive เฉพาะเมื่อ can_upload = True ***
             # (ซึ่งหมายความว่าต้องเจอทั้งเลขห้องและเลขมิเตอร์)
-            if results['can_upload'] and 'credentials' in session:
+            if results['can_upload'] and reuse_cached_upload(results, cache_key, session.get('user_email')):
+                print("♻️ ภาพนี้เคยอัปโหลดแล้ว ใช้ลิงก์เดิม")
+            elif results['can_upload'] and 'credentials' in session and processed_image and upload_queue:
+                # ส่งเข้าคิวอัปโหลด แล้วตอบผล OCR ทันที (ลิงก์ดึงได้ภายหลังจาก /uploads/<upload_id>)
+                enqueue_drive_upload(results, processed_image, temp_filename, session, cache_key)
+            elif results['can_upload'] and 'credentials' in session and processed_image:
                 try:
                     # สร้าง GoogleAPIClient พร้อมอัปเดต session
                     google_client = create_google_client_with_session_update()
@@ -290,9 +424,9 @@ def process():
                     # *** ใช้ชื่อไฟล์แบบสุ่ม (UUID) ***
                     random_filename = temp_filename  
                     
-                    # อัปโหลดไฟล์ไปยัง Google Drive
+                    # อัปโหลดภาพจากหน่วยความจำไปยัง Google Drive
                     file_info = GoogleDriveHandler.upload_to_drive(
-                        results['processed_image_path'], 
+                        processed_image, 
                         random_filename,
                         session, 
                         google_client
@@ -302,83 +436,432 @@ def process():
                         # เก็บลิงก์ไฟล์ไว้ในผลลัพธ์
                         results['google_drive_link'] = file_info.get('webViewLink')
                         results['uploaded_filename'] = random_filename
+                        if result_cache and cache_key:
+                            result_cache.set_upload(cache_key, session.get('user_email'),
+                                                    google_drive_link=results['google_drive_link'])
                         print(f"✅ อัปโหลดภาพสำเร็จ: {random_filename}")
                     
                 except Exception as e:
                     print(f"❌ ไม่สามารถอัปโหลดไฟล์ไปยัง Google Drive: {str(e)}")
+                    if is_not_found_error(e):
+                        resource_cache.report_not_found(session.get('user_email'), session.get('credentials'))
                     # ตรวจสอบว่าเป็น auth error หรือไม่
-                    if "credentials" in str(e).lower() or "authorization" in str(e).lower():
+                    if is_auth_error(e) or "credentials" in str(e).lower() or "authorization" in str(e).lower():
                         results['auth_error'] = True
                         results['error_message'] = "การเข้าสู่ระบบหมดอายุ กรุณาเข้าสู่ระบบใหม่"
             else:
                 if not results['can_upload']:
                     print("⚠️  ไม่อัปโหลดภาพเนื่องจากข้อมูลไม่ครบถ้วน (ต้องเจอทั้งเลขห้องและเลขมิเตอร์)")
             
-            # *** กำหนดเวลาลบไฟล์หลังจาก 60 วินาที ***
-            schedule_file_cleanup(files_to_cleanup, delay_seconds=60)
-            print(f"⏰ Scheduled cleanup for {len(files_to_cleanup)} files in 60 seconds")
-            
             return jsonify(results)
         except Exception as e:
-            # ลบไฟล์ทันทีถ้าเกิดข้อผิดพลาด
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    print(f"🧹 Cleaned up file immediately due to error: {file_path}")
-            except:
-                pass
             return jsonify({'error': f'เกิดข้อผิดพลาดในการประมวลผล: {str(e)}'})
 
+def store_processed_image(results):
+    """
+    ย้ายภาพ JPEG ที่ประมวลผลแล้วออกจากผลลัพธ์ (bytes ส่งเป็น JSON ไม่ได้) ไปเก็บใน processed_images
+
+    Returns:
+        bytes: ข้อมูลภาพ หรือ None ถ้าไม่มี
+    """
+    image_data = results.pop('processed_image_bytes', None)
+    if image_data:
+        processed_images.put(results['processed_image'], image_data)
+    return image_data
+
+def get_process_mode():
+    """
+    โหมดการประมวลผลจากฟอร์ม: 'single' (คู่ที่ดีที่สุดคู่เดียว) หรือ 'panel' (ทุกคู่ในภาพ เช่น แผงมิเตอร์)
+
+    Returns:
+        str: โหมด (ค่าที่ไม่รู้จักถือเป็น 'single')
+    """
+    mode = request.form.get('mode', 'single')
+    return mode if mode in PROCESS_MODES else 'single'
+
+def process_with_cache(image_bytes, progress=None, mode='single'):
+    """
+    ประมวลผลภาพผ่านแคชผลลัพธ์ (ภาพที่เคยประมวลผลแล้วไม่ต้องรัน YOLO + OCR ใหม่)
+
+    Args:
+        image_bytes (bytes): ข้อมูลไฟล์ภาพ
+        progress (callable, optional): callback รายงานความคืบหน้า
+        mode (str): 'single' หรือ 'panel'
+
+    Returns:
+        tuple: (results, cache_key) - cache_key เป็น None ถ้าไม่ได้เปิดใช้แคช
+    """
+    def process():
+        return detector.process_image(image_bytes, encode_image=True, progress=progress, mode=mode,
+                                      timeout=DETECTOR_TIMEOUT)
+
+    if not result_cache:
+        return process(), None
+
+    cache_key = result_cache.key_for(image_bytes, mode)
+    results, cached = result_cache.get_or_process(cache_key, process)
+    if cached:
+        results['cached'] = True
+        print(f"⚡ ใช้ผลลัพธ์จากแคช (ประหยัดเวลา {results.get('elapsed_time') or 0:.2f} วินาที)")
+        if progress:
+            progress('cached', None)
+    return results, cache_key
+
+def reuse_cached_upload(results, cache_key, owner):
+    """
+    ถ้าผู้ใช้เคยอัปโหลดภาพเดียวกันแล้ว ใส่ลิงก์เดิม (หรือ upload_id ที่ยังอยู่ในคิว) ลงในผลลัพธ์แทนการอัปโหลดซ้ำ
+
+    Returns:
+        bool: True ถ้าใช้การอัปโหลดเดิม
+    """
+    if not result_cache or not cache_key:
+        return False
+    upload = result_cache.get_upload(cache_key, owner)
+    if not upload:
+        return False
+
+    link = upload['google_drive_link']
+    if not link and upload['upload_id'] and upload_queue:
+        queued = upload_queue.get(upload['upload_id'])
+        if not queued or queued['status'] == 'failed':
+            # การอัปโหลดเดิมล้มเหลว - อัปโหลดใหม่
+            result_cache.discard_upload(cache_key, owner)
+            return False
+        link = queued['google_drive_link']
+        if link:
+            result_cache.set_upload(cache_key, owner, upload['upload_id'], link)
+        else:
+            results['upload_id'] = upload['upload_id']
+            results['upload_status'] = queued['status']
+            return True
+    elif not link:
+        return False
+
+    results['google_drive_link'] = link
+    if upload['upload_id']:
+        results['upload_id'] = upload['upload_id']
+        results['upload_status'] = 'done'
+    return True
+
+def enqueue_drive_upload(results, processed_image, file_name, session_data, cache_key=None):
+    """ส่งภาพเข้าคิวอัปโหลดและใส่ upload_id ลงในผลลัพธ์"""
+    folder_id = session_data.get('photo_folder_id', session_data.get('folder_id'))
+    if not folder_id:
+        print("ไม่พบโฟลเดอร์สำหรับอัปโหลด")
+        return None
+    upload_id = upload_queue.enqueue(processed_image, file_name, folder_id,
+                                     dict(session_data['credentials']), owner=session_data.get('user_email'))
+    if result_cache and cache_key:
+        result_cache.set_upload(cache_key, session_data.get('user_email'), upload_id=upload_id)
+    results['upload_id'] = upload_id
+    results['upload_status'] = 'pending'
+    results['uploaded_filename'] = file_name
+    print(f"📤 เพิ่มภาพเข้าคิวอัปโหลด: {file_name}")
+    return upload_id
+
+def run_process_job(job_id, image_bytes, temp_filename, session_data, mode='single'):
+    """
+    ประมวลผลภาพและอัปโหลดไปยัง Google Drive ใน background thread
+    (ใช้ session_data ที่คัดลอกไว้ตอนสร้างงาน เพราะไม่มี request context)
+    """
+    results, cache_key = process_with_cache(
+        image_bytes, progress=lambda stage, info=None: job_manager.update(job_id, stage, info), mode=mode)
+
+    if results.get('error'):
+        raise Exception(results['error'])
+
+    processed_image = store_processed_image(results)
+
+    # อัปโหลดไปยัง Google Drive เฉพาะเมื่อเจอทั้งเลขห้องและเลขมิเตอร์
+    if results['can_upload'] and reuse_cached_upload(results, cache_key, session_data.get('user_email')):
+        print("♻️ ภาพนี้เคยอัปโหลดแล้ว ใช้ลิงก์เดิม")
+    elif results['can_upload'] and 'credentials' in session_data and processed_image and upload_queue:
+        if enqueue_drive_upload(results, processed_image, temp_filename, session_data, cache_key):
+            job_manager.update(job_id, 'upload_queued', {'upload_id': results['upload_id']})
+    elif results['can_upload'] and 'credentials' in session_data and processed_image:
+        try:
+            old_token = session_data['credentials'].get('token', '')
+            google_client = client_pool.get(session_data.get('user_email'), session_data['credentials'])
+
+            # credentials ที่ถูกต่ออายุจะถูกนำไปอัปเดต session ตอน client ดึงสถานะงาน
+            updated_credentials = google_client.get_updated_credentials()
+            if updated_credentials and updated_credentials.get('token', '') != old_token:
+                job_manager.update(job_id, 'credentials_refreshed', session_updates={
+                    'credentials': dict(updated_credentials),
+                    'credentials_refreshed_at': time.time()
+                })
+
+            file_info = GoogleDriveHandler.upload_to_drive(
+                processed_image,
+                temp_filename,
+                session_data,
+                google_client
+            )
+
+            if file_info:
+                results['google_drive_link'] = file_info.get('webViewLink')
+                results['uploaded_filename'] = temp_filename
+                if result_cache and cache_key:
+                    result_cache.set_upload(cache_key, session_data.get('user_email'),
+                                            google_drive_link=results['google_drive_link'])
+                print(f"✅ อัปโหลดภาพสำเร็จ: {temp_filename}")
+                job_manager.update(job_id, 'uploaded', {'google_drive_link': results['google_drive_link']})
+
+        except Exception as e:
+            print(f"❌ ไม่สามารถอัปโหลดไฟล์ไปยัง Google Drive: {str(e)}")
+            if is_not_found_error(e):
+                resource_cache.report_not_found(session_data.get('user_email'), session_data.get('credentials'))
+            if is_auth_error(e) or "credentials" in str(e).lower() or "authorization" in str(e).lower():
+                results['auth_error'] = True
+                results['error_message'] = "การเข้าสู่ระบบหมดอายุ กรุณาเข้าสู่ระบบใหม่"
+    elif not results['can_upload']:
+        print("⚠️  ไม่อัปโหลดภาพเนื่องจากข้อมูลไม่ครบถ้วน (ต้องเจอทั้งเลขห้องและเลขมิเตอร์)")
+
+    return results
+
+def get_own_job(job_id):
+    """ดึงงานของผู้ใช้ปัจจุบัน พร้อมอัปเดต session ด้วย credentials ที่ถูกต่ออายุระหว่างทำงาน"""
+    job = job_manager.get(job_id)
+    if not job or job['owner'] != session.get('user_email'):
+        return None
+
+    session_updates = job_manager.pop_session_updates(job_id)
+    if session_updates:
+        session.update(session_updates)
+        session.permanent = True
+        print("✅ Session updated with credentials refreshed by background job")
+    return job
+
+@app.route('/jobs', methods=['POST'])
+@login_required
+def create_job():
+    """รับไฟล์แล้วคืน job id ทันที การประมวลผลและอัปโหลดทำใน background"""
+    if 'file' not in request.files:
+        return jsonify({'error': 'ไม่พบไฟล์ในการอัปโหลด'}), 400
+
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'ไม่ได้เลือกไฟล์'}), 400
+
+    file_ext = os.path.splitext(file.filename)[1]
+    temp_filename = str(uuid.uuid4()) + file_ext
+    image_bytes = file.read()
+
+    # คัดลอกข้อมูล session ที่ background thread ต้องใช้
+    session_data = {
+        key: (dict(session[key]) if key == 'credentials' else session[key])
+        for key in ('credentials', 'user_email', 'folder_id', 'photo_folder_id', 'sheet_id', 'data_sheet_id', 'data_sheet_title')
+        if key in session
+    }
+
+    try:
+        job_id = job_manager.create(owner=session.get('user_email'))
+    except queue.Full:
+        return jsonify({'error': 'ระบบกำลังประมวลผลภาพจำนวนมาก กรุณาลองใหม่อีกครั้ง', 'busy': True}), 503
+    job_manager.submit(job_id, run_process_job, job_id, image_bytes, temp_filename, session_data, get_process_mode())
+    return jsonify({'job_id': job_id, 'status_url': f'/jobs/{job_id}',
+                    'events_url': f'/jobs/{job_id}/events'}), 202
+
+@app.route('/jobs/<job_id>')
+@login_required
+def get_job(job_id):
+    """สถานะและผลลัพธ์ของงาน (สำหรับ polling)"""
+    job = get_own_job(job_id)
+    if not job:
+        return jsonify({'error': 'ไม่พบงาน'}), 404
+    return jsonify(job_manager.public_view(job))
+
+@app.route('/jobs/<job_id>/events')
+@login_required
+def job_events(job_id):
+    """ส่งความคืบหน้าของงานแบบ server-sent events จนกว่างานจะเสร็จ"""
+    job = get_own_job(job_id)
+    if not job:
+        return jsonify({'error': 'ไม่พบงาน'}), 404
+    if not sse_slots.acquire(blocking=False):
+        # stream เต็มแล้ว - ไม่ให้ SSE ใช้ thread ของ waitress จนหมด (client จะเปลี่ยนไปใช้ polling)
+        return jsonify({'error': 'มีการติดตามงานพร้อมกันมากเกินไป กรุณาใช้ polling', 'poll': True}), 503
+
+    def generate():
+        position = 0
+        while True:
+            waited = job_manager.wait_for_events(job_id, position, timeout=15)
+            if waited is None:
+                break
+            events, position, finished = waited
+            if not events and not finished:
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                yield f"event: {event['stage']}\ndata: {json.dumps(event['info'])}\n\n"
+            if finished:
+                # ส่งผลลัพธ์สุดท้ายแล้วปิด stream
+                finished_job = job_manager.get(job_id)
+                if finished_job:
+                    yield f"event: result\ndata: {json.dumps(job_manager.public_view(finished_job))}\n\n"
+                break
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.call_on_close(sse_slots.release)
+    return response
+
+@app.route('/uploads/<upload_id>/status')
+@login_required
+def upload_status(upload_id):
+    """สถานะของงานในคิวอัปโหลด (pending / uploading / done / failed) และลิงก์เมื่อเสร็จ"""
+    if not upload_queue:
+        return jsonify({'error': 'ไม่ได้เปิดใช้คิวอัปโหลด'}), 404
+    upload = upload_queue.get(upload_id)
+    if not upload or upload['owner'] != session.get('user_email'):
+        return jsonify({'error': 'ไม่พบงานอัปโหลด'}), 404
+
+    # credentials ที่ worker ต่ออายุให้ นำมาอัปเดต session
+    refreshed = upload_queue.pop_refreshed_credentials(upload['owner'])
+    if refreshed:
+        session['credentials'] = refreshed
+        session['credentials_refreshed_at'] = time.time()
+        session.permanent = True
+
+    upload.pop('owner')
+    return jsonify(upload)
+
+def build_sheet_row(data):
+    """
+    แปลงข้อมูลการอ่านมิเตอร์จาก frontend เป็นแถวของ Sheets
+
+    Returns:
+        tuple: (sheet_data, upload_id, error) - upload_id คืองานในคิวอัปโหลดที่แถวนี้ยังรอลิงก์
+    """
+    # *** ตรวจสอบว่ามีข้อมูลครบถ้วน (ต้องมีทั้งเลขห้องและเลขมิเตอร์) ***
+    if not data or not data.get('room_number') or not data.get('meter_number'):
+        return None, None, 'ต้องมีทั้งเลขห้องและเลขมิเตอร์จึงจะสามารถบันทึกได้'
+
+    # ดึงข้อมูลที่แก้ไขแล้วและสถานะการแก้ไข
+    room_number = data.get('room_number', '')
+    room_edited = data.get('room_edited', False)
+    meter_number = data.get('meter_number', '')
+    meter_edited = data.get('meter_edited', False)
+    decimal_number = data.get('decimal_number', '')
+    decimal_edited = data.get('decimal_edited', False)
+    full_meter = data.get('full_meter', '')
+    google_drive_link = data.get('google_drive_link') or 'ไม่มีลิงก์'
+    upload_id = data.get('upload_id')
+    
+    # ภาพยังอยู่ในคิวอัปโหลด - ใช้ลิงก์ถ้าเสร็จแล้ว มิฉะนั้นใส่ข้อความรอและให้ worker เติมลิงก์ภายหลัง
+    if upload_id and upload_queue and not data.get('google_drive_link'):
+        upload = upload_queue.get(upload_id)
+        if upload and upload['owner'] == session.get('user_email'):
+            if upload['google_drive_link']:
+                google_drive_link = upload['google_drive_link']
+                upload_id = None
+            elif upload['status'] != 'failed':
+                google_drive_link = UploadQueue.PENDING_LINK_TEXT
+            else:
+                upload_id = None
+        else:
+            upload_id = None
+    else:
+        upload_id = None
+    
+    # ตรวจสอบอีกครั้งว่าข้อมูลหลักไม่ว่าง
+    if not room_number.strip() or not meter_number.strip():
+        return None, None, 'เลขห้องและเลขมิเตอร์ต้องไม่ว่าง'
+
+    # กำหนดสถานะการแก้ไขเป็นข้อความ
+    room_edited_status = "แก้ไขแล้ว" if room_edited else "ไม่ได้แก้ไข"
+    meter_edited_status = "แก้ไขแล้ว" if meter_edited else "ไม่ได้แก้ไข"
+    decimal_edited_status = "แก้ไขแล้ว" if decimal_edited else "ไม่ได้แก้ไข"
+
+    # จัดเตรียมข้อมูลเพื่อบันทึกลงใน Sheets (ข้อมูลที่บันทึกแบบออฟไลน์ส่งเวลาที่อ่านมาด้วย)
+    current_time = data.get('recorded_at') or time.strftime("%Y-%m-%d %H:%M:%S")
+    sheet_data = [
+        current_time,
+        room_number,
+        room_edited_status,
+        meter_number,
+        meter_edited_status,
+        decimal_number,
+        decimal_edited_status,
+        full_meter,
+        google_drive_link
+    ]
+    return sheet_data, upload_id, None
+
+def buffer_sheet_rows(rows, upload_ids, reading_ids=None):
+    """
+    เพิ่มแถวเข้าบัฟเฟอร์ของผู้ใช้ (ใช้ credentials ล่าสุดใน session) และคืนจำนวนแถวที่รออยู่
+    (reading_ids จาก client ใช้กันการเขียนแถวซ้ำเมื่อ client ส่งข้อมูลเดิมอีกครั้ง)
+    """
+    if 'sheet_id' not in session:
+        raise Exception("ไม่พบ Spreadsheet สำหรับบันทึกข้อมูล กรุณาล็อกอินใหม่")
+    refreshed = sheets_writer.pop_refreshed_credentials(session.get('user_email'))
+    if refreshed:
+        session['credentials'] = refreshed
+        session['credentials_refreshed_at'] = time.time()
+        session.permanent = True
+    target = {key: session.get(key) for key in ('sheet_id', 'data_sheet_id', 'data_sheet_title')}
+    return sheets_writer.add(session.get('user_email'), rows, session['credentials'], target, upload_ids, reading_ids)
+
+def sheets_error_response(e):
+    print(f"Error in save_to_sheets: {e}")
+    if is_not_found_error(e):
+        # Spreadsheet ถูกลบหรือย้าย - ค้นหา (หรือสร้าง) ใหม่ใน background
+        resource_cache.report_not_found(session.get('user_email'), session.get('credentials'))
+    # ตรวจสอบว่าเป็น auth error หรือไม่
+    if is_auth_error(e) or "credentials" in str(e).lower() or "authorization" in str(e).lower():
+        return jsonify({'error': 'การเข้าสู่ระบบหมดอายุ กรุณาเข้าสู่ระบบใหม่', 'auth_error': True})
+    return jsonify({'error': f'เกิดข้อผิดพลาดในการบันทึกข้อมูล: {str(e)}'})
+
 @app.route('/save-to-sheets', methods=['POST'])
 @login_required
 def save_to_sheets():
     try:
         # รับข้อมูลจาก frontend
         data = request.json
+        if isinstance(data, list):
+            # โหมดแผงมิเตอร์: หลายคู่จากภาพเดียว เขียนทุกแถวในครั้งเดียว
+            if not data:
+                return jsonify({'error': 'ไม่พบรายการข้อมูลที่จะบันทึก'}), 400
+            return save_readings(data)
 
-        # *** ตรวจสอบว่ามีข้อมูลครบถ้วน (ต้องมีทั้งเลขห้องและเลขมิเตอร์) ***
-        if not data or not data.get('room_number') or not data.get('meter_number'):
-            return jsonify({'error': 'ต้องมีทั้งเลขห้องและเลขมิเตอร์จึงจะสามารถบันทึกได้'})
-
-        # ดึงข้อมูลที่แก้ไขแล้วและสถานะการแก้ไข
-        room_number = data.get('room_number', '')
-        room_edited = data.get('room_edited', False)
-        meter_number = data.get('meter_number', '')
-        meter_edited = data.get('meter_edited', False)
-        decimal_number = data.get('decimal_number', '')
-        decimal_edited = data.get('decimal_edited', False)
-        full_meter = data.get('full_meter', '')
-        google_drive_link = data.get('google_drive_link', 'ไม่มีลิงก์')
-        
-        # ตรวจสอบอีกครั้งว่าข้อมูลหลักไม่ว่าง
-        if not room_number.strip() or not meter_number.strip():
-            return jsonify({'error': 'เลขห้องและเลขมิเตอร์ต้องไม่ว่าง'})
-
-        # กำหนดสถานะการแก้ไขเป็นข้อความ
-        room_edited_status = "แก้ไขแล้ว" if room_edited else "ไม่ได้แก้ไข"
-        meter_edited_status = "แก้ไขแล้ว" if meter_edited else "ไม่ได้แก้ไข"
-        decimal_edited_status = "แก้ไขแล้ว" if decimal_edited else "ไม่ได้แก้ไข"
-
-        # จัดเตรียมข้อมูลเพื่อบันทึกลงใน Sheets
-        current_time = time.strftime("%Y-%m-%d %H:%M:%S")
-        sheet_data = [
-            current_time,
-            room_number,
-            room_edited_status,
-            meter_number,
-            meter_edited_status,
-            decimal_number,
-            decimal_edited_status,
-            full_meter,
-            google_drive_link
-        ]
+        sheet_data, upload_id, error = build_sheet_row(data)
+        if error:
+            return jsonify({'error': error})
+
+        # บัฟเฟอร์เปิดอยู่: แถวจะถูกเขียนรวมกับแถวอื่นเมื่อครบจำนวนหรือครบเวลา
+        # (ยังไม่อยู่ใน Sheets จึงแจ้งว่ารับข้อมูลแล้ว ไม่ใช่บันทึกแล้ว)
+        if sheets_writer:
+            pending = buffer_sheet_rows([sheet_data], [upload_id], [data.get('reading_id')])
+            print(f"🧾 เพิ่มข้อมูลเข้าบัฟเฟอร์: ห้อง {sheet_data[1]}, มิเตอร์ {sheet_data[7]} (รอ {pending} แถว)")
+            return jsonify({
+                'success': True,
+                'message': QUEUED_MESSAGE,
+                'queued': True,
+                'pending_rows': pending
+            })
 
         # สร้าง GoogleAPIClient พร้อมอัปเดต session และบันทึกข้อมูล
         google_client = create_google_client_with_session_update()
+        if upload_id and session.get('data_sheet_id') is not None and not session.get('data_sheet_title'):
+            # session เก่าที่ยังไม่มีชื่อชีต: ต้องรู้ตำแหน่งแถวเพื่อเติมลิงก์ภายหลัง จึงค้นหาชื่อชีตครั้งเดียว
+            session['data_sheet_id'], session['data_sheet_title'] = google_client.find_data_sheet(session['sheet_id'])
         result = GoogleDriveHandler.save_to_sheets(sheet_data, session, google_client)
+        resource_cache.update(session.get('user_email'), data_sheet_id=session.get('data_sheet_id'),
+                              data_sheet_title=session.get('data_sheet_title'))
+
+        if result and upload_id and result.get('row_number'):
+            # ถ้าอัปโหลดเสร็จระหว่างบันทึก ให้เติมลิงก์ทันที
+            link = upload_queue.attach_sheet_row(upload_id, session['sheet_id'],
+                                                 session.get('data_sheet_id'), result['row_number'])
+            if link:
+                google_client.update_sheet_cell(session['sheet_id'], session.get('data_sheet_id'),
+                                                result['row_number'], UploadQueue.LINK_COLUMN_INDEX, link)
 
         if result:
-            print(f"✅ บันทึกข้อมูลสำเร็จ: ห้อง {room_number}, มิเตอร์ {full_meter}")
+            print(f"✅ บันทึกข้อมูลสำเร็จ: ห้อง {sheet_data[1]}, มิเตอร์ {sheet_data[7]}")
             return jsonify({
                 'success': True,
                 'message': 'บันทึกข้อมูลเรียบร้อยแล้ว'
@@ -387,11 +870,116 @@ def save_to_sheets():
             return jsonify({'error': 'เกิดข้อผิดพลาดในการบันทึกข้อมูล'})
 
     except Exception as e:
-        print(f"Error in save_to_sheets: {e}")
-        # ตรวจสอบว่าเป็น auth error หรือไม่
-        if "credentials" in str(e).lower() or "authorization" in str(e).lower():
-            return jsonify({'error': 'การเข้าสู่ระบบหมดอายุ กรุณาเข้าสู่ระบบใหม่', 'auth_error': True})
-        return jsonify({'error': f'เกิดข้อผิดพลาดในการบันทึกข้อมูล: {str(e)}'})
+        return sheets_error_response(e)
+
+@app.route('/save-to-sheets/bulk', methods=['POST'])
+@login_required
+def save_to_sheets_bulk():
+    """
+    บันทึกหลายรายการในครั้งเดียว (เช่น ข้อมูลที่ client เก็บไว้ตอนออฟไลน์)
+    รับ {'readings': [...]} โดยแต่ละรายการมีรูปแบบเดียวกับ /save-to-sheets (และ recorded_at ถ้ามี)
+    """
+    data = request.json or {}
+    readings = data.get('readings')
+    if not isinstance(readings, list) or not readings:
+        return jsonify({'error': 'ไม่พบรายการข้อมูลที่จะบันทึก'}), 400
+    return save_readings(readings)
+
+def save_readings(readings):
+    """
+    บันทึกหลายรายการลง Sheets ในการเขียนครั้งเดียว (ใช้กับ /save-to-sheets/bulk และ list ที่ส่งมาที่ /save-to-sheets)
+
+    Args:
+        readings (list): รายการข้อมูลรูปแบบเดียวกับ /save-to-sheets
+
+    Returns:
+        Response: ผลการบันทึก (saved, rejected)
+    """
+    try:
+        rows, upload_ids, reading_ids, rejected = [], [], [], []
+        for index, reading in enumerate(readings):
+            sheet_data, upload_id, error = build_sheet_row(reading)
+            if error:
+                rejected.append({'index': index, 'error': error})
+                continue
+            rows.append(sheet_data)
+            upload_ids.append(upload_id)
+            reading_ids.append(reading.get('reading_id'))
+
+        if not rows:
+            return jsonify({'error': 'ไม่มีรายการที่บันทึกได้', 'rejected': rejected})
+
+        if sheets_writer:
+            buffer_sheet_rows(rows, upload_ids, reading_ids)
+            result = sheets_writer.flush(session.get('user_email'))
+            if result['error']:
+                # แถวยังอยู่ในบัฟเฟอร์ (เก็บใน SQLite) และจะถูกลองเขียนใหม่อัตโนมัติ
+                # client ที่ส่งซ้ำด้วย reading_id เดิมจะถูกข้าม จึงไม่เกิดแถวซ้ำ
+                if result.get('auth_error'):
+                    return jsonify({'error': 'การเข้าสู่ระบบหมดอายุ กรุณาเข้าสู่ระบบใหม่', 'auth_error': True,
+                                    'pending_rows': result['pending']})
+                print(f"⏳ บันทึกแบบกลุ่มยังไม่สำเร็จ จะลองใหม่อัตโนมัติ: {result['error']}")
+                return jsonify({
+                    'success': True,
+                    'message': QUEUED_MESSAGE,
+                    'queued': True,
+                    'pending_rows': result['pending'],
+                    'saved': 0,
+                    'rejected': rejected
+                })
+            saved = len(rows)
+        else:
+            google_client = create_google_client_with_session_update()
+            result = google_client.append_rows(session['sheet_id'], rows, session)
+            if upload_queue and result.get('row_numbers'):
+                for upload_id, row_number in zip(upload_ids, result['row_numbers']):
+                    if not upload_id:
+                        continue
+                    link = upload_queue.attach_sheet_row(upload_id, session['sheet_id'],
+                                                         session.get('data_sheet_id'), row_number)
+                    if link:
+                        google_client.update_sheet_cell(session['sheet_id'], session.get('data_sheet_id'),
+                                                        row_number, UploadQueue.LINK_COLUMN_INDEX, link)
+            saved = len(rows)
+
+        print(f"✅ บันทึกข้อมูลแบบกลุ่มสำเร็จ {saved} รายการ")
+        return jsonify({
+            'success': True,
+            'message': f'บันทึกข้อมูลเรียบร้อยแล้ว {saved} รายการ',
+            'saved': saved,
+            'rejected': rejected
+        })
+
+    except Exception as e:
+        return sheets_error_response(e)
+
+@app.route('/save-to-sheets/flush', methods=['POST'])
+@login_required
+def flush_sheets_buffer():
+    """เขียนแถวที่รออยู่ในบัฟเฟอร์ของผู้ใช้ทันที (เช่น ก่อนปิดหน้าเว็บ)"""
+    if not sheets_writer:
+        return jsonify({'success': True, 'written': 0, 'pending_rows': 0})
+    result = sheets_writer.flush(session.get('user_email'))
+    if result['error']:
+        return jsonify({'error': f"เกิดข้อผิดพลาดในการบันทึกข้อมูล: {result['error']}",
+                        'auth_error': result.get('auth_error', False), 'pending_rows': result['pending']})
+    return jsonify({'success': True, 'written': result['written'], 'pending_rows': result['pending']})
+
+@app.route('/api/sheets-status')
+@login_required
+def sheets_status():
+    """สถานะบัฟเฟอร์ของผู้ใช้และ metrics การเขียน Sheets (เวลาต่อ flush, แถวต่อ flush, โควตา)"""
+    if not sheets_writer:
+        return jsonify({'enabled': False, 'google_clients': client_pool.stats(),
+                        'credentials': credential_manager.stats(), 'resources': resource_cache.stats(),
+                        'http': google_transport.stats()})
+    return jsonify({'enabled': True,
+                    'user': sheets_writer.pending(session.get('user_email')),
+                    'metrics': sheets_writer.get_metrics(),
+                    'google_clients': client_pool.stats(),
+                    'credentials': credential_manager.stats(),
+                    'resources': resource_cache.stats(),
+                    'http': google_transport.stats()})
 
 if __name__ == '__main__':
     # ใช้พอร์ตจากสภาพแวดล้อมถ้ามี มิฉะนั้นใช้พอร์ต 5000
@@ -0,0 +1,164 @@
+# batch_scheduler.py - รวม request ที่เข้ามาใกล้กันเป็น batch เดียวก่อนส่งให้ detector
+import time
+import queue
+import threading
+from collections import deque, Counter
+from concurrent.futures import Future
+from common import percentile
+
+class MicroBatchScheduler:
+    """
+    ตัวจัดคิวระหว่าง app กับ detector (InProcessDetector หรือ DetectorPool)
+    รวมภาพที่เข้ามาภายในช่วงเวลา window_ms (หรือจนครบ max_batch) แล้วเรียก
+    iter_process_images ครั้งเดียว เพื่อให้ YOLO รันเป็น batch แทนการรันทีละภาพ
+    แต่ละ request ได้ผลลัพธ์ทันทีที่ภาพของตัวเองเสร็จ (ไม่ต้องรอ OCR ของภาพอื่นใน batch)
+    มี interface process_image / process_images เหมือน detector เดิม
+    """
+
+    def __init__(self, detector, window_ms=20, max_batch=8, concurrency=1, max_queue=64):
+        """
+        Args:
+            detector: InProcessDetector หรือ DetectorPool
+            window_ms (float): เวลารอรวม request หลังจาก request แรกของ batch (มิลลิวินาที)
+            max_batch (int): จำนวนภาพสูงสุดต่อ batch
+            concurrency (int): จำนวน batch ที่ส่งให้ detector พร้อมกัน (เช่น จำนวน worker ของ pool)
+            max_queue (int): จำนวน request สูงสุดที่รอในคิว
+        """
+        self.detector = detector
+        self.ocr_stats = detector.ocr_stats
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.concurrency = concurrency
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._slots = threading.Semaphore(concurrency)
+        self._closed = False
+
+        # metrics
+        self._metrics_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._total_images = 0
+        self._latencies = deque(maxlen=1000)   # เวลาประมวลผลของแต่ละ batch
+        self._waits = deque(maxlen=1000)       # เวลาที่ request รอในคิวก่อนเริ่ม batch
+
+        self._collector = threading.Thread(target=self._collect_batches, daemon=True)
+        self._collector.start()
+        print(f"🧺 Micro-batching enabled (window {window_ms} ms, max batch {max_batch})")
+
+    def process_image(self, image_path, output_folder=None, progress=None, encode_image=False, timeout=None,
+                      mode='single'):
+        """
+        ส่งภาพเข้าคิวและรอผลลัพธ์ (รูปแบบเดียวกับ ImageDetector.process_image)
+
+        Raises:
+            queue.Full: ถ้าคิวเต็ม
+        """
+        if self._closed:
+            raise RuntimeError("Batch scheduler is shut down")
+        future = Future()
+        self._queue.put((image_path, (output_folder, encode_image, mode), progress, future, time.time()), timeout=30)
+        return future.result(timeout)
+
+    def process_images(self, images, output_folder=None, batch_size=8, encode_image=False, timeout=None,
+                       mode='single'):
+        """งานที่เป็นหลายภาพอยู่แล้วส่งตรงไปยัง detector"""
+        return self.detector.process_images(images, output_folder, batch_size, encode_image, timeout=timeout,
+                                            mode=mode)
+
+    def _collect_batches(self):
+        """รวม request เป็น batch: รอ request แรก แล้วรับเพิ่มจนหมดเวลา window หรือครบ max_batch"""
+        while not self._closed:
+            # รอจนมี detector ว่าง - ระหว่างนี้ request ใหม่จะสะสมในคิวและรวมเป็น batch ถัดไป
+            self._slots.acquire()
+            try:
+                first = self._queue.get(timeout=1)
+            except queue.Empty:
+                self._slots.release()
+                continue
+
+            batch = [first]
+            deadline = time.time() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.time()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            threading.Thread(target=self._run_batch, args=(batch,), daemon=True).start()
+
+    def _run_batch(self, batch):
+        try:
+            start_time = time.time()
+            for _, _, progress, _, _ in batch:
+                self._notify(progress, 'batched', {'batch_size': len(batch)})
+
+            # แยกตาม (output_folder, encode_image, mode) (ปกติมีกลุ่มเดียว)
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+
+            for (output_folder, encode_image, mode), items in groups.items():
+                try:
+                    results = self.detector.iter_process_images(
+                        [item[0] for item in items], output_folder, len(items), encode_image, mode=mode)
+                    for (_, _, progress, future, _), result in zip(items, results):
+                        self._notify(progress, 'ocr_done', None)
+                        future.set_result(result)
+                    for _, _, _, future, _ in items:
+                        if not future.done():
+                            future.set_exception(RuntimeError("Detector returned fewer results than images"))
+                except Exception as e:
+                    for _, _, _, future, _ in items:
+                        if not future.done():
+                            future.set_exception(e)
+
+            with self._metrics_lock:
+                self._batch_sizes[len(batch)] += 1
+                self._total_images += len(batch)
+                self._latencies.append(time.time() - start_time)
+                self._waits.extend(start_time - item[4] for item in batch)
+        finally:
+            self._slots.release()
+
+    def _notify(self, progress, stage, info):
+        if progress:
+            try:
+                progress(stage, info)
+            except Exception as e:
+                print(f"Error in progress callback: {e}")
+
+    def get_metrics(self):
+        """สถิติของ scheduler: ขนาด batch, เวลารอในคิว และเวลาประมวลผลต่อ batch"""
+        with self._metrics_lock:
+            batches = sum(self._batch_sizes.values())
+            latencies = list(self._latencies)
+            waits = list(self._waits)
+            return {
+                'window_ms': self.window * 1000,
+                'max_batch': self.max_batch,
+                'queued': self._queue.qsize(),
+                'batches': batches,
+                'images': self._total_images,
+                'avg_batch_size': self._total_images / batches if batches else 0,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+                'wait_ms': {
+                    'avg': sum(waits) / len(waits) * 1000 if waits else None,
+                    'p99': percentile(waits, 99) * 1000 if waits else None
+                },
+                'batch_latency_ms': {
+                    'avg': sum(latencies) / len(latencies) * 1000 if latencies else None,
+                    'p50': percentile(latencies, 50) * 1000 if latencies else None,
+                    'p99': percentile(latencies, 99) * 1000 if latencies else None
+                }
+            }
+
+    def get_ocr_stats(self):
+        return self.detector.get_ocr_stats()
+
+    def get_status(self):
+        return dict(self.detector.get_status(), batching=self.get_metrics())
+
+    def shutdown(self, timeout=10):
+        self._closed = True
+        self.detector.shutdown(timeout)
@@ -0,0 +1,38 @@
+# common.py - ฟังก์ชันที่ใช้ร่วมกันหลายโมดูล (connection SQLite ต่อ thread และ percentile ของสถิติ)
+import sqlite3
+
+def thread_local_connection(local, db_path):
+    """
+    connection SQLite ของ thread ปัจจุบัน (สร้างครั้งแรกที่เรียก แล้วใช้ซ้ำใน thread เดิม)
+    ใช้ WAL เพื่อให้อ่านได้ระหว่างที่ thread อื่นเขียน
+
+    Args:
+        local (threading.local): ที่เก็บ connection ของแต่ละ thread (ของ object เจ้าของฐานข้อมูล)
+        db_path (str): ไฟล์ SQLite
+
+    Returns:
+        sqlite3.Connection: connection ที่ใช้ sqlite3.Row เป็น row_factory
+    """
+    conn = getattr(local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        local.conn = conn
+    return conn
+
+def percentile(values, p):
+    """
+    ค่า percentile แบบ nearest-rank
+
+    Args:
+        values (iterable): ค่าที่วัดได้
+        p (float): 0-100
+
+    Returns:
+        float: ค่าที่ percentile p หรือ None ถ้าไม่มีค่า
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
@@ -0,0 +1,222 @@
+# credential_manager.py - แคช OAuth credentials ของแต่ละผู้ใช้ และต่ออายุ token ล่วงหน้าใน background
+import os
+import time
+import datetime
+import threading
+from collections import deque
+from google.oauth2.credentials import Credentials
+from google.auth.exceptions import RefreshError
+from google_transport import auth_request
+
+class CredentialManager:
+    """
+    เก็บ Credentials object ของแต่ละผู้ใช้ (แยกวิเคราะห์ครั้งเดียว) พร้อมเวลาหมดอายุ
+    - request ปกติอ่าน token จากแคชโดยไม่เรียกเครือข่าย
+    - thread เดียวต่ออายุ token ก่อนหมดอายุ refresh_margin วินาที (ผู้ใช้ที่ยังใช้งานอยู่เท่านั้น)
+    - การต่ออายุของผู้ใช้คนเดียวกันทำทีละครั้ง (lock ต่อผู้ใช้) - thread ที่รออยู่จะได้ token ใหม่โดยไม่ต่อซ้ำ
+    - Credentials object เดียวกันถูกใช้โดย services ใน client pool จึงได้ token ใหม่ทันที
+    """
+
+    def __init__(self, refresh_margin=300, idle_ttl=3600, check_interval=30):
+        """
+        Args:
+            refresh_margin (int): ต่ออายุเมื่อ token เหลืออายุน้อยกว่านี้ (วินาที)
+            idle_ttl (int): ลบผู้ใช้ที่ไม่ได้ใช้งานนานเกินนี้ออกจากแคช (วินาที)
+            check_interval (int): ช่วงเวลาตรวจ token ที่ใกล้หมดอายุ (วินาที)
+        """
+        self.refresh_margin = refresh_margin
+        self.idle_ttl = idle_ttl
+        self.check_interval = check_interval
+
+        self._entries = {}  # owner -> dict(credentials, lock, last_used, previous_tokens, checked, revoked)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self._refreshes = 0
+        self._proactive_refreshes = 0
+        self._deduplicated = 0
+        self._failures = 0
+
+    def register(self, owner, oauth_credentials, expiry=None):
+        """
+        เก็บ credentials ใหม่หลังผู้ใช้เข้าสู่ระบบ (แทนที่ของเดิม)
+
+        Args:
+            owner (str): email ของผู้ใช้
+            oauth_credentials (dict): OAuth credentials ที่เก็บใน session
+            expiry (datetime, optional): เวลาหมดอายุของ token (UTC)
+        """
+        credentials = Credentials(**oauth_credentials)
+        credentials.expiry = expiry
+        with self._lock:
+            self._entries[owner] = self._new_entry(credentials, checked=expiry is not None)
+        self._ensure_thread()
+        return credentials
+
+    def get(self, owner, oauth_credentials=None):
+        """
+        Credentials ของผู้ใช้จากแคช (ไม่เรียกเครือข่าย)
+        ถ้า token ใน oauth_credentials ใหม่กว่าในแคช (ไม่ใช่ token เก่าที่ต่ออายุไปแล้ว) จะใช้ token นั้นแทน
+
+        Returns:
+            Credentials: credentials ของผู้ใช้ หรือ None ถ้าไม่มี / refresh token ใช้ไม่ได้แล้ว
+        """
+        with self._lock:
+            entry = self._entries.get(owner)
+            if entry is None:
+                if not oauth_credentials:
+                    return None
+                entry = self._entries[owner] = self._new_entry(Credentials(**oauth_credentials))
+            entry['last_used'] = time.time()
+
+            if oauth_credentials:
+                credentials = entry['credentials']
+                token = oauth_credentials.get('token')
+                refresh_token = oauth_credentials.get('refresh_token')
+                if refresh_token and refresh_token != credentials.refresh_token:
+                    # ผู้ใช้เข้าสู่ระบบใหม่ในอีก session
+                    entry.update(self._new_entry(Credentials(**oauth_credentials)), lock=entry['lock'])
+                elif token and token != credentials.token and token not in entry['previous_tokens']:
+                    entry['previous_tokens'].append(credentials.token)
+                    credentials.token = token
+                    credentials.expiry = None
+
+            if entry['revoked']:
+                return None
+            credentials = entry['credentials']
+        self._ensure_thread()
+        return credentials
+
+    def refresh(self, owner, stale_token=None):
+        """
+        ต่ออายุ token ของผู้ใช้ (single-flight)
+
+        Args:
+            owner (str): email ของผู้ใช้
+            stale_token (str, optional): token ที่ผู้เรียกเห็นว่าใช้ไม่ได้ - ถ้า token ปัจจุบันไม่ใช่ตัวนี้
+                แสดงว่ามี thread อื่นต่ออายุไปแล้ว จะคืน credentials ปัจจุบันโดยไม่ต่อซ้ำ
+
+        Returns:
+            Credentials: credentials ที่ต่ออายุแล้ว หรือ None ถ้าไม่มีผู้ใช้นี้ในแคช
+
+        Raises:
+            RefreshError: ถ้า refresh token ใช้ไม่ได้ (ผู้ใช้ต้องเข้าสู่ระบบใหม่)
+        """
+        with self._lock:
+            entry = self._entries.get(owner)
+        if entry is None:
+            return None
+
+        with entry['lock']:
+            credentials = entry['credentials']
+            if stale_token is not None and credentials.token != stale_token:
+                with self._lock:
+                    self._deduplicated += 1
+                return credentials
+            try:
+                entry['previous_tokens'].append(credentials.token)
+                credentials.refresh(auth_request())
+            except RefreshError:
+                with self._lock:
+                    entry['revoked'] = True
+                    self._failures += 1
+                raise
+            except Exception:
+                with self._lock:
+                    self._failures += 1
+                raise
+            with self._lock:
+                entry['checked'] = True
+                self._refreshes += 1
+            print(f"🔑 Refreshed token for {owner}")
+            return credentials
+
+    def to_dict(self, credentials):
+        """แปลง credentials เป็น dict สำหรับเก็บใน session"""
+        return {
+            'token': credentials.token,
+            'refresh_token': credentials.refresh_token,
+            'token_uri': credentials.token_uri,
+            'client_id': credentials.client_id,
+            'client_secret': credentials.client_secret,
+            'scopes': credentials.scopes
+        }
+
+    def discard(self, owner):
+        """ลบผู้ใช้ออกจากแคช (เช่น เมื่อออกจากระบบ)"""
+        with self._lock:
+            self._entries.pop(owner, None)
+
+    def expires_in(self, credentials):
+        """
+        Returns:
+            float: จำนวนวินาทีก่อน token หมดอายุ หรือ None ถ้าไม่ทราบ
+        """
+        if not credentials.expiry:
+            return None
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return (credentials.expiry - now).total_seconds()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._entries),
+                'refreshes': self._refreshes,
+                'proactive_refreshes': self._proactive_refreshes,
+                'deduplicated_refreshes': self._deduplicated,
+                'failures': self._failures
+            }
+
+    def _new_entry(self, credentials, checked=False):
+        return {
+            'credentials': credentials,
+            'lock': threading.Lock(),
+            'last_used': time.time(),
+            'previous_tokens': deque(maxlen=8),
+            'checked': checked,   # ทราบเวลาหมดอายุแล้ว (ต่ออายุหรือได้ token มาในรอบนี้)
+            'revoked': False
+        }
+
+    def _ensure_thread(self):
+        # เริ่ม thread เมื่อใช้งานครั้งแรก (worker process ของ detector ที่ import โมดูลนี้จะไม่มี thread)
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='credential-refresh', daemon=True)
+                    self._thread.start()
+
+    def _due_for_refresh(self):
+        """ผู้ใช้ที่ token ใกล้หมดอายุ หรือยังไม่ทราบเวลาหมดอายุ (เช่น หลังรีสตาร์ท) และลบผู้ใช้ที่ไม่ได้ใช้งาน"""
+        now = time.time()
+        due = []
+        with self._lock:
+            for owner, entry in list(self._entries.items()):
+                if now - entry['last_used'] > self.idle_ttl:
+                    del self._entries[owner]
+                    continue
+                credentials = entry['credentials']
+                if entry['revoked'] or not credentials.refresh_token:
+                    continue
+                expires_in = self.expires_in(credentials)
+                if (expires_in is None and not entry['checked']) or \
+                        (expires_in is not None and expires_in < self.refresh_margin):
+                    due.append((owner, credentials.token))
+        return due
+
+    def _run(self):
+        while True:
+            time.sleep(self.check_interval)
+            for owner, token in self._due_for_refresh():
+                try:
+                    credentials = self.refresh(owner, stale_token=token)
+                    if credentials is not None and credentials.token != token:
+                        with self._lock:
+                            self._proactive_refreshes += 1
+                except Exception as e:
+                    print(f"❌ Background token refresh failed for {owner}: {e}")
+
+# ตัวจัดการเดียวใช้ร่วมกันทั้ง process
+credential_manager = CredentialManager(
+    refresh_margin=int(os.environ.get('TOKEN_REFRESH_MARGIN', 300)),
+    idle_ttl=int(os.environ.get('CREDENTIAL_IDLE_TTL', 3600))
+)
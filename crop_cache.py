@@ -0,0 +1,159 @@
+# crop_cache.py - แคชผล OCR ของ crop ตามรูปร่างตัวเลข (ภาพถ่ายซ้ำของป้ายเดิมไม่ต้องรัน OCR ใหม่)
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+def glyph_hashes(img, cell_size=(10, 14), min_height=0.25, min_area=0.002):
+    """
+    hash ของตัวอักษรแต่ละตัวใน crop: แปลงเป็นภาพขาวดำ (Otsu) แยกตัวอักษรด้วย connected components
+    แล้วตัดแต่ละตัวให้พอดีกับขอบของหมึก ก่อนย่อเป็นตาราง cell_size
+    (ตำแหน่ง ขนาด และขอบของกรอบ YOLO ที่ต่างกันระหว่างการถ่ายซ้ำจึงไม่มีผลต่อ hash)
+
+    Args:
+        img (numpy.ndarray): ภาพ BGR หรือ grayscale
+        cell_size (tuple): (กว้าง, สูง) ของตารางต่อตัวอักษร
+        min_height (float): ความสูงขั้นต่ำของตัวอักษรเทียบกับความสูงของ crop (ตัดจุด/เส้นรบกวน)
+        min_area (float): พื้นที่ขั้นต่ำของตัวอักษรเทียบกับพื้นที่ของ crop
+
+    Returns:
+        tuple: hash ของแต่ละตัวอักษรเรียงจากซ้ายไปขวา หรือ None ถ้าไม่พบตัวอักษร
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if np.count_nonzero(ink) > ink.size / 2:
+        ink = 255 - ink  # ให้หมึก (ส่วนที่น้อยกว่า) เป็นสีขาวเสมอ
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+
+    height, width = ink.shape
+    glyphs = []
+    for label in range(1, count):
+        x, y, w, h, area = stats[label]
+        # ข้ามส่วนที่แตะขอบ crop (กรอบป้าย/ผนัง) และจุดรบกวนขนาดเล็ก
+        if x == 0 or y == 0 or x + w >= width or y + h >= height:
+            continue
+        if h < min_height * height or area < min_area * height * width:
+            continue
+        glyphs.append((x, label))
+    if not glyphs:
+        return None
+
+    hashes = []
+    for x, label in sorted(glyphs):
+        x, y, w, h, _ = stats[label]
+        glyph = (labels[y:y + h, x:x + w] == label).astype(np.uint8) * 255
+        # ตัวอักษรแคบ (เช่น '1') วางกลางกรอบที่กว้างอย่างน้อย 0.7 เท่าของความสูง เพื่อไม่ให้ถูกยืดเต็มช่อง
+        box_width = max(w, int(h * 0.7))
+        boxed = np.zeros((h, box_width), dtype=np.uint8)
+        offset = (box_width - w) // 2
+        boxed[:, offset:offset + w] = glyph
+        small = cv2.resize(boxed, cell_size, interpolation=cv2.INTER_AREA)
+        hashes.append(int.from_bytes(np.packbits((small > 127).flatten()).tobytes(), 'big'))
+    return tuple(hashes)
+
+class PerceptualCropCache:
+    """
+    แคชผล OCR ของ crop แยกตาม class โดยใช้ hash ของตัวอักษรแต่ละตัว (ดู glyph_hashes) เป็น key
+    - crop สองภาพถือว่าเป็นป้ายเดียวกันเมื่อมีจำนวนตัวอักษรเท่ากัน และตัวอักษรที่ต่างกันมากที่สุด
+      ต่างกันไม่เกิน max_distance บิต (ป้ายคนละห้องต่างกันอย่างน้อยหนึ่งตัว จึงวัดที่ตัวที่ต่างมากที่สุด)
+    - ผลที่ระยะเกิน confirm_distance ต้องยืนยันด้วยการอ่านซ้ำก่อนใช้ (ดู ImageDetector.read_detections)
+    - LRU จำกัดจำนวนรายการ
+    """
+
+    def __init__(self, classes=('roomN',), max_distance=16, confirm_distance=10, max_entries=2048,
+                 cell_size=(10, 14)):
+        """
+        Args:
+            classes (iterable): class ที่ใช้แคช (ค่าที่ไม่เปลี่ยนระหว่างรอบการจด เช่น เลขห้อง)
+            max_distance (int): ระยะ (บิตต่อตัวอักษร) สูงสุดที่ถือว่าเป็นป้ายเดียวกัน
+            confirm_distance (int): ระยะสูงสุดที่ใช้ผลจากแคชได้ทันทีโดยไม่ต้องอ่านซ้ำ
+            max_entries (int): จำนวนรายการสูงสุดในแคช
+            cell_size (tuple): (กว้าง, สูง) ของตารางต่อตัวอักษร
+        """
+        self.classes = set(classes)
+        self.max_distance = max_distance
+        self.confirm_distance = confirm_distance
+        self.max_entries = max_entries
+        self.cell_size = cell_size
+
+        self._entries = OrderedDict()  # entry id -> dict(class_name, hashes, result, ocr_time)
+        self._index = {}               # (class_name, จำนวนตัวอักษร) -> set ของ entry id
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def enabled_for(self, class_name):
+        return class_name in self.classes
+
+    def key_for(self, img):
+        """
+        Returns:
+            tuple: hash ของตัวอักษรแต่ละตัวใน crop หรือ None ถ้าไม่พบตัวอักษร (ไม่แคช)
+        """
+        return glyph_hashes(img, self.cell_size)
+
+    @staticmethod
+    def distance(a, b):
+        """ระยะระหว่าง key สองตัว: จำนวนบิตที่ต่างกันของตัวอักษรที่ต่างกันมากที่สุด"""
+        return max(bin(x ^ y).count('1') for x, y in zip(a, b))
+
+    def lookup(self, class_name, key):
+        """
+        หาผล OCR ของ crop ที่ใกล้ที่สุด
+
+        Args:
+            class_name (str): class ของ crop
+            key (tuple): จาก key_for
+
+        Returns:
+            dict: {'result', 'ocr_time', 'distance', 'needs_confirm'} หรือ None ถ้าไม่พบ
+        """
+        if not key:
+            return None
+        with self._lock:
+            best_id, best_distance = None, None
+            for entry_id in self._index.get((class_name, len(key)), ()):
+                distance = self.distance(self._entries[entry_id]['hashes'], key)
+                if distance <= self.max_distance and (best_distance is None or distance < best_distance):
+                    best_id, best_distance = entry_id, distance
+
+            if best_id is None:
+                return None
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            return {'result': entry['result'], 'ocr_time': entry['ocr_time'], 'distance': best_distance,
+                    'needs_confirm': best_distance > self.confirm_distance}
+
+    def put(self, class_name, key, result, ocr_time):
+        """
+        เก็บผล OCR ของ crop
+
+        Args:
+            class_name (str): class ของ crop
+            key (tuple): จาก key_for (None = ไม่เก็บ)
+            result (tuple): (ตัวเลข, confidence, วิธี) จาก filter_and_select_best_result
+            ocr_time (float): เวลาที่ใช้ทำ OCR กับ crop นี้ (ใช้คำนวณเวลาที่ประหยัดได้)
+        """
+        if not key:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {'class_name': class_name, 'hashes': key,
+                                       'result': tuple(result), 'ocr_time': ocr_time}
+            self._index.setdefault((class_name, len(key)), set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        index_key = (entry['class_name'], len(entry['hashes']))
+        ids = self._index.get(index_key)
+        if ids:
+            ids.discard(entry_id)
+            if not ids:
+                del self._index[index_key]
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'classes': sorted(self.classes),
+                    'max_distance': self.max_distance, 'confirm_distance': self.confirm_distance}
@@ -6,9 +6,168 @@ import time
 import numpy as np
 from ultralytics import YOLO
 import easyocr
+from easyocr.utils import get_image_list
+from easyocr.recognition import get_text
+import io
 import math
+from PIL import Image
 from concurrent.futures import ThreadPoolExecutor
 import uuid
+import threading
+from ocr_stats import OCRStrategyStats
+from crop_cache import PerceptualCropCache
+from pairing import centers_array, distance_matrix, linear_sum_assignment
+from inference_backends import load_yolo_model, load_recognizer
+
+class OCRVariants:
+    """
+    ภาพสำหรับ OCR หลายรูปแบบของ crop เดียว โดยแต่ละภาพจะถูกสร้างเมื่อถูกขอใช้เท่านั้น
+    และเก็บผลไว้ใช้ซ้ำ (รวมถึงภาพกลางที่ใช้ร่วมกัน เช่น gray และภาพเบลอ)
+    """
+    
+    # ลำดับเดียวกับรายการเดิมของ preprocess_for_ocr
+    NAMES = [
+        'original_enhanced', 'gray', 'clahe', 'enlarged', 'adjusted', 'denoised',
+        'otsu', 'adaptive', 'binary', 'bg_removed',
+        'rotated_-3', 'rotated_-1', 'rotated_1', 'rotated_3'
+    ]
+    
+    def __init__(self, img, enhance_contrast, clahe):
+        """
+        Args:
+            img: crop ต้นฉบับ (BGR)
+            enhance_contrast: ฟังก์ชันเพิ่มความคมชัดของ detector
+            clahe: CLAHE object ที่ cache ไว้
+        """
+        self.img = img
+        self.enhance_contrast = enhance_contrast
+        self.clahe = clahe
+        self._cache = {}
+    
+    def __getitem__(self, name):
+        if name not in self._cache:
+            if name.startswith('rotated_'):
+                self._cache[name] = self._rotated(int(name[len('rotated_'):]))
+            elif name in self.NAMES or name == 'blurred':
+                self._cache[name] = getattr(self, f"_{name}")()
+            else:
+                raise KeyError(name)
+        return self._cache[name]
+    
+    def __iter__(self):
+        for name in self.NAMES:
+            yield name, self[name]
+    
+    def __len__(self):
+        return len(self.NAMES)
+    
+    @property
+    def computed(self):
+        """รายชื่อภาพที่ถูกสร้างแล้ว (ไม่รวมภาพกลาง)"""
+        return [name for name in self.NAMES if name in self._cache]
+    
+    # 1. ภาพต้นฉบับที่เพิ่มความคมชัด
+    def _original_enhanced(self):
+        return self.enhance_contrast(self.img)
+    
+    # 2. เปลี่ยนเป็นภาพเทา
+    def _gray(self):
+        return cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY)
+    
+    # 3. ปรับสมดุลแสงด้วย CLAHE (ใช้ cached object)
+    def _clahe(self):
+        return self.clahe.apply(self['gray'])
+    
+    # 4. ปรับขนาดภาพให้ใหญ่ขึ้น 2 เท่า
+    def _enlarged(self):
+        height, width = self['gray'].shape
+        return cv2.resize(self['gray'], (width*2, height*2), interpolation=cv2.INTER_CUBIC)
+    
+    # 5. ปรับความสว่าง/คอนทราสต์
+    def _adjusted(self):
+        return cv2.convertScaleAbs(self['gray'], alpha=1.2, beta=10)
+    
+    # 6. กำจัดสัญญาณรบกวน
+    def _denoised(self):
+        return cv2.fastNlMeansDenoising(self['gray'], None, 10, 7, 21)
+    
+    # 7. เทรชโฮลด์แบบ Otsu
+    def _otsu(self):
+        _, otsu = cv2.threshold(self['gray'], 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return otsu
+    
+    # 8. เทรชโฮลด์แบบ Adaptive
+    def _adaptive(self):
+        return cv2.adaptiveThreshold(
+            self['gray'], 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+            cv2.THRESH_BINARY, 11, 2
+        )
+    
+    # 9. เทรชโฮลด์แบบทั่วไป
+    def _binary(self):
+        _, binary = cv2.threshold(self['gray'], 127, 255, cv2.THRESH_BINARY)
+        return binary
+    
+    # ภาพกลาง: ภาพเทาที่เบลอแล้ว
+    def _blurred(self):
+        return cv2.GaussianBlur(self['gray'], (5, 5), 0)
+    
+    # 10. ลบพื้นหลังและปรับคอนทราสต์
+    def _bg_removed(self):
+        _, thresh = cv2.threshold(self['blurred'], 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        return thresh
+    
+    # 11. ลองหมุนภาพเล็กน้อยเพื่อแก้การเอียง
+    def _rotated(self, angle):
+        gray = self['gray']
+        h, w = gray.shape
+        center = (w // 2, h // 2)
+        rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+        return cv2.warpAffine(gray, rotation_matrix, (w, h), flags=cv2.INTER_CUBIC, 
+                              borderMode=cv2.BORDER_REPLICATE)
+
+
+class DecodedImage:
+    """
+    ภาพสองความละเอียด: ภาพย่อ (image) สำหรับ YOLO และวาดผลลัพธ์
+    และภาพความละเอียดเต็ม (full) ที่ decode เมื่อต้อง crop สำหรับ OCR เท่านั้น
+    """
+    
+    def __init__(self, image, scale=1.0, source=None, full=None):
+        """
+        Args:
+            image: ภาพที่ใช้ตรวจจับ
+            scale: อัตราส่วนพิกัดภาพเต็ม / ภาพย่อ
+            source: เส้นทางไฟล์หรือ bytes สำหรับ decode ภาพเต็ม
+            full: ภาพเต็ม (ถ้ามีอยู่แล้ว)
+        """
+        self.image = image
+        self.scale = scale
+        self._source = source
+        self._full = full if full is not None else (image if scale == 1.0 else None)
+    
+    @property
+    def full(self):
+        if self._full is None:
+            if isinstance(self._source, str):
+                self._full = cv2.imread(self._source)
+            else:
+                self._full = cv2.imdecode(np.frombuffer(self._source, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if self._full is None:
+                self._full = self.image  # decode ไม่ได้ - ใช้ภาพย่อแทน
+                self.scale = 1.0
+        return self._full
+    
+    @property
+    def full_shape(self):
+        """(สูง, กว้าง) ของภาพเต็ม (ไม่ต้อง decode ภาพเต็ม)"""
+        return (self.image.shape[0] * self.scale, self.image.shape[1] * self.scale)
+    
+    def release_full(self):
+        """คืนหน่วยความจำของภาพเต็ม (หลัง crop แล้ว)"""
+        if self.scale != 1.0:
+            self._full = None
+
 
 class ImageDetector:
     def __init__(self, models_config=None):
@@ -43,13 +202,33 @@ class ImageDetector:
             2: 'roomN'      # เลขห้อง
         }
         
+        # backend สำหรับ inference: 'torch' (เดิม), 'onnx' หรือ 'openvino' (ต้อง export ก่อนด้วย export_models.py)
+        self.BACKEND = models_config.get('backend', 'torch')
+        self.PRECISION = models_config.get('precision', 'fp32')
+        models_dir = models_config.get('exported_models_dir') or os.path.dirname(models_config['model_path']) or '.'
+        use_gpu = models_config.get('use_gpu', True) and self.BACKEND == 'torch'
+        
         # โหลดโมเดล YOLO เดียว
         print("กำลังโหลดโมเดล YOLO...")
-        self.unified_model = YOLO(models_config['model_path'])
+        if self.BACKEND == 'torch':
+            self.unified_model = YOLO(models_config['model_path'])
+        else:
+            self.unified_model = load_yolo_model(models_config['model_path'], self.BACKEND, self.PRECISION)
         
         # โหลด EasyOCR
+        # โหมด recognizer-only: ส่ง crop จาก YOLO เข้า recognizer โดยตรง และไม่โหลด
+        # text detector (CRAFT) จนกว่าจะต้อง fallback ไปใช้ readtext จริงๆ
+        self.OCR_RECOGNIZER_ONLY = models_config.get('ocr_recognizer_only', False)
+        self.OCR_FAST_PATH_VARIANTS = models_config.get('ocr_fast_path_variants', ['gray', 'clahe'])
+        self.OCR_FAST_PATH_FALLBACK = models_config.get('ocr_fast_path_fallback', True)
+        self._detector_lock = threading.Lock()
         print("กำลังโหลด EasyOCR...")
-        self.reader = easyocr.Reader(['en'], gpu=models_config.get('use_gpu', True), quantize=False)
+        self.reader = easyocr.Reader(['en'], gpu=use_gpu, quantize=False,
+                                     detector=not self.OCR_RECOGNIZER_ONLY)
+        if self.BACKEND != 'torch':
+            # ใช้ recognizer ที่ export แล้วแทนโมเดล PyTorch (interface เดิม)
+            self.reader.recognizer = load_recognizer(
+                models_dir, self.BACKEND, self.PRECISION, models_config.get('num_threads'))
         
         # สีสำหรับ bounding box
         self.colors = {
@@ -62,6 +241,70 @@ class ImageDetector:
         self.clahe_enhance = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
         self.clahe_ocr = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
         
+        # ตั้งค่า OCR แบบ cascade (รันภาพ/พารามิเตอร์ราคาถูกก่อน แล้วหยุดเมื่อผลลัพธ์มั่นใจพอ)
+        self.OCR_CASCADE_ENABLED = models_config.get('ocr_cascade', True)
+        self.OCR_EARLY_EXIT_CONFIDENCE = models_config.get('ocr_early_exit_confidence', 0.85)
+        self.OCR_EARLY_EXIT_CONSENSUS = models_config.get('ocr_early_exit_consensus', 2)
+        # แต่ละ stage: (ชื่อ, รายชื่อภาพ, รายชื่อ config) - None หมายถึงทั้งหมด
+        self.OCR_CASCADE_STAGES = models_config.get('ocr_cascade_stages', [
+            ('fast', ['gray', 'clahe', 'original_enhanced'], ['base', 'segment']),
+            ('extended', ['gray', 'clahe', 'original_enhanced', 'adjusted',
+                          'otsu', 'adaptive', 'binary', 'bg_removed'], ['base', 'segment', 'clear']),
+            ('full', None, None)
+        ])
+        
+        # โหมดการหาตำแหน่งข้อความของ OCR
+        #   'per_variant' - เรียก readtext (CRAFT + recognizer) กับทุกภาพ (แบบเดิม)
+        #   'shared'      - หาตำแหน่งข้อความครั้งเดียวต่อ crop แล้วใช้ซ้ำกับทุกภาพ
+        #   'full_crop'   - ไม่หาตำแหน่งข้อความ ใช้ทั้ง crop เป็นข้อความเดียว
+        self.OCR_DETECTION_MODE = models_config.get('ocr_detection_mode', 'per_variant')
+        # thread pool เดียวสำหรับโหมด per_variant (ไม่สร้างใหม่ทุก crop)
+        self.ocr_executor = ThreadPoolExecutor(max_workers=models_config.get('ocr_workers', 4))
+        self.OCR_BATCH_SIZE = models_config.get('ocr_batch_size', 16)
+        self.OCR_RECOGNIZER_HEIGHT = 64  # ความสูงภาพที่ recognizer ของ EasyOCR ใช้
+        self.OCR_RECOGNIZE_MIN_CONF = 0.1
+        
+        # สถิติการชนะของแต่ละวิธี OCR และการปิดวิธีที่ไม่เคยช่วย
+        self.ocr_stats = OCRStrategyStats(models_config.get('ocr_stats_path'),
+                                          models_config.get('ocr_stats_autosave_every', 20))
+        self.OCR_PRUNE_ENABLED = models_config.get('ocr_prune', False)
+        self.OCR_PRUNE_THRESHOLD = models_config.get('ocr_prune_threshold', 0.01)
+        self.OCR_PRUNE_MIN_RUNS = models_config.get('ocr_prune_min_runs', 200)
+        self.OCR_PRUNE_EXPLORE_RATE = models_config.get('ocr_prune_explore_rate', 0.05)
+        
+        # ระยะที่ใช้จับคู่เลขห้อง/มิเตอร์/ทศนิยม (พิกเซล) สำหรับภาพอ้างอิงที่มีเส้นทแยงมุม PAIR_REFERENCE_DIAGONAL
+        # (ภาพ 4000x3000) - ภาพขนาดอื่นจะถูกปรับตามสัดส่วน (ดู pairing_thresholds)
+        self.PAIR_MAX_DISTANCE = 1000
+        self.PAIR_DECIMAL_DISTANCE = 200
+        self.FALLBACK_DECIMAL_DISTANCE = 600
+        self.PAIR_REFERENCE_DIAGONAL = models_config.get('pair_reference_diagonal', 5000)
+        self.PAIR_ASSIGNMENT = models_config.get('pair_assignment', 'hungarian')  # hungarian / greedy
+        
+        # แคชผล OCR ของ crop ตามรูปร่างตัวอักษร: ผลที่ใกล้มากใช้ได้ทันที ผลที่ใกล้เกณฑ์ต้องยืนยันด้วย
+        # recognizer (ถูกกว่า cascade เต็มรูปแบบ) ถ้าอ่านได้ตัวเลขเดียวกันจึงใช้ผลจากแคช มิฉะนั้นรัน OCR ตามปกติ
+        self.crop_cache = None
+        if models_config.get('ocr_crop_cache', False):
+            self.crop_cache = PerceptualCropCache(
+                classes=models_config.get('ocr_crop_cache_classes', ['roomN']),
+                max_distance=models_config.get('ocr_crop_cache_distance', 16),
+                confirm_distance=models_config.get('ocr_crop_cache_confirm_distance', 10),
+                max_entries=models_config.get('ocr_crop_cache_size', 2048))
+        
+        # decode ภาพย่อ (IMREAD_REDUCED_COLOR_2/4/8) สำหรับ YOLO โดยให้ด้านยาวไม่ต่ำกว่า DETECT_MIN_SIDE
+        # แล้ว crop จากภาพความละเอียดเต็มสำหรับ OCR
+        self.REDUCED_DECODE = models_config.get('reduced_decode', True)
+        self.DETECT_MIN_SIDE = models_config.get('detect_min_side', 1280)
+        self.REDUCED_FLAGS = {
+            2: cv2.IMREAD_REDUCED_COLOR_2,
+            4: cv2.IMREAD_REDUCED_COLOR_4,
+            8: cv2.IMREAD_REDUCED_COLOR_8
+        }
+        # ภาพที่มีขนาดและตำแหน่งเดียวกับ crop ต้นฉบับ (ต่างกันแค่สี/แสง)
+        self.SAME_GEOMETRY_VARIANTS = {
+            'original_enhanced', 'gray', 'clahe', 'adjusted', 'denoised',
+            'otsu', 'adaptive', 'binary', 'bg_removed'
+        }
+        
         # จบการจับเวลา
         end_time = time.time()
         elapsed_time = end_time - start_time
@@ -77,79 +320,25 @@ class ImageDetector:
         return enhanced_img
 
     def preprocess_for_ocr(self, img):
-        """ตัดสัญญาณรบกวนและปรับปรุงคุณภาพรูปภาพสำหรับ OCR"""
-        # เก็บรายการภาพที่ประมวลผล
-        processed_images = []
-        
-        # 1. ภาพต้นฉบับที่เพิ่มความคมชัด
-        enhanced = self.enhance_contrast(img)
-        processed_images.append(("original_enhanced", enhanced))
-        
-        # 2. เปลี่ยนเป็นภาพเทา
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        processed_images.append(("gray", gray))
-        
-        # 3. ปรับสมดุลแสงด้วย CLAHE (ใช้ cached object)
-        clahe_img = self.clahe_ocr.apply(gray)
-        processed_images.append(("clahe", clahe_img))
-        
-        # 4. ปรับขนาดภาพให้ใหญ่ขึ้น 2 เท่า
-        height, width = gray.shape
-        enlarged = cv2.resize(gray, (width*2, height*2), interpolation=cv2.INTER_CUBIC)
-        processed_images.append(("enlarged", enlarged))
-        
-        # 5. ปรับความสว่าง/คอนทราสต์
-        adjusted = cv2.convertScaleAbs(gray, alpha=1.2, beta=10)
-        processed_images.append(("adjusted", adjusted))
-        
-        # 6. กำจัดสัญญาณรบกวน
-        denoised = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
-        processed_images.append(("denoised", denoised))
-        
-        # 7. เทรชโฮลด์แบบ Otsu
-        _, otsu = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        processed_images.append(("otsu", otsu))
-        
-        # 8. เทรชโฮลด์แบบ Adaptive
-        adaptive_thresh = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-            cv2.THRESH_BINARY, 11, 2
-        )
-        processed_images.append(("adaptive", adaptive_thresh))
-        
-        # 9. เทรชโฮลด์แบบทั่วไป
-        _, binary = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-        processed_images.append(("binary", binary))
-        
-        # 10. ลบพื้นหลังและปรับคอนทราสต์
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-        processed_images.append(("bg_removed", thresh))
-        
-        # 11. ลองหมุนภาพเล็กน้อยเพื่อแก้การเอียง
-        for angle in [-3, -1, 1, 3]:
-            h, w = gray.shape
-            center = (w // 2, h // 2)
-            rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-            rotated = cv2.warpAffine(gray, rotation_matrix, (w, h), flags=cv2.INTER_CUBIC, 
-                                    borderMode=cv2.BORDER_REPLICATE)
-            processed_images.append((f"rotated_{angle}", rotated))
+        """
+        ตัดสัญญาณรบกวนและปรับปรุงคุณภาพรูปภาพสำหรับ OCR
         
-        return processed_images
+        Returns:
+            OCRVariants: ภาพหลายรูปแบบที่จะถูกสร้างเมื่อถูกเรียกใช้เท่านั้น
+                (วนลูปได้เป็น (ชื่อ, ภาพ) เหมือนรายการเดิม)
+        """
+        return OCRVariants(img, self.enhance_contrast, self.clahe_ocr)
 
-    def perform_ocr(self, img_name, img, is_decimal=False):
-        """ทำ OCR กับภาพหนึ่งภาพ และคืนผลลัพธ์"""
-        
-        # ทดลองปรับพารามิเตอร์ EasyOCR หลายแบบ
-        ocr_results = []
+    def get_ocr_configs(self, is_decimal=False):
+        """
+        คืนค่าชุดพารามิเตอร์ EasyOCR ทั้งหมดตามลำดับ (จากถูกไปแพง)
         
-        # ทดลอง 1: ตั้งค่าพื้นฐานที่ปรับปรุงแล้ว
-        try:
-            result1 = self.reader.readtext(
-                img, 
-                detail=1, 
-                allowlist='0123456789',
-                paragraph=False, 
+        Returns:
+            dict: ชื่อ config -> (kwargs ของ readtext, confidence ขั้นต่ำ)
+        """
+        return {
+            # ทดลอง 1: ตั้งค่าพื้นฐานที่ปรับปรุงแล้ว
+            'base': (dict(
                 height_ths=0.8,
                 width_ths=0.7,
                 y_ths=0.5,
@@ -158,21 +347,9 @@ class ImageDetector:
                 text_threshold=0.5,
                 low_text=0.3,
                 link_threshold=0.3
-            )
-            for detection in result1:
-                bbox, text, conf = detection
-                if conf > 0.1:
-                    ocr_results.append((text, conf, f"{img_name}_base"))
-        except Exception as e:
-            pass
-        
-        # ทดลอง 2: เน้นการอ่านตัวเลขแบบแยกส่วน
-        try:
-            result2 = self.reader.readtext(
-                img, 
-                detail=1, 
-                allowlist='0123456789', 
-                paragraph=False, 
+            ), 0.1),
+            # ทดลอง 2: เน้นการอ่านตัวเลขแบบแยกส่วน
+            'segment': (dict(
                 contrast_ths=0.1,
                 adjust_contrast=0.5,
                 height_ths=0.5,
@@ -181,21 +358,9 @@ class ImageDetector:
                 text_threshold=0.4,
                 low_text=0.2,
                 mag_ratio=6.0 if is_decimal else 1.5  # ปรับ mag_ratio เฉพาะ decimal
-            )
-            for detection in result2:
-                bbox, text, conf = detection
-                if conf > 0.1:
-                    ocr_results.append((text, conf, f"{img_name}_segment"))
-        except Exception as e:
-            pass
-        
-        # ทดลอง 3: การตั้งค่าสำหรับตัวเลขที่ชัดเจน
-        try:
-            result3 = self.reader.readtext(
-                img, 
-                detail=1, 
-                allowlist='0123456789',
-                paragraph=False,
+            ), 0.1),
+            # ทดลอง 3: การตั้งค่าสำหรับตัวเลขที่ชัดเจน
+            'clear': (dict(
                 min_size=5,
                 text_threshold=0.7,
                 low_text=0.5,
@@ -209,21 +374,9 @@ class ImageDetector:
                 add_margin=0.1,
                 x_ths=1.5,
                 y_ths=0.5
-            )
-            for detection in result3:
-                bbox, text, conf = detection
-                if conf > 0.15:
-                    ocr_results.append((text, conf, f"{img_name}_clear"))
-        except Exception as e:
-            pass
-        
-        # ทดลอง 4: การตั้งค่าสำหรับตัวเลขที่จางหรือเบลอ
-        try:
-            result4 = self.reader.readtext(
-                img, 
-                detail=1, 
-                allowlist='0123456789',
-                paragraph=False,
+            ), 0.15),
+            # ทดลอง 4: การตั้งค่าสำหรับตัวเลขที่จางหรือเบลอ
+            'blur': (dict(
                 text_threshold=0.3,
                 low_text=0.1,
                 link_threshold=0.2,
@@ -236,15 +389,137 @@ class ImageDetector:
                 add_margin=0.3,
                 x_ths=2.0,
                 y_ths=0.3
+            ), 0.05)
+        }
+
+    def perform_ocr(self, img_name, img, is_decimal=False, config_names=None):
+        """
+        ทำ OCR กับภาพหนึ่งภาพ และคืนผลลัพธ์
+        
+        Args:
+            img_name: ชื่อรูปแบบภาพ (ใช้ประกอบชื่อ method)
+            img: ภาพที่จะอ่าน
+            is_decimal: เป็นเลขทศนิยมหรือไม่
+            config_names (list, optional): ชื่อ config ที่จะรัน (None = ทั้งหมด)
+        """
+        ocr_results = []
+        
+        # ทดลองปรับพารามิเตอร์ EasyOCR หลายแบบ
+        for config_name, (params, min_conf) in self.get_ocr_configs(is_decimal).items():
+            if config_names is not None and config_name not in config_names:
+                continue
+            try:
+                result = self.reader.readtext(
+                    img, 
+                    detail=1, 
+                    allowlist='0123456789',
+                    paragraph=False,
+                    **params
+                )
+                for detection in result:
+                    bbox, text, conf = detection
+                    if conf > min_conf:
+                        ocr_results.append((text, conf, f"{img_name}_{config_name}"))
+            except Exception as e:
+                pass
+        
+        return ocr_results
+
+    def detect_text_regions(self, gray_img):
+        """
+        หาตำแหน่งข้อความใน crop ด้วย CRAFT เพียงครั้งเดียว
+        
+        Returns:
+            tuple: (horizontal_list, free_list) หรือ None ถ้าไม่พบข้อความ
+        """
+        params, _ = self.get_ocr_configs()['base']
+        try:
+            horizontal_list, free_list = self.reader.detect(
+                gray_img,
+                text_threshold=params['text_threshold'],
+                low_text=params['low_text'],
+                link_threshold=params['link_threshold'],
+                height_ths=params['height_ths'],
+                width_ths=params['width_ths'],
+                add_margin=params['add_margin']
             )
-            for detection in result4:
-                bbox, text, conf = detection
-                if conf > 0.05:
-                    ocr_results.append((text, conf, f"{img_name}_blur"))
         except Exception as e:
-            pass
+            print(f"Error detecting text regions: {e}")
+            return None
         
-        return ocr_results
+        horizontal_list, free_list = horizontal_list[0], free_list[0]
+        if not horizontal_list and not free_list:
+            return None
+        return horizontal_list, free_list
+
+    def get_text_regions(self, img_name, variant_img, shared_regions=None):
+        """
+        คืนตำแหน่งข้อความสำหรับภาพแต่ละรูปแบบ โดยใช้ตำแหน่งที่หาไว้แล้วซ้ำ
+        ถ้าไม่มีตำแหน่งที่ใช้ได้ ให้ถือว่าทั้ง crop เป็นข้อความเดียว
+        """
+        h, w = variant_img.shape[:2]
+        
+        if shared_regions is not None:
+            horizontal_list, free_list = shared_regions
+            if img_name in self.SAME_GEOMETRY_VARIANTS:
+                return horizontal_list, free_list
+            if img_name == 'enlarged':
+                # ภาพขยาย 2 เท่า - ขยายพิกัดตาม
+                return ([[v * 2 for v in box] for box in horizontal_list],
+                        [[[x * 2, y * 2] for x, y in box] for box in free_list])
+        
+        # ภาพที่หมุนแล้ว หรือไม่มีตำแหน่งที่ใช้ได้ - ใช้ทั้ง crop
+        return [[0, w, 0, h]], []
+
+    def recognize_batch(self, items):
+        """
+        รันเฉพาะ recognizer ของ EasyOCR กับหลายภาพแบบ batch
+        ข้อความทุกชิ้นจะถูกเรียงตามความกว้าง แล้วแบ่งเป็น batch ละ OCR_BATCH_SIZE
+        เพื่อให้ padding ในแต่ละ batch น้อยที่สุด
+        
+        Args:
+            items (list): [(key, ภาพ, horizontal_list, free_list), ...]
+            
+        Returns:
+            dict: key -> [(text, conf), ...]
+        """
+        results = {key: [] for key, _, _, _ in items}
+        
+        # ตัดข้อความทุกชิ้นจากทุกภาพ
+        pieces = []  # (ความกว้างหลังปรับความสูง, key, (box, crop))
+        for key, img, horizontal_list, free_list in items:
+            grey = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+            crops, _ = get_image_list(horizontal_list, free_list, grey,
+                                      model_height=self.OCR_RECOGNIZER_HEIGHT)
+            for box, crop in crops:
+                pieces.append((crop.shape[1], key, (box, crop)))
+        
+        if not pieces:
+            return results
+        
+        pieces.sort(key=lambda piece: piece[0])
+        ignore_char = ''.join(set(self.reader.character) - set('0123456789'))
+        
+        for start in range(0, len(pieces), self.OCR_BATCH_SIZE):
+            chunk = pieces[start:start + self.OCR_BATCH_SIZE]
+            max_width = max(self.OCR_RECOGNIZER_HEIGHT, chunk[-1][0])
+            try:
+                predictions = get_text(
+                    self.reader.character, self.OCR_RECOGNIZER_HEIGHT, int(max_width),
+                    self.reader.recognizer, self.reader.converter, [piece[2] for piece in chunk],
+                    ignore_char=ignore_char,
+                    batch_size=len(chunk),
+                    workers=0,
+                    device=self.reader.device
+                )
+            except Exception as e:
+                print(f"Error in batched recognition: {e}")
+                continue
+            
+            for (_, key, _), (_, text, conf) in zip(chunk, predictions):
+                results[key].append((text, conf))
+        
+        return results
 
     def filter_and_select_best_result(self, all_ocr_results, expected_lengths=None, pattern=None):
         """กรองและเลือกผลลัพธ์ OCR ที่ดีที่สุด"""
@@ -324,12 +599,267 @@ class ImageDetector:
         cleaned_text = ''.join(re.findall(r'\d+', text))
         return (cleaned_text, conf, method) if cleaned_text else None
 
+    def agreeing_methods(self, all_ocr_results, best_result_data):
+        """
+        หาทุกวิธีที่อ่านได้ตัวเลขตรงกับผลลัพธ์ที่ถูกเลือก (ใช้ให้ win กับทุกวิธี ไม่ใช่แค่วิธีแรกที่พบ)
+        
+        Returns:
+            set: ชื่อวิธี (ว่างถ้าไม่มีผลลัพธ์ที่ถูกเลือก)
+        """
+        if not best_result_data:
+            return set()
+        best_text = best_result_data[0]
+        methods = {method for text, _, method in all_ocr_results
+                   if ''.join(re.findall(r'\d+', text)) == best_text}
+        methods.add(best_result_data[2])
+        return methods
+
+    def is_confident_result(self, all_ocr_results, best_result_data, pattern=None):
+        """
+        ตรวจสอบว่าผลลัพธ์ที่ดีที่สุดมั่นใจพอที่จะหยุด OCR ได้แล้วหรือไม่
+        (confidence ถึงเกณฑ์, มีผลลัพธ์ที่อ่านได้ตรงกันหลายครั้ง และตรงรูปแบบ)
+        """
+        if not best_result_data:
+            return False
+        
+        best_text, best_conf, _ = best_result_data
+        if best_conf < self.OCR_EARLY_EXIT_CONFIDENCE:
+            return False
+        
+        if pattern and not re.match(pattern, best_text):
+            return False
+        
+        # นับจำนวนครั้งที่อ่านได้ตรงกับผลลัพธ์ที่ดีที่สุด
+        agreeing = sum(1 for text, _, _ in all_ocr_results
+                       if ''.join(re.findall(r'\d+', text)) == best_text)
+        return agreeing >= self.OCR_EARLY_EXIT_CONSENSUS
+
+    def run_ocr_cascade(self, cropped_img, expected_lengths=None, pattern=None, is_decimal=False, class_name=None):
+        """
+        ทำ OCR แบบเป็นขั้นกับ crop เดียว (ดู run_ocr_cascade_batch)
+        
+        Returns:
+            tuple: (ผลลัพธ์ที่ดีที่สุด หรือ None, ชื่อ stage ที่จบการทำงาน)
+        """
+        return self.run_ocr_cascade_batch([(cropped_img, expected_lengths, pattern, is_decimal, class_name)])[0]
+
+    def run_ocr_cascade_batch(self, ocr_tasks, detection_mode=None):
+        """
+        ทำ OCR แบบเป็นขั้นกับทุก crop ของภาพพร้อมกัน: รันภาพ/config ราคาถูกก่อน
+        และรัน stage ที่แพงกว่า (denoised, enlarged, canvas_size ใหญ่) เฉพาะ crop
+        ที่ผลลัพธ์ยังไม่มั่นใจพอ ในโหมด recognizer ทุก (crop, ภาพ) ของ stage
+        จะถูกส่งเข้า recognizer เป็น batch เดียว
+        
+        Args:
+            ocr_tasks (list): [(crop, expected_lengths, pattern, is_decimal, class_name), ...]
+                class_name ใช้สำหรับเก็บสถิติและปิดวิธีที่ไม่เคยช่วย (None = ไม่ใช้)
+            detection_mode (str, optional): โหมดการหาตำแหน่งข้อความ (None = ใช้ OCR_DETECTION_MODE)
+            
+        Returns:
+            list: [(ผลลัพธ์ที่ดีที่สุด หรือ None, ชื่อ stage ที่จบการทำงาน), ...] ตามลำดับ ocr_tasks
+        """
+        detection_mode = detection_mode or self.OCR_DETECTION_MODE
+        recognize_only = detection_mode != 'per_variant'
+        if detection_mode != 'full_crop':
+            self.ensure_text_detector()
+        
+        # สถานะ OCR ของแต่ละ crop
+        states = []
+        for cropped_img, expected_lengths, pattern, is_decimal, class_name in ocr_tasks:
+            # วิธีที่ถูกปิดเพราะแทบไม่เคยให้ผลลัพธ์ที่ถูกเลือก
+            disabled = set()
+            if self.OCR_PRUNE_ENABLED and class_name:
+                disabled = self.ocr_stats.disabled_strategies(
+                    class_name, self.OCR_PRUNE_THRESHOLD, self.OCR_PRUNE_MIN_RUNS, self.OCR_PRUNE_EXPLORE_RATE)
+            
+            if recognize_only:
+                # ไม่มี CRAFT ในลูป - config ของ readtext ไม่มีผล รันภาพละครั้งเดียว
+                config_names = ['recognize']
+            else:
+                config_names = list(self.get_ocr_configs(is_decimal).keys())
+            states.append({
+                'processed_images': self.preprocess_for_ocr(cropped_img),
+                'expected_lengths': expected_lengths,
+                'pattern': pattern,
+                'is_decimal': is_decimal,
+                'class_name': class_name,
+                'disabled': disabled,
+                'config_names': config_names,
+                'all_ocr_results': [],
+                'done': set(),  # (ชื่อภาพ, ชื่อ config) ที่รันไปแล้ว
+                'best_result_data': None,
+                'finished_stage': None,
+                'finished': False,
+                'shared_regions': None,
+                'regions_resolved': detection_mode != 'shared'
+            })
+        
+        if self.OCR_CASCADE_ENABLED:
+            stages = self.OCR_CASCADE_STAGES
+        else:
+            stages = [('full', None, None)]
+        
+        for stage_name, stage_variants, stage_configs in stages:
+            # รวบรวมงานของ stage นี้ที่ยังไม่เคยรัน จากทุก crop ที่ยังไม่จบ
+            jobs = []  # (index ของ crop, ชื่อภาพ, ภาพ, config ที่ต้องรัน)
+            for index, state in enumerate(states):
+                if state['finished']:
+                    continue
+                for img_name in OCRVariants.NAMES:
+                    if stage_variants is not None and img_name not in stage_variants:
+                        continue
+                    pending = [c for c in state['config_names']
+                               if (recognize_only or stage_configs is None or c in stage_configs)
+                               and (img_name, c) not in state['done']
+                               and f"{img_name}_{c}" not in state['disabled']]
+                    if pending:
+                        # สร้างภาพรูปแบบนี้เฉพาะตอนที่ต้องใช้จริง
+                        variant_img = state['processed_images'][img_name]
+                        jobs.append((index, img_name, variant_img, pending))
+                        state['done'].update((img_name, c) for c in pending)
+            
+            if not jobs:
+                continue
+            
+            if recognize_only:
+                # รัน recognizer ครั้งเดียวกับทุก (crop, ภาพ) ของ stage นี้
+                batch_items = []
+                for index, img_name, variant_img, _ in jobs:
+                    state = states[index]
+                    # หาตำแหน่งข้อความครั้งเดียวต่อ crop (เฉพาะโหมด shared)
+                    if not state['regions_resolved']:
+                        state['shared_regions'] = self.detect_text_regions(state['processed_images']['gray'])
+                        state['regions_resolved'] = True
+                    horizontal_list, free_list = self.get_text_regions(
+                        img_name, variant_img, state['shared_regions'])
+                    batch_items.append(((index, img_name), variant_img, horizontal_list, free_list))
+                
+                for (index, img_name), texts in self.recognize_batch(batch_items).items():
+                    for text, conf in texts:
+                        if conf > self.OCR_RECOGNIZE_MIN_CONF:
+                            states[index]['all_ocr_results'].append((text, conf, f"{img_name}_recognize"))
+            else:
+                # ใช้ executor ที่สร้างไว้ครั้งเดียว แทนการสร้าง thread pool ใหม่ทุก crop
+                futures = [(index, self.ocr_executor.submit(
+                                self.perform_ocr, img_name, variant_img, states[index]['is_decimal'], pending))
+                           for index, img_name, variant_img, pending in jobs]
+                for index, future in futures:
+                    ocr_results = future.result()
+                    if ocr_results:
+                        states[index]['all_ocr_results'].extend(ocr_results)
+            
+            # เลือกผลลัพธ์ที่ดีที่สุดจนถึง stage นี้ของแต่ละ crop
+            for index in {job[0] for job in jobs}:
+                state = states[index]
+                state['finished_stage'] = stage_name
+                state['best_result_data'] = self.filter_and_select_best_result(
+                    state['all_ocr_results'], state['expected_lengths'], state['pattern'])
+                if self.is_confident_result(state['all_ocr_results'], state['best_result_data'], state['pattern']):
+                    state['finished'] = True
+                    state['processed_images'] = None  # คืนหน่วยความจำของภาพที่ไม่ใช้แล้ว
+            
+            if all(state['finished'] for state in states):
+                break
+        
+        # บันทึกสถิติว่าวิธีใดถูกรันและวิธีใดให้ผลลัพธ์ที่ถูกเลือก
+        for state in states:
+            if state['class_name'] and state['done']:
+                self.ocr_stats.record_box(
+                    state['class_name'],
+                    [f"{img_name}_{c}" for img_name, c in state['done']],
+                    self.agreeing_methods(state['all_ocr_results'], state['best_result_data']))
+        
+        return [(state['best_result_data'], state['finished_stage']) for state in states]
+
+    def ensure_text_detector(self):
+        """โหลด text detector (CRAFT) ของ EasyOCR เมื่อต้องใช้ครั้งแรก (กรณีโหมด recognizer-only)"""
+        if getattr(self.reader, 'detector', None) is not None:
+            return
+        with self._detector_lock:
+            if getattr(self.reader, 'detector', None) is None:
+                print("กำลังโหลด text detector ของ EasyOCR...")
+                detector_path = self.reader.getDetectorPath('craft')
+                self.reader.detector = self.reader.initDetector(detector_path)
+
+    def run_recognizer_fast_path(self, ocr_tasks, record_stats=True):
+        """
+        ส่ง crop จาก YOLO เข้า recognizer โดยตรง (ใช้ทั้ง crop เป็นกรอบข้อความ)
+        กับภาพเพียงไม่กี่รูปแบบ โดยไม่รัน CRAFT
+        
+        Args:
+            ocr_tasks (list): [(crop, expected_lengths, pattern, is_decimal, class_name), ...]
+            record_stats (bool): บันทึกสถิติการชนะของแต่ละวิธี (False สำหรับการยืนยันผลจากแคช)
+            
+        Returns:
+            list: [(ผลลัพธ์ที่ดีที่สุด หรือ None, 'fast_path'), ...] ตามลำดับ ocr_tasks
+        """
+        batch_items = []
+        for index, (cropped_img, _, _, _, _) in enumerate(ocr_tasks):
+            processed_images = self.preprocess_for_ocr(cropped_img)
+            for img_name in self.OCR_FAST_PATH_VARIANTS:
+                variant_img = processed_images[img_name]
+                horizontal_list, free_list = self.get_text_regions(img_name, variant_img)
+                batch_items.append(((index, img_name), variant_img, horizontal_list, free_list))
+        
+        all_ocr_results = [[] for _ in ocr_tasks]
+        for (index, img_name), texts in self.recognize_batch(batch_items).items():
+            for text, conf in texts:
+                if conf > self.OCR_RECOGNIZE_MIN_CONF:
+                    all_ocr_results[index].append((text, conf, f"{img_name}_recognize"))
+        
+        results = []
+        for (_, expected_lengths, pattern, _, class_name), ocr_results in zip(ocr_tasks, all_ocr_results):
+            best_result_data = self.filter_and_select_best_result(ocr_results, expected_lengths, pattern)
+            if class_name and record_stats:
+                self.ocr_stats.record_box(
+                    class_name,
+                    [f"{img_name}_recognize" for img_name in self.OCR_FAST_PATH_VARIANTS],
+                    self.agreeing_methods(ocr_results, best_result_data))
+            results.append((best_result_data, 'fast_path'))
+        return results
+
+    def get_ocr_stats(self):
+        """
+        คืนสถิติการชนะของแต่ละวิธี OCR พร้อมรายชื่อวิธีที่ถูกปิด (ถ้าเปิดโหมด prune)
+        """
+        return self.ocr_stats.summary(self.OCR_PRUNE_ENABLED, self.OCR_PRUNE_THRESHOLD, self.OCR_PRUNE_MIN_RUNS)
+
+    def get_ocr_params(self, class_name):
+        """
+        คืนพารามิเตอร์ OCR สำหรับแต่ละ class
+        
+        Returns:
+            tuple: (expected_lengths, pattern, is_decimal)
+        """
+        if class_name == 'roomN':
+            return self.EXPECTED_ROOM_LENGTH, self.ROOM_PATTERN, False
+        elif class_name == 'meter':
+            return self.EXPECTED_METER_LENGTH, self.METER_PATTERN, False
+        elif class_name == 'meter1':
+            return self.EXPECTED_DECIMAL_LENGTH, self.DECIMAL_PATTERN, True
+        return None, None, False
+
     def get_detections_by_class(self, img):
         """ตรวจจับทุก bounding box และแยกตาม class"""
         results = self.unified_model(img)
-        boxes = results[0].boxes.xyxy.cpu().numpy()
-        confidences = results[0].boxes.conf.cpu().numpy()
-        classes = results[0].boxes.cls.cpu().numpy()
+        return self.read_detections(img, results[0])
+
+    def read_detections(self, img, yolo_result):
+        """
+        ทำ OCR กับทุก bounding box จากผลลัพธ์ YOLO ของภาพหนึ่งภาพ และแยกตาม class
+        
+        Args:
+            img: ภาพต้นฉบับ หรือ DecodedImage (พิกัด box จะถูกแปลงเป็นพิกัดของภาพเต็ม
+                และ crop จากภาพเต็ม)
+            yolo_result: ผลลัพธ์ YOLO ของภาพนี้
+            
+        Returns:
+            dict: รายการ detection ของแต่ละ class
+        """
+        decoded = img if isinstance(img, DecodedImage) else DecodedImage(img)
+        boxes = yolo_result.boxes.xyxy.cpu().numpy()
+        confidences = yolo_result.boxes.conf.cpu().numpy()
+        classes = yolo_result.boxes.cls.cpu().numpy()
         
         # แยกการตรวจจับตาม class
         detections_by_class = {
@@ -338,65 +868,124 @@ class ImageDetector:
             'meter1': []
         }
         
+        # รวบรวมทุก crop ของภาพก่อน แล้วค่อยทำ OCR พร้อมกัน
+        candidates = []
+        ocr_tasks = []
         for j, (box, conf, cls) in enumerate(zip(boxes, confidences, classes)):
             if conf >= self.CONF_THRESHOLD:
                 class_name = self.CLASS_MAP.get(int(cls))
                 if class_name:
-                    x1, y1, x2, y2 = map(int, box)
-                    cropped_img = img[y1:y2, x1:x2]
+                    # แปลงพิกัดจากภาพย่อเป็นภาพเต็ม (decode ภาพเต็มเมื่อพบ box แรกเท่านั้น)
+                    full_img = decoded.full
+                    x1, y1, x2, y2 = (int(v * decoded.scale) for v in box)
+                    cropped_img = full_img[y1:y2, x1:x2]
+                    if decoded.scale != 1.0:
+                        cropped_img = cropped_img.copy()
                     
                     if cropped_img.shape[0] < 15 or cropped_img.shape[1] < 15:
                         continue
                     
                     # กำหนดพารามิเตอร์สำหรับแต่ละ class
-                    if class_name == 'roomN':
-                        expected_lengths = self.EXPECTED_ROOM_LENGTH
-                        pattern = self.ROOM_PATTERN
-                        is_decimal = False
-                    elif class_name == 'meter':
-                        expected_lengths = self.EXPECTED_METER_LENGTH
-                        pattern = self.METER_PATTERN
-                        is_decimal = False
-                    elif class_name == 'meter1':
-                        expected_lengths = self.EXPECTED_DECIMAL_LENGTH
-                        pattern = self.DECIMAL_PATTERN
-                        is_decimal = True
-                    
-                    # ประมวลผลภาพหลายรูปแบบ
-                    processed_images = self.preprocess_for_ocr(cropped_img)
+                    expected_lengths, pattern, is_decimal = self.get_ocr_params(class_name)
                     
-                    # ทำ OCR แบบขนาน
-                    all_ocr_results = []
-                    with ThreadPoolExecutor(max_workers=4) as executor:
-                        futures = [executor.submit(self.perform_ocr, img_name, img, is_decimal) 
-                                 for img_name, img in processed_images]
-                        for  future in futures:
-                            ocr_results = future.result()
-                            if ocr_results:
-                                all_ocr_results.extend(ocr_results)
-                    
-                    # เลือกผลลัพธ์ที่ดีที่สุด
-                    best_result_data = self.filter_and_select_best_result(
-                        all_ocr_results, expected_lengths, pattern)
-                    
-                    if best_result_data:
-                        number, number_conf, method = best_result_data
-                        
-                        # คำนวณจุดกึ่งกลางของ bounding box
-                        center_x = (x1 + x2) / 2
-                        center_y = (y1 + y2) / 2
-                        
-                        detection_data = {
-                            'number': number,
-                            'confidence': number_conf,
-                            'method': method,
-                            'box': [x1, y1, x2, y2],
-                            'center': (center_x, center_y),
-                            'detection_confidence': conf,
-                            'class': class_name
-                        }
-                        
-                        detections_by_class[class_name].append(detection_data)
+                    candidates.append((class_name, (x1, y1, x2, y2), conf))
+                    ocr_tasks.append((cropped_img, expected_lengths, pattern, is_decimal, class_name))
+        
+        # crop ถูกคัดลอกแล้ว ไม่ต้องเก็บภาพเต็มไว้ระหว่างทำ OCR
+        decoded.release_full()
+        
+        # ใช้ผล OCR ของ crop เดียวกันที่เคยอ่านแล้ว (เฉพาะ class ที่เปิดแคช เช่น เลขห้อง)
+        ocr_results = [None] * len(ocr_tasks)
+        cache_keys = {}
+        if self.crop_cache:
+            hits = {}
+            for i, (cropped_img, _, _, _, class_name) in enumerate(ocr_tasks):
+                if not self.crop_cache.enabled_for(class_name):
+                    continue
+                key = self.crop_cache.key_for(cropped_img)
+                cached = self.crop_cache.lookup(class_name, key)
+                if cached:
+                    hits[i] = cached
+                cache_keys[i] = key
+            
+            # ผลที่ใกล้มากใช้ได้ทันทีโดยไม่ต้องทำ OCR
+            for i, hit in hits.items():
+                if not hit['needs_confirm']:
+                    ocr_results[i] = (hit['result'], 'crop_cache')
+                    self.ocr_stats.record_cache(ocr_tasks[i][4], True, hit['ocr_time'])
+            
+            # ผลที่ใกล้เกณฑ์ต้องยืนยันตัวเลขด้วย recognizer ก่อนใช้ - เวลาที่ประหยัดได้หักเวลาที่ใช้ยืนยันออก
+            confirm_indexes = [i for i, hit in hits.items() if hit['needs_confirm']]
+            if confirm_indexes:
+                confirm_start = time.time()
+                confirmations = self.run_recognizer_fast_path(
+                    [ocr_tasks[i] for i in confirm_indexes], record_stats=False)
+                confirm_time = (time.time() - confirm_start) / len(confirm_indexes)
+                for i, (confirmed, _) in zip(confirm_indexes, confirmations):
+                    cached_result = hits[i]['result']
+                    if confirmed and confirmed[0] == cached_result[0]:
+                        ocr_results[i] = (cached_result, 'crop_cache')
+                        self.ocr_stats.record_cache(ocr_tasks[i][4], True, hits[i]['ocr_time'] - confirm_time)
+                    else:
+                        print(f"⚠️  ผลจากแคช crop ({cached_result[0]}) ไม่ตรงกับการอ่านซ้ำ "
+                              f"({confirmed[0] if confirmed else '-'}) - ทำ OCR ใหม่")
+                        self.ocr_stats.record_cache(ocr_tasks[i][4], False, -confirm_time, rejected=True)
+            for i in cache_keys:
+                if i not in hits:
+                    self.ocr_stats.record_cache(ocr_tasks[i][4], False)
+        
+        pending_indexes = [i for i, result in enumerate(ocr_results) if result is None]
+        pending_tasks = [ocr_tasks[i] for i in pending_indexes]
+        ocr_start = time.time()
+        
+        if self.OCR_RECOGNIZER_ONLY and pending_tasks:
+            # อ่านด้วย recognizer โดยตรงก่อน แล้ว fallback ไปใช้ readtext เต็มรูปแบบ
+            # เฉพาะ crop ที่ผลลัพธ์ไม่ตรงรูปแบบ (ROOM/METER/DECIMAL_PATTERN)
+            pending_results = self.run_recognizer_fast_path(pending_tasks)
+            fallback_indexes = [
+                i for i, (best_result_data, _) in enumerate(pending_results)
+                if not best_result_data or not re.match(pending_tasks[i][2], best_result_data[0])
+            ]
+            if fallback_indexes and self.OCR_FAST_PATH_FALLBACK:
+                fallback_results = self.run_ocr_cascade_batch(
+                    [pending_tasks[i] for i in fallback_indexes], detection_mode='per_variant')
+                for i, fallback_result in zip(fallback_indexes, fallback_results):
+                    if fallback_result[0]:
+                        pending_results[i] = fallback_result
+        else:
+            # ทำ OCR แบบ cascade กับทุก crop และเลือกผลลัพธ์ที่ดีที่สุด
+            pending_results = self.run_ocr_cascade_batch(pending_tasks) if pending_tasks else []
+        
+        # เวลา OCR เฉลี่ยต่อ crop (crop ของภาพเดียวกันถูกอ่านพร้อมกันเป็น batch)
+        ocr_time = (time.time() - ocr_start) / len(pending_tasks) if pending_tasks else 0.0
+        for i, result in zip(pending_indexes, pending_results):
+            ocr_results[i] = result
+            best_result_data = result[0]
+            # เก็บเฉพาะผลลัพธ์ที่ตรงรูปแบบ เพื่อไม่ให้ผลที่อ่านผิดถูกใช้ซ้ำ
+            # (ผลที่ไม่ผ่านการยืนยันจะถูกแทนที่ด้วยผล OCR ใหม่)
+            if i in cache_keys and best_result_data and re.match(ocr_tasks[i][2], best_result_data[0]):
+                self.crop_cache.put(ocr_tasks[i][4], cache_keys[i], best_result_data, ocr_time)
+        
+        for (class_name, (x1, y1, x2, y2), conf), (best_result_data, ocr_stage) in zip(candidates, ocr_results):
+            if best_result_data:
+                number, number_conf, method = best_result_data
+                
+                # คำนวณจุดกึ่งกลางของ bounding box
+                center_x = (x1 + x2) / 2
+                center_y = (y1 + y2) / 2
+                
+                detection_data = {
+                    'number': number,
+                    'confidence': number_conf,
+                    'method': method,
+                    'box': [x1, y1, x2, y2],
+                    'center': (center_x, center_y),
+                    'detection_confidence': conf,
+                    'class': class_name,
+                    'ocr_stage': ocr_stage
+                }
+                
+                detections_by_class[class_name].append(detection_data)
         
         return detections_by_class
 
@@ -404,66 +993,213 @@ class ImageDetector:
         """คำนวณระยะห่างระหว่างจุด 2 จุด"""
         return math.sqrt((point1[0] - point2[0])**2 + (point1[1] - point2[1])**2)
 
-    def find_best_pairs_unified(self, detections_by_class):
-        """หาคู่ที่ดีที่สุด - เฉพาะกรณีที่มีทั้งเลขห้องและมิเตอร์เท่านั้น"""
-        room_detections = detections_by_class['roomN']
-        meter_detections = detections_by_class['meter']
-        decimal_detections = detections_by_class['meter1']
+    def pairing_thresholds(self, image_shape=None):
+        """
+        ระยะที่ใช้จับคู่ (พิกเซลของภาพเต็ม) ปรับตามเส้นทแยงมุมของภาพเทียบกับภาพอ้างอิง
+        (ภาพ 3 MP และ 48 MP จึงใช้ระยะเท่ากันเมื่อเทียบกับขนาดภาพ)
         
-        # ใช้ logic เดิมในการหาคู่ที่ดีที่สุด
-        if room_detections and meter_detections:
-            best_pair = None
-            best_score = -1
+        Args:
+            image_shape (tuple, optional): (สูง, กว้าง) ของภาพเต็ม - None = ใช้ระยะคงที่แบบเดิม
             
-            for room in room_detections:
-                for meter in meter_detections:
-                    # คำนวณระยะห่างระหว่างเลขห้องและมิเตอร์
-                    distance = self.calculate_distance(room['center'], meter['center'])
-                    
-                    # หาเลขทศนิยมที่ใกล้กับมิเตอร์นี้ที่สุด (ถ้ามี)
-                    closest_decimal = None
-                    min_decimal_distance = float('inf')
-                    
-                    for decimal in decimal_detections:
-                        decimal_distance = self.calculate_distance(meter['center'], decimal['center'])
-                        if decimal_distance < min_decimal_distance:
-                            min_decimal_distance = decimal_distance
-                            closest_decimal = decimal
-                    
-                    # แปลงระยะห่างเป็นคะแนน (ยิ่งใกล้ยิ่งได้คะแนนสูง)
-                    distance_score = max(0, 1000 - distance) / 1000  # normalize ระยะห่าง
-                    
-                    # คะแนนจาก confidence
-                    room_conf_score = room['confidence'] * 0.3 + room['detection_confidence'] * 0.2
-                    meter_conf_score = meter['confidence'] * 0.3 + meter['detection_confidence'] * 0.2
-                    
-                    # คะแนนรวม
-                    total_score = distance_score * 0.4 + room_conf_score + meter_conf_score
-                    
-                    # เพิ่มคะแนนถ้ามีเลขทศนิยมที่ใกล้
-                    if closest_decimal and min_decimal_distance < 200:  # ถ้าเลขทศนิยมอยู่ใกล้ภายใน 200 pixels
-                        decimal_bonus = closest_decimal['confidence'] * 0.1
-                        total_score += decimal_bonus
-                    
-                    if total_score > best_score:
-                        best_score = total_score
-                        best_pair = {
-                            'room': room,
-                            'meter': meter,
-                            'decimal': closest_decimal if closest_decimal and min_decimal_distance < 200 else None,
-                            'distance': distance,
-                            'score': total_score,
-                            'pairing_method': 'proximity_matching'
-                        }
-            
-            return best_pair
-        
-        return None
-
-    def draw_detection_results_unified(self, img, best_pair, detections_by_class):
-        """วาด bounding box และข้อความผลลัพธ์บนรูปภาพสำหรับคู่ที่ดีที่สุด"""
+        Returns:
+            dict: room_meter (ระยะห้อง-มิเตอร์ที่ได้คะแนนระยะเป็น 0), decimal (ระยะทศนิยมของคู่),
+                  decimal_fallback (ระยะทศนิยมเมื่อไม่มีคู่)
+        """
+        factor = 1.0
+        if image_shape is not None:
+            factor = math.hypot(image_shape[0], image_shape[1]) / self.PAIR_REFERENCE_DIAGONAL
+        return {
+            'room_meter': self.PAIR_MAX_DISTANCE * factor,
+            'decimal': self.PAIR_DECIMAL_DISTANCE * factor,
+            'decimal_fallback': self.FALLBACK_DECIMAL_DISTANCE * factor
+        }
+
+    def _pair_scores(self, detections_by_class, thresholds):
+        """
+        คะแนนของทุกคู่ห้อง × มิเตอร์ (คำนวณเป็น matrix ด้วย NumPy)
+        
+        Returns:
+            dict: room_meter (ระยะห่าง n_room × n_meter), score (คะแนนรวม n_room × n_meter),
+                  meter_decimal (ระยะห่าง n_meter × n_decimal), closest_decimal (index ต่อมิเตอร์ หรือ -1)
+        """
+        rooms = detections_by_class['roomN']
+        meters = detections_by_class['meter']
+        decimals = detections_by_class['meter1']
+        
+        room_meter = distance_matrix(centers_array(rooms), centers_array(meters))
+        
+        # หาเลขทศนิยมที่ใกล้กับมิเตอร์แต่ละตัวที่สุด (ถ้าอยู่ใกล้พอ)
+        meter_decimal = distance_matrix(centers_array(meters), centers_array(decimals))
+        closest_decimal = np.full(len(meters), -1)
+        decimal_bonus = np.zeros(len(meters))
+        if decimals:
+            nearest = meter_decimal.argmin(axis=1)
+            near_enough = meter_decimal[np.arange(len(meters)), nearest] < thresholds['decimal']
+            closest_decimal[near_enough] = nearest[near_enough]
+            decimal_conf = np.array([d['confidence'] for d in decimals], dtype=np.float64)
+            decimal_bonus[near_enough] = decimal_conf[nearest[near_enough]] * 0.1
+        
+        # แปลงระยะห่างเป็นคะแนน (ยิ่งใกล้ยิ่งได้คะแนนสูง) และรวมกับคะแนนจาก confidence
+        distance_score = np.maximum(0, thresholds['room_meter'] - room_meter) / thresholds['room_meter']
+        room_conf = np.array([r['confidence'] * 0.3 + r['detection_confidence'] * 0.2 for r in rooms])
+        meter_conf = np.array([m['confidence'] * 0.3 + m['detection_confidence'] * 0.2 for m in meters])
+        score = distance_score * 0.4 + room_conf[:, None] + (meter_conf + decimal_bonus)[None, :]
+        
+        return {
+            'room_meter': room_meter,
+            'score': score,
+            'meter_decimal': meter_decimal,
+            'closest_decimal': closest_decimal
+        }
+
+    def _make_pair(self, detections_by_class, room_index, meter_index, decimal_index, scores, pairing_method):
+        return {
+            'room': detections_by_class['roomN'][room_index],
+            'meter': detections_by_class['meter'][meter_index],
+            'decimal': detections_by_class['meter1'][decimal_index] if decimal_index >= 0 else None,
+            'distance': float(scores['room_meter'][room_index, meter_index]),
+            'score': float(scores['score'][room_index, meter_index]),
+            'pairing_method': pairing_method
+        }
+
+    def find_best_pairs_unified(self, detections_by_class, image_shape=None):
+        """
+        หาคู่ที่ดีที่สุด - เฉพาะกรณีที่มีทั้งเลขห้องและมิเตอร์เท่านั้น
+        
+        Args:
+            detections_by_class: ผลลัพธ์จาก read_detections
+            image_shape (tuple, optional): (สูง, กว้าง) ของภาพเต็ม สำหรับปรับระยะตามขนาดภาพ
+        """
+        if not detections_by_class['roomN'] or not detections_by_class['meter']:
+            return None
+        
+        scores = self._pair_scores(detections_by_class, self.pairing_thresholds(image_shape))
+        # argmax คืนตำแหน่งแรกที่คะแนนสูงสุด (ลำดับเดียวกับลูปห้อง × มิเตอร์แบบเดิม)
+        room_index, meter_index = np.unravel_index(np.argmax(scores['score']), scores['score'].shape)
+        return self._make_pair(detections_by_class, room_index, meter_index,
+                               scores['closest_decimal'][meter_index], scores, 'proximity_matching')
+
+    def find_all_pairs(self, detections_by_class, image_shape=None, assignment=None):
+        """
+        จับคู่ห้อง ↔ มิเตอร์ ↔ ทศนิยมทุกคู่ในภาพ (เช่น ภาพแผงมิเตอร์หลายตัว)
+        แต่ละห้อง/มิเตอร์/ทศนิยมถูกใช้ได้ครั้งเดียว และคู่ห้อง-มิเตอร์ต้องห่างกันไม่เกินระยะ room_meter
+        
+        Args:
+            detections_by_class: ผลลัพธ์จาก read_detections
+            image_shape (tuple, optional): (สูง, กว้าง) ของภาพเต็ม สำหรับปรับระยะตามขนาดภาพ
+            assignment (str, optional): 'hungarian' (คะแนนรวมสูงสุด) หรือ 'greedy' (เลือกคู่คะแนนสูงสุดก่อน)
+                None = ใช้ PAIR_ASSIGNMENT
+                
+        Returns:
+            list: คู่ทั้งหมด (รูปแบบเดียวกับ find_best_pairs_unified) เรียงจากบนลงล่าง ซ้ายไปขวาตามตำแหน่งห้อง
+        """
+        if not detections_by_class['roomN'] or not detections_by_class['meter']:
+            return []
+        
+        assignment = assignment or self.PAIR_ASSIGNMENT
+        thresholds = self.pairing_thresholds(image_shape)
+        scores = self._pair_scores(detections_by_class, thresholds)
+        allowed = scores['room_meter'] < thresholds['room_meter']
+        
+        if assignment == 'hungarian':
+            # คู่ที่อยู่ไกลเกินได้ cost สูงมาก (ถูกเลือกเฉพาะเมื่อไม่มีทางเลือก แล้วถูกตัดทิ้ง)
+            cost = np.where(allowed, -scores['score'], 1e6)
+            room_indexes, meter_indexes = linear_sum_assignment(cost)
+        else:
+            room_indexes, meter_indexes = [], []
+            used_rooms, used_meters = set(), set()
+            for flat_index in np.argsort(-scores['score'], axis=None, kind='stable'):
+                room_index, meter_index = np.unravel_index(flat_index, scores['score'].shape)
+                if room_index in used_rooms or meter_index in used_meters:
+                    continue
+                used_rooms.add(room_index)
+                used_meters.add(meter_index)
+                room_indexes.append(room_index)
+                meter_indexes.append(meter_index)
+        
+        matched = [(r, m) for r, m in zip(room_indexes, meter_indexes) if allowed[r, m]]
+        if not matched:
+            # ไม่มีคู่ที่อยู่ใกล้พอ - ใช้คู่ที่ดีที่สุดแบบเดิม (ภาพมิเตอร์ตัวเดียวที่ถ่ายห่าง)
+            best_pair = self.find_best_pairs_unified(detections_by_class, image_shape)
+            return [best_pair] if best_pair else []
+        
+        # ทศนิยมแต่ละตัวใช้ได้กับมิเตอร์ตัวเดียว (assignment ตามระยะห่าง)
+        decimal_for_meter = {}
+        if detections_by_class['meter1']:
+            meter_list = [m for _, m in matched]
+            distances = scores['meter_decimal'][meter_list]
+            meter_rows, decimal_cols = linear_sum_assignment(
+                np.where(distances < thresholds['decimal'], distances, 1e6))
+            for row, col in zip(meter_rows, decimal_cols):
+                if distances[row, col] < thresholds['decimal']:
+                    decimal_for_meter[meter_list[row]] = col
+        
+        pairs = [self._make_pair(detections_by_class, r, m, decimal_for_meter.get(m, -1), scores,
+                                 f"{assignment}_matching")
+                 for r, m in matched]
+        pairs.sort(key=lambda pair: (pair['room']['center'][1], pair['room']['center'][0]))
+        return pairs
+
+    def pair_to_reading(self, pair):
+        """
+        แปลงคู่จาก find_all_pairs เป็นผลการอ่านหนึ่งรายการ (รูปแบบเดียวกับ room_number / meter_number ของ
+        process_image พร้อมตำแหน่ง box ในพิกัดภาพเต็ม)
+        
+        Returns:
+            dict: room_number, meter_number, decimal_number, full_meter, distance, score
+        """
+        def number(detection):
+            if not detection:
+                return {"value": None, "confidence": 0, "method": None, "ocr_stage": None, "box": None}
+            return {
+                "value": detection['number'],
+                "confidence": float(detection['confidence']),
+                "method": detection['method'],
+                "ocr_stage": detection.get('ocr_stage'),
+                "box": [int(v) for v in detection['box']]
+            }
+        
+        full_meter = pair['meter']['number']
+        if pair['decimal']:
+            full_meter = f"{full_meter}.{pair['decimal']['number']}"
+        return {
+            'room_number': number(pair['room']),
+            'meter_number': number(pair['meter']),
+            'decimal_number': number(pair['decimal']),
+            'full_meter': full_meter,
+            'distance': pair['distance'],
+            'score': pair['score']
+        }
+
+    def draw_detection_results_unified(self, img, best_pair, detections_by_class, scale=1.0, image_shape=None,
+                                       pairs=None):
+        """
+        วาด bounding box และข้อความผลลัพธ์บนรูปภาพสำหรับคู่ที่ดีที่สุด
+        
+        Args:
+            scale: อัตราส่วนพิกัดของ detection / พิกัดของ img (เช่น 4 เมื่อวาดบนภาพย่อ 1/4)
+            image_shape: (สูง, กว้าง) ของภาพเต็ม สำหรับปรับระยะตามขนาดภาพ (None = ระยะคงที่แบบเดิม)
+            pairs: ทุกคู่จาก find_all_pairs (โหมดแผงมิเตอร์) - วาดทุกคู่พร้อมหมายเลขคู่แทนคู่ที่ดีที่สุด
+        """
         display_img = img.copy()
         
+        if pairs:
+            for number, pair in enumerate(pairs, start=1):
+                for key, class_name, label in (('room', 'roomN', 'Room'), ('meter', 'meter', 'Meter'),
+                                               ('decimal', 'meter1', 'Decimal')):
+                    detection = pair[key]
+                    if not detection:
+                        continue
+                    x1, y1, x2, y2 = (int(v / scale) for v in detection['box'])
+                    cv2.rectangle(display_img, (x1, y1), (x2, y2), self.colors[class_name], 2)
+                    cv2.putText(display_img, f"#{number} {label}: {detection['number']}",
+                               (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, self.colors[class_name], 2)
+                # เส้นเชื่อมเลขห้องกับมิเตอร์ของคู่เดียวกัน
+                room_center = tuple(int(v / scale) for v in pair['room']['center'])
+                meter_center = tuple(int(v / scale) for v in pair['meter']['center'])
+                cv2.line(display_img, room_center, meter_center, (255, 255, 0), 1)
+            return display_img
+        
         room_detections = detections_by_class['roomN']
         meter_detections = detections_by_class['meter']
         decimal_detections = detections_by_class['meter1']
@@ -472,21 +1208,21 @@ class ImageDetector:
             # วาดข้อมูลจากคู่ที่ดีที่สุด
             if best_pair['room']:
                 room_data = best_pair['room']
-                x1, y1, x2, y2 = room_data['box']
+                x1, y1, x2, y2 = (int(v / scale) for v in room_data['box'])
                 cv2.rectangle(display_img, (x1, y1), (x2, y2), self.colors['roomN'], 2)
                 cv2.putText(display_img, f"Room: {room_data['number']}", 
                            (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, self.colors['roomN'], 2)
             
             if best_pair['meter']:
                 meter_data = best_pair['meter']
-                x1, y1, x2, y2 = meter_data['box']
+                x1, y1, x2, y2 = (int(v / scale) for v in meter_data['box'])
                 cv2.rectangle(display_img, (x1, y1), (x2, y2), self.colors['meter'], 2)
                 cv2.putText(display_img, f"Meter: {meter_data['number']}", 
                            (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, self.colors['meter'], 2)
             
             if best_pair['decimal']:
                 decimal_data = best_pair['decimal']
-                x1, y1, x2, y2 = decimal_data['box']
+                x1, y1, x2, y2 = (int(v / scale) for v in decimal_data['box'])
                 cv2.rectangle(display_img, (x1, y1), (x2, y2), self.colors['meter1'], 2)
                 cv2.putText(display_img, f"Decimal: {decimal_data['number']}", 
                            (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, self.colors['meter1'], 2)
@@ -496,7 +1232,7 @@ class ImageDetector:
             # วาดเลขห้องที่ดีที่สุด (ถ้ามี)
             if room_detections:
                 best_room = max(room_detections, key=lambda x: x['confidence'] * 0.7 + x['detection_confidence'] * 0.3)
-                x1, y1, x2, y2 = best_room['box']
+                x1, y1, x2, y2 = (int(v / scale) for v in best_room['box'])
                 cv2.rectangle(display_img, (x1, y1), (x2, y2), self.colors['roomN'], 2)
                 cv2.putText(display_img, f"Room: {best_room['number']}", 
                            (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, self.colors['roomN'], 2)
@@ -504,7 +1240,7 @@ class ImageDetector:
             # วาดเลขมิเตอร์ที่ดีที่สุด (ถ้ามี)
             if meter_detections:
                 best_meter = max(meter_detections, key=lambda x: x['confidence'] * 0.7 + x['detection_confidence'] * 0.3)
-                x1, y1, x2, y2 = best_meter['box']
+                x1, y1, x2, y2 = (int(v / scale) for v in best_meter['box'])
                 cv2.rectangle(display_img, (x1, y1), (x2, y2), self.colors['meter'], 2)
                 cv2.putText(display_img, f"Meter: {best_meter['number']}", 
                            (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, self.colors['meter'], 2)
@@ -520,8 +1256,8 @@ class ImageDetector:
                         closest_decimal = decimal
                 
                 # วาดเลขทศนิยมที่ใกล้ที่สุด (ถ้าอยู่ใกล้พอ)
-                if closest_decimal and min_decimal_distance < 600:
-                    x1, y1, x2, y2 = closest_decimal['box']
+                if closest_decimal and min_decimal_distance < self.pairing_thresholds(image_shape)['decimal_fallback']:
+                    x1, y1, x2, y2 = (int(v / scale) for v in closest_decimal['box'])
                     cv2.rectangle(display_img, (x1, y1), (x2, y2), self.colors['meter1'], 2)
                     cv2.putText(display_img, f"Decimal: {closest_decimal['number']}", 
                                (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, self.colors['meter1'], 2)
@@ -529,35 +1265,212 @@ class ImageDetector:
             # วาดเลขทศนิยมที่ดีที่สุด (ถ้าไม่มีมิเตอร์แต่มีทศนิยม)
             elif decimal_detections:
                 best_decimal = max(decimal_detections, key=lambda x: x['confidence'] * 0.7 + x['detection_confidence'] * 0.3)
-                x1, y1, x2, y2 = best_decimal['box']
+                x1, y1, x2, y2 = (int(v / scale) for v in best_decimal['box'])
                 cv2.rectangle(display_img, (x1, y1), (x2, y2), self.colors['meter1'], 2)
                 cv2.putText(display_img, f"Decimal: {best_decimal['number']}", 
                            (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, self.colors['meter1'], 2)
         
         return display_img
 
-    def process_image(self, image_path, output_folder):
+    def load_image(self, image):
+        """
+        อ่านภาพจากเส้นทางไฟล์, ข้อมูลไฟล์ในหน่วยความจำ (bytes) หรือ numpy array
+
+        Returns:
+            numpy.ndarray: ภาพ BGR หรือ None ถ้าอ่านไม่ได้
+        """
+        if isinstance(image, str):
+            return cv2.imread(image)
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return image
+
+    def decode_for_detection(self, image):
+        """
+        อ่านภาพแบบย่อขนาดตั้งแต่ตอน decode (IMREAD_REDUCED_COLOR_n) สำหรับ YOLO
+        โดยเลือก n ที่ใหญ่ที่สุดที่ด้านยาวของภาพย่อยังไม่ต่ำกว่า DETECT_MIN_SIDE
+        (อ่านขนาดภาพจาก header ด้วย PIL โดยไม่ decode ทั้งภาพ)
+        
+        Args:
+            image: เส้นทางไฟล์, ข้อมูลไฟล์ภาพ (bytes) หรือภาพ (numpy array)
+            
+        Returns:
+            DecodedImage: หรือ None ถ้าอ่านไม่ได้
+        """
+        if isinstance(image, np.ndarray):
+            return DecodedImage(image)
+        
+        is_path = isinstance(image, str)
+        data = image if is_path else np.frombuffer(image, dtype=np.uint8)
+        
+        factor = 1
+        if self.REDUCED_DECODE:
+            try:
+                with Image.open(image if is_path else io.BytesIO(image)) as header:
+                    long_side = max(header.size)
+                for n in (8, 4, 2):
+                    if long_side / n >= self.DETECT_MIN_SIDE:
+                        factor = n
+                        break
+            except Exception:
+                factor = 1
+        
+        flag = self.REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR)
+        reduced = cv2.imread(image, flag) if is_path else cv2.imdecode(data, flag)
+        if reduced is None:
+            return None
+        if factor == 1:
+            return DecodedImage(reduced)
+        
+        print(f"📉 Reduced decode 1/{factor}: {reduced.shape[1]}x{reduced.shape[0]}")
+        return DecodedImage(reduced, float(factor), source=image)
+
+    def process_image(self, image_path, output_folder=None, progress=None, encode_image=False, mode='single'):
         """
         ประมวลผลรูปภาพเพื่อค้นหาเลขห้องและเลขมิเตอร์โดยใช้ proximity matching
         ใหม่: ต้องเจอทั้งเลขห้องและเลขมิเตอร์ถึงจะบันทึกได้
         
         Args:
-            image_path: เส้นทางของไฟล์รูปภาพ
-            output_folder: โฟลเดอร์สำหรับบันทึกภาพที่ประมวลผลแล้ว
+            image_path: เส้นทางของไฟล์รูปภาพ, ข้อมูลไฟล์ภาพ (bytes) หรือภาพ (numpy array)
+            output_folder: โฟลเดอร์สำหรับบันทึกภาพที่ประมวลผลแล้ว (None = ไม่บันทึกลงดิสก์)
+            progress (callable, optional): เรียก progress(stage, info) เมื่อจบแต่ละขั้น
+                ('detected' หลัง YOLO, 'ocr_done' หลัง OCR)
+            encode_image (bool): คืนภาพที่ประมวลผลแล้วเป็น JPEG bytes ใน 'processed_image_bytes'
+            mode (str): 'single' (คู่ที่ดีที่สุดคู่เดียว) หรือ 'panel' (ทุกคู่ในภาพ ใน 'pairs'
+                เช่น ภาพแผงมิเตอร์หลายตัว)
 
         Returns:
             dict: ผลลัพธ์การประมวลผล
         """
-        # อ่านภาพ
-        img = cv2.imread(image_path)
+        # อ่านภาพ (ภาพย่อสำหรับตรวจจับ ภาพเต็มจะถูก decode เมื่อ crop)
+        img = self.decode_for_detection(image_path)
         if img is None:
             return {"error": "ไม่สามารถอ่านไฟล์รูปภาพได้"}
         
+        # เริ่มจับเวลา
+        start_time = time.time()
+        
+        # ตรวจจับทุก bounding box และทำ OCR
+        print("กำลังตรวจจับ...")
+        yolo_result = self.unified_model(img.image)[0]
+        if progress:
+            progress('detected', {'boxes': len(yolo_result.boxes)})
+        detections_by_class = self.read_detections(img, yolo_result)
+        if progress:
+            progress('ocr_done', {name: len(items) for name, items in detections_by_class.items()})
+        
+        image_path = image_path if isinstance(image_path, str) else None
+        return self.build_results(img, detections_by_class, image_path, output_folder, start_time,
+                                  encode_image, mode)
+
+    def process_images(self, images, output_folder=None, batch_size=8, encode_image=False, mode='single'):
+        """
+        ประมวลผลหลายรูปภาพ โดยรัน YOLO เป็น batch และตรวจจับ batch ถัดไประหว่างที่ทำ OCR
+        ของ batch ปัจจุบัน (ดู iter_detections)
+        
+        Args:
+            images (list): รายการเส้นทางไฟล์รูปภาพ, ข้อมูลไฟล์ภาพ (bytes) หรือภาพ (numpy array)
+            output_folder: โฟลเดอร์สำหรับบันทึกภาพที่ประมวลผลแล้ว
+            batch_size: จำนวนภาพต่อ batch ของ YOLO
+            encode_image (bool): คืนภาพที่ประมวลผลแล้วเป็น JPEG bytes (ดู process_image)
+            mode (str): 'single' หรือ 'panel' (ดู process_image)
+            
+        Yields:
+            dict: ผลลัพธ์ของแต่ละภาพตามลำดับ (รูปแบบเดียวกับ process_image)
+        """
+        images = list(images)
+        for index, img, detections_by_class, elapsed, error in self.iter_detections(images, batch_size):
+            if error:
+                yield {"error": f"เกิดข้อผิดพลาดในการประมวลผลภาพ: {error}"}
+                continue
+            if img is None:
+                yield {"error": "ไม่สามารถอ่านไฟล์รูปภาพได้"}
+                continue
+            image_path = images[index] if isinstance(images[index], str) else None
+            yield self.build_results(img, detections_by_class, image_path, output_folder,
+                                     time.time() - elapsed, encode_image, mode)
+
+    def iter_detections(self, images, batch_size=8):
+        """
+        ตรวจจับและทำ OCR กับหลายรูปภาพ: รัน YOLO ทีละ batch (letterbox อัตโนมัติ)
+        ใน thread แยก ซึ่งจะตรวจจับ batch k+1 ระหว่างที่ thread หลักทำ OCR ของ batch k
+        ข้อผิดพลาดของภาพใดภาพหนึ่ง (หรือของ YOLO ทั้ง batch) ถูกส่งออกเป็น error ของภาพนั้น
+        โดยไม่หยุดการประมวลผลภาพที่เหลือ
+        
+        Args:
+            images (list): รายการเส้นทางไฟล์รูปภาพ, ข้อมูลไฟล์ภาพ (bytes) หรือภาพ (numpy array)
+            batch_size: จำนวนภาพต่อ batch ของ YOLO
+            
+        Yields:
+            tuple: (index, DecodedImage หรือ None ถ้าอ่านไม่ได้, detections_by_class, เวลาที่ใช้ (วินาที),
+                    ข้อความ error หรือ None)
+        """
+        images = list(images)
+        batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+        if not batches:
+            return
+        
+        def detect(batch):
+            batch_start = time.time()
+            loaded = [self.decode_for_detection(image) for image in batch]
+            valid = [img.image for img in loaded if img is not None]
+            yolo_results = iter(self.unified_model(valid)) if valid else iter([])
+            results = [next(yolo_results) if img is not None else None for img in loaded]
+            return loaded, results, time.time() - batch_start
+        
+        index = 0
+        with ThreadPoolExecutor(max_workers=1) as detect_executor:
+            future = detect_executor.submit(detect, batches[0])
+            for k in range(len(batches)):
+                try:
+                    loaded, yolo_results, detect_time = future.result()
+                except Exception as e:
+                    print(f"❌ Error detecting batch {k + 1}: {e}")
+                    loaded, yolo_results, detect_time = None, None, 0.0
+                    batch_error = f"{type(e).__name__}: {e}"
+                if k + 1 < len(batches):
+                    future = detect_executor.submit(detect, batches[k + 1])
+                
+                if loaded is None:
+                    for _ in batches[k]:
+                        yield index, None, None, 0.0, batch_error
+                        index += 1
+                    continue
+                
+                detect_share = detect_time / len(loaded)
+                for img, yolo_result in zip(loaded, yolo_results):
+                    if img is None:
+                        yield index, None, None, detect_share, None
+                    else:
+                        ocr_start = time.time()
+                        try:
+                            detections_by_class = self.read_detections(img, yolo_result)
+                        except Exception as e:
+                            print(f"❌ Error reading detections of image {index + 1}: {e}")
+                            yield index, img, None, detect_share + time.time() - ocr_start, f"{type(e).__name__}: {e}"
+                        else:
+                            yield index, img, detections_by_class, detect_share + time.time() - ocr_start, None
+                    index += 1
+
+    def build_results(self, img, detections_by_class, image_path, output_folder, start_time,
+                      encode_image=False, mode='single'):
+        """
+        จับคู่ผลการตรวจจับ วาดผลลัพธ์ และสร้าง dictionary ผลลัพธ์ของ process_image
+        
+        Args:
+            img: ภาพต้นฉบับ หรือ DecodedImage
+            detections_by_class: ผลลัพธ์จาก get_detections_by_class
+            image_path: เส้นทางของไฟล์รูปภาพ (ถ้ามี)
+            output_folder: โฟลเดอร์สำหรับบันทึกภาพที่ประมวลผลแล้ว
+            start_time: เวลาเริ่มประมวลผล (สำหรับคำนวณ elapsed_time)
+            encode_image: เข้ารหัสภาพที่ประมวลผลแล้วเป็น JPEG ในหน่วยความจำ
+            mode: 'single' หรือ 'panel' (เพิ่ม 'pairs' ซึ่งเป็นทุกคู่ที่จับได้ในภาพ)
+        """
         # สร้าง dictionary เก็บผลลัพธ์
         results_dict = {
-            'room_number': {"value": None, "confidence": 0, "method": None},
-            'meter_number': {"value": None, "confidence": 0, "method": None},
-            'decimal_number': {"value": None, "confidence": 0, "method": None},
+            'room_number': {"value": None, "confidence": 0, "method": None, "ocr_stage": None},
+            'meter_number': {"value": None, "confidence": 0, "method": None, "ocr_stage": None},
+            'decimal_number': {"value": None, "confidence": 0, "method": None, "ocr_stage": None},
             'full_meter': None,
             'google_drive_link': None,
             'image_path': image_path,
@@ -566,34 +1479,38 @@ class ImageDetector:
             'pairing_info': None
         }
         
-        # เริ่มจับเวลา
-        start_time = time.time()
-        
-        # ตรวจจับทุก bounding box และทำ OCR
-        print("กำลังตรวจจับ...")
-        detections_by_class = self.get_detections_by_class(img)
-        
         room_detections = detections_by_class['roomN']
         meter_detections = detections_by_class['meter']
         decimal_detections = detections_by_class['meter1']
         
         print(f"พบเลขห้อง {len(room_detections)} ตัว, มิเตอร์ {len(meter_detections)} ตัว, ทศนิยม {len(decimal_detections)} ตัว")
         
-        # หาคู่ที่ดีที่สุด
-        best_pair = self.find_best_pairs_unified(detections_by_class)
+        # หาคู่ที่ดีที่สุด (ระยะที่ใช้จับคู่ปรับตามขนาดภาพเต็ม)
+        image_shape = img.full_shape if isinstance(img, DecodedImage) else img.shape[:2]
+        thresholds = self.pairing_thresholds(image_shape)
+        best_pair = self.find_best_pairs_unified(detections_by_class, image_shape)
+        
+        # โหมดแผงมิเตอร์: ทุกคู่ห้อง ↔ มิเตอร์ ↔ ทศนิยม (ผล OCR ของทุก box ถูกอ่านไว้แล้ว)
+        pairs = self.find_all_pairs(detections_by_class, image_shape) if mode == 'panel' else None
+        if pairs is not None:
+            results_dict['mode'] = 'panel'
+            results_dict['pairs'] = [self.pair_to_reading(pair) for pair in pairs]
+            print(f"🔢 โหมดแผงมิเตอร์: จับคู่ได้ {len(pairs)} คู่")
         
         if best_pair:
             # เก็บผลลัพธ์เฉพาะกรณีที่มีทั้งเลขห้องและมิเตอร์
             results_dict['room_number'] = {
                 "value": best_pair['room']['number'], 
                 "confidence": float(best_pair['room']['confidence']), 
-                "method": best_pair['room']['method']
+                "method": best_pair['room']['method'],
+                "ocr_stage": best_pair['room'].get('ocr_stage')
             }
             
             results_dict['meter_number'] = {
                 "value": best_pair['meter']['number'], 
                 "confidence": float(best_pair['meter']['confidence']), 
-                "method": best_pair['meter']['method']
+                "method": best_pair['meter']['method'],
+                "ocr_stage": best_pair['meter'].get('ocr_stage')
             }
             
             # เลขทศนิยม (ถ้ามี)
@@ -601,7 +1518,8 @@ class ImageDetector:
                 results_dict['decimal_number'] = {
                     "value": best_pair['decimal']['number'], 
                     "confidence": float(best_pair['decimal']['confidence']), 
-                    "method": best_pair['decimal']['method']
+                    "method": best_pair['decimal']['method'],
+                    "ocr_stage": best_pair['decimal'].get('ocr_stage')
                 }
                 full_meter = f"{best_pair['meter']['number']}.{best_pair['decimal']['number']}"
             else:
@@ -637,7 +1555,8 @@ class ImageDetector:
                 results_dict['room_number'] = {
                     "value": best_room['number'], 
                     "confidence": float(best_room['confidence']), 
-                    "method": best_room['method']
+                    "method": best_room['method'],
+                    "ocr_stage": best_room.get('ocr_stage')
                 }
                 print(f"   พบเลขห้อง: {best_room['number']} (confidence: {best_room['confidence']:.2f})")
             else:
@@ -648,7 +1567,8 @@ class ImageDetector:
                 results_dict['meter_number'] = {
                     "value": best_meter['number'], 
                     "confidence": float(best_meter['confidence']), 
-                    "method": best_meter['method']
+                    "method": best_meter['method'],
+                    "ocr_stage": best_meter.get('ocr_stage')
                 }
                 
                 # หาเลขทศนิยมที่ใกล้กับมิเตอร์นี้ที่สุด (ถ้ามี)
@@ -662,11 +1582,12 @@ class ImageDetector:
                         closest_decimal = decimal
                 
                 # เก็บข้อมูลทศนิยมถ้าอยู่ใกล้พอ
-                if closest_decimal and min_decimal_distance < 600:
+                if closest_decimal and min_decimal_distance < thresholds['decimal_fallback']:
                     results_dict['decimal_number'] = {
                         "value": closest_decimal['number'], 
                         "confidence": float(closest_decimal['confidence']), 
-                        "method": closest_decimal['method']
+                        "method": closest_decimal['method'],
+                        "ocr_stage": closest_decimal.get('ocr_stage')
                     }
                     full_meter = f"{best_meter['number']}.{closest_decimal['number']}"
                     print(f"   พบเลขมิเตอร์: {best_meter['number']} พร้อมทศนิยม: {closest_decimal['number']}")
@@ -684,7 +1605,8 @@ class ImageDetector:
                 results_dict['decimal_number'] = {
                     "value": best_decimal['number'], 
                     "confidence": float(best_decimal['confidence']), 
-                    "method": best_decimal['method']
+                    "method": best_decimal['method'],
+                    "ocr_stage": best_decimal.get('ocr_stage')
                 }
                 print(f"   พบเลขทศนิยม: {best_decimal['number']} (confidence: {best_decimal['confidence']:.2f})")
             
@@ -696,8 +1618,13 @@ class ImageDetector:
                 'error': 'ต้องเจอทั้งเลขห้องและเลขมิเตอร์จึงจะสามารถบันทึกได้'
             }
         
-        # วาด bounding box บนรูปภาพ
-        display_img = self.draw_detection_results_unified(img, best_pair, detections_by_class)
+        # วาด bounding box บนรูปภาพ (ถ้าเป็น DecodedImage วาดบนภาพย่อ)
+        if isinstance(img, DecodedImage):
+            display_img = self.draw_detection_results_unified(img.image, best_pair, detections_by_class, img.scale,
+                                                              image_shape, pairs)
+        else:
+            display_img = self.draw_detection_results_unified(img, best_pair, detections_by_class,
+                                                              image_shape=image_shape, pairs=pairs)
         
         # จบการจับเวลา
         end_time = time.time()
@@ -712,4 +1639,11 @@ class ImageDetector:
             results_dict['processed_image'] = random_filename
             results_dict['processed_image_path'] = output_path
         
+        # เข้ารหัสภาพเป็น JPEG ในหน่วยความจำ (ไม่ต้องเขียน/อ่านไฟล์สำหรับอัปโหลด)
+        if encode_image:
+            ok, buffer = cv2.imencode('.jpg', display_img)
+            if ok:
+                results_dict['processed_image'] = results_dict.get('processed_image') or f"{str(uuid.uuid4())}.jpg"
+                results_dict['processed_image_bytes'] = buffer.tobytes()
+        
         return results_dict
\ No newline at end of file
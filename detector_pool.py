@@ -0,0 +1,349 @@
+# detector_pool.py - กลุ่ม worker process ที่แต่ละตัวมี ImageDetector ของตัวเอง
+import os
+import time
+import uuid
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import Future
+from ocr_stats import OCRStrategyStats
+
+def _get_rss_mb():
+    """หน่วยความจำที่ process ใช้อยู่ (MB)"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except Exception:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _worker_main(worker_id, models_config, torch_threads, jobs, results, max_jobs, max_rss_mb):
+    """
+    ลูปหลักของ worker process: โหลด ImageDetector ครั้งเดียวแล้วรับงานจาก queue
+    จะออกจากลูป (เพื่อให้ถูกสร้างใหม่) เมื่อทำงานครบ max_jobs หรือใช้หน่วยความจำเกิน max_rss_mb
+    """
+    if torch_threads:
+        # จำกัด thread ของ torch/OpenMP ต่อ worker เพื่อไม่ให้แย่ง core กัน
+        os.environ['OMP_NUM_THREADS'] = str(torch_threads)
+        import torch
+        torch.set_num_threads(torch_threads)
+
+    from detector import ImageDetector
+
+    # worker ไม่บันทึกสถิติ OCR เอง แต่ส่งให้ process หลักรวม
+    models_config = dict(models_config, ocr_stats_autosave_every=None)
+    config = dict(models_config, num_threads=torch_threads) if torch_threads else models_config
+    detector = ImageDetector(config)
+    results.put(('ready', worker_id, None, os.getpid()))
+
+    jobs_done = 0
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+
+        job_id, method, args, kwargs, wants_progress, wants_items, stats = job
+        results.put(('started', worker_id, job_id, None))
+        # ใช้สถิติล่าสุดที่รวมจากทุก worker แทนสถิติที่โหลดไว้ตอนเริ่ม worker
+        # (การปิดวิธี OCR ที่ไม่ค่อยชนะจึงตามทันงานของ worker อื่น)
+        detector.ocr_stats.replace(stats)
+        if wants_progress:
+            # ส่งความคืบหน้า (เช่น 'detected', 'ocr_done') กลับไปยัง process หลัก
+            kwargs = dict(kwargs, progress=lambda stage, info=None: results.put(
+                ('progress', worker_id, job_id, (stage, info))))
+        try:
+            result = getattr(detector, method)(*args, **kwargs)
+            if method == 'process_images' and wants_items:
+                # ส่งผลลัพธ์ทีละภาพทันทีที่เสร็จ (ไม่ต้องรอทั้ง batch)
+                for index, item in enumerate(result):
+                    results.put(('item', worker_id, job_id, (index, item)))
+                result = None
+            elif method == 'process_images':
+                result = list(result)
+            results.put(('result', worker_id, job_id, (result, detector.ocr_stats.drain_delta())))
+        except Exception as e:
+            results.put(('error', worker_id, job_id, (f"{type(e).__name__}: {e}", detector.ocr_stats.drain_delta())))
+
+        jobs_done += 1
+        rss_mb = _get_rss_mb()
+        if (max_jobs and jobs_done >= max_jobs) or (max_rss_mb and rss_mb > max_rss_mb):
+            print(f"♻️ Worker {worker_id} recycling after {jobs_done} jobs (RSS {rss_mb:.0f} MB)")
+            break
+
+    results.put(('exit', worker_id, None, None))
+
+
+class DetectorPool:
+    """
+    กลุ่ม worker process สำหรับประมวลผลภาพ โดยแต่ละ process มี ImageDetector ของตัวเอง
+    รับงานผ่าน queue ที่จำกัดขนาด และคืนผลลัพธ์ให้ thread ของ request ผ่าน Future
+    มี interface process_image / process_images เหมือน ImageDetector
+    """
+
+    def __init__(self, models_config, num_workers=2, torch_threads=None, max_queue=32,
+                 max_jobs_per_worker=500, max_rss_mb=None, submit_timeout=30):
+        """
+        Args:
+            models_config (dict): ค่า configuration ของโมเดล (ส่งให้ ImageDetector ของแต่ละ worker)
+            num_workers (int): จำนวน worker process
+            torch_threads (int, optional): จำนวน thread ของ torch ต่อ worker
+            max_queue (int): จำนวนงานสูงสุดที่รอใน queue
+            max_jobs_per_worker (int): สร้าง worker ใหม่หลังทำงานครบจำนวนนี้ (0 = ไม่จำกัด)
+            max_rss_mb (int, optional): สร้าง worker ใหม่เมื่อหน่วยความจำเกินค่านี้
+            submit_timeout (float): เวลารอสูงสุดเมื่อ queue เต็ม (วินาที)
+        """
+        self.models_config = models_config
+        self.num_workers = num_workers
+        self.torch_threads = torch_threads
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_rss_mb = max_rss_mb
+        self.submit_timeout = submit_timeout
+
+        # สถิติ OCR รวมของทุก worker (บันทึกลงไฟล์โดย process หลักเท่านั้น)
+        self.ocr_stats = OCRStrategyStats(models_config.get('ocr_stats_path'),
+                                          models_config.get('ocr_stats_autosave_every', 20))
+
+        # ใช้ spawn เพื่อไม่ให้ worker สืบทอดสถานะ thread ของ torch จาก process หลัก
+        self._ctx = multiprocessing.get_context('spawn')
+        self._jobs = self._ctx.Queue(maxsize=max_queue)
+        self._results = self._ctx.Queue()
+
+        self._lock = threading.Lock()
+        self._futures = {}          # job_id -> Future
+        self._progress = {}         # job_id -> callback ความคืบหน้า
+        self._items = {}            # job_id -> callback ผลลัพธ์ทีละภาพ (process_images)
+        self._running = {}          # worker_id -> job_id ที่กำลังทำ
+        self._workers = {}          # worker_id -> Process
+        self._next_worker_id = 0
+        self._closed = False
+
+        for _ in range(num_workers):
+            self._start_worker()
+
+        self._collector = threading.Thread(target=self._collect_results, daemon=True)
+        self._collector.start()
+        print(f"🏭 Detector pool started with {num_workers} workers")
+
+    def _start_worker(self):
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.models_config, self.torch_threads, self._jobs, self._results,
+                  self.max_jobs_per_worker, self.max_rss_mb),
+            daemon=True
+        )
+        process.start()
+        self._workers[worker_id] = process
+
+    def _collect_results(self):
+        """thread ที่รับผลลัพธ์จาก worker, ส่งต่อให้ Future และสร้าง worker ใหม่แทนตัวที่ออกไป"""
+        last_check = time.time()
+        while not self._closed:
+            # ตรวจ worker ที่ตายทุกวินาทีแม้ queue จะไม่ว่างเลย (worker อื่นส่งผลลัพธ์มาตลอดเมื่อมีงานมาก)
+            if time.time() - last_check >= 1:
+                self._check_workers()
+                last_check = time.time()
+            try:
+                kind, worker_id, job_id, payload = self._results.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            if kind == 'ready':
+                print(f"✅ Detector worker {worker_id} ready (pid {payload})")
+            elif kind == 'started':
+                with self._lock:
+                    self._running[worker_id] = job_id
+            elif kind == 'progress':
+                callback = self._progress.get(job_id)
+                if callback:
+                    try:
+                        callback(*payload)
+                    except Exception as e:
+                        print(f"Error in progress callback: {e}")
+            elif kind == 'item':
+                callback = self._items.get(job_id)
+                if callback:
+                    callback(*payload)
+            elif kind in ('result', 'error'):
+                value, stats_delta = payload
+                self.ocr_stats.merge(stats_delta)
+                with self._lock:
+                    self._running.pop(worker_id, None)
+                    self._progress.pop(job_id, None)
+                    self._items.pop(job_id, None)
+                    future = self._futures.pop(job_id, None)
+                if future:
+                    if kind == 'result':
+                        future.set_result(value)
+                    else:
+                        future.set_exception(RuntimeError(value))
+            elif kind == 'exit':
+                with self._lock:
+                    process = self._workers.pop(worker_id, None)
+                    # _check_workers อาจสร้าง worker ใหม่แทนตัวนี้ไปแล้ว (process เป็น None)
+                    if process and not self._closed:
+                        self._start_worker()
+                if process:
+                    process.join(timeout=5)
+
+    def _check_workers(self):
+        """ตรวจหา worker ที่ตายผิดปกติ แจ้ง error ให้งานที่ค้าง และสร้าง worker ใหม่"""
+        with self._lock:
+            dead = [wid for wid, process in self._workers.items() if not process.is_alive()]
+            for worker_id in dead:
+                self._workers.pop(worker_id)
+                job_id = self._running.pop(worker_id, None)
+                self._progress.pop(job_id, None)
+                self._items.pop(job_id, None)
+                future = self._futures.pop(job_id, None) if job_id else None
+                if future:
+                    future.set_exception(RuntimeError(f"Detector worker {worker_id} died"))
+                print(f"⚠️ Detector worker {worker_id} died, restarting")
+                if not self._closed:
+                    self._start_worker()
+
+    def submit(self, method, *args, progress=None, on_item=None, **kwargs):
+        """
+        ส่งงานเข้า queue
+
+        Args:
+            progress (callable, optional): เรียก progress(stage, info) ใน process หลัก
+                เมื่อ worker รายงานความคืบหน้า
+            on_item (callable, optional): สำหรับ process_images - เรียก on_item(index, result)
+                ทันทีที่แต่ละภาพเสร็จ (ผลลัพธ์ของ Future จะเป็น None)
+
+        Returns:
+            Future: ผลลัพธ์ของ ImageDetector.<method>(*args, **kwargs)
+
+        Raises:
+            queue.Full: ถ้า queue เต็มเกิน submit_timeout
+        """
+        if self._closed:
+            raise RuntimeError("Detector pool is shut down")
+        job_id = str(uuid.uuid4())
+        future = Future()
+        with self._lock:
+            self._futures[job_id] = future
+            if progress:
+                self._progress[job_id] = progress
+            if on_item:
+                self._items[job_id] = on_item
+        try:
+            self._jobs.put((job_id, method, args, kwargs, progress is not None, on_item is not None,
+                            self.ocr_stats.snapshot()),
+                           timeout=self.submit_timeout)
+        except queue.Full:
+            with self._lock:
+                self._futures.pop(job_id, None)
+                self._progress.pop(job_id, None)
+                self._items.pop(job_id, None)
+            raise
+        return future
+
+    def process_image(self, image_path, output_folder=None, progress=None, encode_image=False, timeout=None,
+                      mode='single'):
+        """เหมือน ImageDetector.process_image แต่ทำใน worker process"""
+        return self.submit('process_image', image_path, output_folder, progress=progress,
+                           encode_image=encode_image, mode=mode).result(timeout)
+
+    def process_images(self, images, output_folder=None, batch_size=8, encode_image=False, timeout=None,
+                       mode='single'):
+        """เหมือน ImageDetector.process_images แต่ทำใน worker process (คืนเป็น list)"""
+        return self.submit('process_images', list(images), output_folder, batch_size,
+                           encode_image=encode_image, mode=mode).result(timeout)
+
+    def iter_process_images(self, images, output_folder=None, batch_size=8, encode_image=False, mode='single'):
+        """
+        เหมือน process_images แต่คืนผลลัพธ์ทีละภาพทันทีที่ worker ทำเสร็จ
+        (ภาพแรกของ batch ไม่ต้องรอ OCR ของภาพที่เหลือ)
+
+        Yields:
+            dict: ผลลัพธ์ของแต่ละภาพตามลำดับ
+        """
+        images = list(images)
+        items = queue.Queue()
+        future = self.submit('process_images', images, output_folder, batch_size, encode_image=encode_image,
+                             mode=mode, on_item=lambda index, result: items.put(result))
+        received = 0
+        while received < len(images):
+            try:
+                result = items.get(timeout=1)
+            except queue.Empty:
+                if future.done() and items.empty():
+                    # worker จบงานแล้วแต่ผลลัพธ์ไม่ครบ - error จาก worker (ถ้ามี) จะถูก raise ที่นี่
+                    future.result()
+                    raise RuntimeError("Detector worker returned fewer results than images")
+                continue
+            received += 1
+            yield result
+
+    def get_ocr_stats(self):
+        """สถิติ OCR รวมของทุก worker"""
+        return self.ocr_stats.summary(
+            self.models_config.get('ocr_prune', False),
+            self.models_config.get('ocr_prune_threshold', 0.01),
+            self.models_config.get('ocr_prune_min_runs', 200))
+
+    def get_status(self):
+        """สถานะของ pool สำหรับการตรวจสอบ"""
+        with self._lock:
+            return {
+                'workers': len(self._workers),
+                'busy_workers': len(self._running),
+                'pending_jobs': len(self._futures),
+            }
+
+    def shutdown(self, timeout=10):
+        """หยุด worker ทั้งหมด"""
+        self._closed = True
+        for _ in list(self._workers):
+            try:
+                self._jobs.put_nowait(None)
+            except queue.Full:
+                break
+        deadline = time.time() + timeout
+        for process in list(self._workers.values()):
+            process.join(timeout=max(0, deadline - time.time()))
+            if process.is_alive():
+                process.terminate()
+        self.ocr_stats.save()
+
+
+class InProcessDetector:
+    """
+    ใช้ ImageDetector ตัวเดียวใน process หลัก โดยป้องกันการเรียกใช้โมเดลพร้อมกันหลาย thread
+    (มี interface เดียวกับ DetectorPool)
+    """
+
+    def __init__(self, models_config):
+        from detector import ImageDetector
+
+        self.detector = ImageDetector(models_config)
+        self.ocr_stats = self.detector.ocr_stats
+        self._lock = threading.Lock()
+
+    def process_image(self, image_path, output_folder=None, progress=None, encode_image=False, timeout=None,
+                      mode='single'):
+        with self._lock:
+            return self.detector.process_image(image_path, output_folder, progress, encode_image, mode)
+
+    def process_images(self, images, output_folder=None, batch_size=8, encode_image=False, timeout=None,
+                       mode='single'):
+        with self._lock:
+            return list(self.detector.process_images(images, output_folder, batch_size, encode_image, mode))
+
+    def iter_process_images(self, images, output_folder=None, batch_size=8, encode_image=False, mode='single'):
+        """เหมือน process_images แต่คืนผลลัพธ์ทีละภาพทันทีที่เสร็จ"""
+        with self._lock:
+            yield from self.detector.process_images(images, output_folder, batch_size, encode_image, mode)
+
+    def get_ocr_stats(self):
+        return self.detector.get_ocr_stats()
+
+    def get_status(self):
+        return {'workers': 0, 'busy_workers': int(self._lock.locked()), 'pending_jobs': None}
+
+    def shutdown(self, timeout=10):
+        self.ocr_stats.save()
@@ -0,0 +1,38 @@
+# export_models.py - export โมเดล YOLO และ recognizer ของ EasyOCR สำหรับ backend ONNX Runtime / OpenVINO
+import os
+import argparse
+import easyocr
+from inference_backends import BACKENDS, PRECISIONS, export_yolo, export_recognizer
+
+def main():
+    """
+    ตัวอย่าง:
+        python export_models.py --backend onnx --precision int8
+        python export_models.py --backend openvino --precision fp16
+    """
+    parser = argparse.ArgumentParser(description='Export models for CPU inference backends')
+    parser.add_argument('--model', default='bestMR.pt', help='โมเดล YOLO (.pt)')
+    parser.add_argument('--backend', choices=[b for b in BACKENDS if b != 'torch'], default='onnx')
+    parser.add_argument('--precision', choices=PRECISIONS, default='fp32')
+    parser.add_argument('--output-dir', default=None, help='โฟลเดอร์สำหรับ recognizer (ค่าเริ่มต้น: โฟลเดอร์เดียวกับโมเดล)')
+    parser.add_argument('--data', default=None, help='dataset yaml สำหรับ calibrate INT8 ของ OpenVINO')
+    parser.add_argument('--imgsz', type=int, default=640)
+    args = parser.parse_args()
+
+    models_dir = args.output_dir or os.path.dirname(args.model) or '.'
+    os.makedirs(models_dir, exist_ok=True)
+
+    # 1. YOLO
+    print(f"กำลัง export YOLO ({args.backend}, {args.precision})...")
+    export_yolo(args.model, args.backend, args.precision, data=args.data, imgsz=args.imgsz)
+
+    # 2. Recognizer ของ EasyOCR (ใช้ไฟล์ ONNX ทั้งกับ ONNX Runtime และ OpenVINO)
+    print("กำลัง export EasyOCR recognizer...")
+    reader = easyocr.Reader(['en'], gpu=False, quantize=False, detector=False)
+    export_recognizer(reader, models_dir, args.precision)
+
+    print("✅ Export เสร็จสิ้น - ตั้งค่า models_config: "
+          f"{{'backend': '{args.backend}', 'precision': '{args.precision}'}}")
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,53 @@
 # google_api_client.py - Google API Client และ Resource Management
 from google.oauth2.credentials import Credentials
 from google.oauth2.service_account import Credentials as ServiceAccountCredentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
 from googleapiclient.errors import HttpError
+from google.auth.exceptions import RefreshError
 from flask import session
+import io
 import os
+import re
+import json
 import time
-from google.auth.transport.requests import Request
+import threading
+from google_transport import AuthorizedTransport, auth_request
+from credential_manager import credential_manager
+
+# discovery document ที่แยกวิเคราะห์แล้ว (api, version) -> dict ใช้ร่วมกันทั้ง process
+_discovery_documents = {}
+_discovery_lock = threading.Lock()
+
+def load_discovery_document(api, version):
+    """
+    โหลด discovery document แบบ static ที่มากับ google-api-python-client ครั้งเดียวต่อ process
+
+    Returns:
+        dict: discovery document หรือ None ถ้าไม่มีไฟล์ static
+    """
+    key = (api, version)
+    with _discovery_lock:
+        if key not in _discovery_documents:
+            try:
+                from googleapiclient.discovery_cache import get_static_doc
+                content = get_static_doc(api, version)
+                _discovery_documents[key] = json.loads(content) if content else None
+            except Exception as e:
+                print(f"Warning: Could not load static discovery document for {api} {version}: {e}")
+                _discovery_documents[key] = None
+        return _discovery_documents[key]
+
+def build_service(api, version, credentials):
+    """
+    สร้าง service object จาก discovery document ที่แคชไว้ (ไม่ต้องโหลดและแยกวิเคราะห์ใหม่ทุกครั้ง)
+    ทุก request ส่งผ่าน connection pool แบบ keep-alive ที่ใช้ร่วมกัน (google_transport)
+    """
+    http = AuthorizedTransport(credentials)
+    document = load_discovery_document(api, version)
+    if document is None:
+        return build(api, version, http=http)
+    return build_from_document(document, http=http)
 
 class GoogleAPIClient:
     """
@@ -15,23 +55,33 @@ class GoogleAPIClient:
     รองรับทั้งการเชื่อมต่อแบบ Service Account และ OAuth พร้อม Auto Token Refresh
     """
     
-    def __init__(self, credentials_file=None, oauth_credentials=None):
+    def __init__(self, credentials_file=None, oauth_credentials=None, owner=None):
         """
         กำหนดค่าเริ่มต้นสำหรับ Google API Client
         
         Args:
             credentials_file (str, optional): ไฟล์ Service Account credentials
             oauth_credentials (dict, optional): OAuth credentials จาก session
+            owner (str, optional): email ของผู้ใช้ - ถ้าระบุจะใช้ credentials จาก credential_manager
+                (ต่ออายุแบบ single-flight ร่วมกับ request อื่นของผู้ใช้คนเดียวกัน)
         """
         self.drive_service = None
         self.sheets_service = None
         self.credentials = None
         self.oauth_credentials_dict = oauth_credentials
+        self.owner = owner
+        # client ถูกใช้ร่วมกันจาก client pool - lock เฉพาะตอนเปลี่ยน/ต่ออายุ credentials และสร้าง services
+        # ส่วนการเรียก API ทำพร้อมกันได้ (AuthorizedTransport ส่งผ่าน connection pool ของ requests/urllib3
+        # ที่ thread-safe) งานอัปโหลดของผู้ใช้คนเดียวกันจึงไม่ต้องต่อคิวกัน
+        self._lock = threading.RLock()
         
         # ตรวจสอบว่าจะใช้ OAuth หรือ Service Account
         if oauth_credentials:
             try:
-                self.credentials = Credentials(**oauth_credentials)
+                if owner:
+                    self.credentials = credential_manager.get(owner, oauth_credentials)
+                else:
+                    self.credentials = Credentials(**oauth_credentials)
                 self._ensure_valid_credentials()
                 self._build_services()
             except Exception as e:
@@ -68,41 +118,70 @@ class GoogleAPIClient:
             # ตรวจสอบว่า credentials หมดอายุหรือไม่
             if self.credentials.expired and self.credentials.refresh_token:
                 print("🔄 Token is expired, refreshing...")
-                self.credentials.refresh(Request())
-                
-                # อัปเดต oauth_credentials_dict ด้วยข้อมูลใหม่
-                if self.oauth_credentials_dict:
-                    self.oauth_credentials_dict.update({
-                        'token': self.credentials.token,
-                        'refresh_token': self.credentials.refresh_token,
-                        'token_uri': self.credentials.token_uri,
-                        'client_id': self.credentials.client_id,
-                        'client_secret': self.credentials.client_secret,
-                        'scopes': self.credentials.scopes
-                    })
-                
+                self._refresh_credentials()
                 print("Credentials refreshed successfully")
                 return True
             elif not self.credentials.valid:
                 print("❌ Token is invalid but cannot refresh")
-                return False
+                raise RefreshError("Token is invalid and has no refresh token")
             # else:
             #     print("✅ Token is still valid, no refresh needed")
             
             return True
             
+        except RefreshError:
+            # ผู้ใช้ต้องเข้าสู่ระบบใหม่ - ให้ผู้เรียกแยกจาก error ชั่วคราว (เช่น เครือข่าย) ได้
+            raise
         except Exception as e:
             print(f"Error ensuring valid credentials: {e}")
             return False
     
+    def _refresh_credentials(self):
+        """
+        ต่ออายุ token ใน credentials object เดิม (services ที่สร้างไว้ใช้ object เดียวกันจึงไม่ต้องสร้างใหม่)
+        """
+        if self.owner:
+            # ถ้า request อื่นของผู้ใช้ต่ออายุไปแล้วระหว่างรอ จะได้ token ใหม่โดยไม่ต่อซ้ำ
+            credentials = credential_manager.refresh(self.owner, stale_token=self.credentials.token)
+            if credentials is not None and credentials is not self.credentials:
+                self.credentials = credentials
+                self._build_services()
+        else:
+            self.credentials.refresh(auth_request())
+        self._sync_credentials_dict()
+    
+    def _sync_credentials_dict(self):
+        """อัปเดต oauth_credentials_dict ด้วยข้อมูลใหม่"""
+        if self.oauth_credentials_dict is not None and self.credentials:
+            self.oauth_credentials_dict.update(credential_manager.to_dict(self.credentials))
+    
+    def update_credentials(self, oauth_credentials):
+        """
+        ใช้ credentials ล่าสุดของผู้ใช้กับ client ที่อยู่ใน pool โดยไม่สร้าง services ใหม่
+        (credential_manager ไม่สนใจ token เก่าที่เคยต่ออายุไปแล้ว เช่น token จาก session ที่ยังไม่อัปเดต)
+        
+        Args:
+            oauth_credentials (dict): OAuth credentials จาก session
+        """
+        with self._lock:
+            credentials = credential_manager.get(self.owner, oauth_credentials) if self.owner \
+                else Credentials(**oauth_credentials)
+            if credentials is None:
+                return
+            if credentials is not self.credentials:
+                # ผู้ใช้เข้าสู่ระบบใหม่ - services สร้างจาก discovery document ที่แคชไว้
+                self.credentials = credentials
+                self._build_services()
+            self._sync_credentials_dict()
+    
     def _build_services(self):
         """
         สร้าง Google API services
         """
         try:
             if self.credentials:
-                self.drive_service = build('drive', 'v3', credentials=self.credentials)
-                self.sheets_service = build('sheets', 'v4', credentials=self.credentials)
+                self.drive_service = build_service('drive', 'v3', self.credentials)
+                self.sheets_service = build_service('sheets', 'v4', self.credentials)
         except Exception as e:
             print(f"Error building Google API services: {e}")
     
@@ -119,15 +198,16 @@ class GoogleAPIClient:
         """
         for attempt in range(max_retries):
             try:
-                # ตรวจสอบ credentials ก่อนเรียก API
-                if not self._ensure_valid_credentials():
-                    raise Exception("Cannot ensure valid credentials")
-                
-                # Rebuild services if needed
-                if not self.drive_service or not self.sheets_service:
-                    self._build_services()
+                with self._lock:
+                    # ตรวจสอบ credentials ก่อนเรียก API
+                    if not self._ensure_valid_credentials():
+                        raise Exception("Cannot ensure valid credentials")
+                    
+                    # Rebuild services if needed
+                    if not self.drive_service or not self.sheets_service:
+                        self._build_services()
                 
-                # เรียก API
+                # เรียก API นอก lock (เช่น อัปโหลดไฟล์ขนาดใหญ่ไม่บล็อก request อื่นของผู้ใช้คนเดียวกัน)
                 return api_call()
                 
             except HttpError as http_error:
@@ -140,8 +220,8 @@ class GoogleAPIClient:
                     # พยายามต่ออายุ credentials
                     if self.credentials and self.credentials.refresh_token:
                         try:
-                            self.credentials.refresh(Request())
-                            self._build_services()
+                            with self._lock:
+                                self._refresh_credentials()
                             print("Credentials refreshed, retrying...")
                             continue
                         except Exception as refresh_error:
@@ -168,7 +248,7 @@ class GoogleAPIClient:
         อัปโหลดไฟล์ไปยัง Google Drive พร้อม Auto Retry
         
         Args:
-            file_path (str): เส้นทางไฟล์ที่จะอัปโหลด
+            file_path (str | bytes): เส้นทางไฟล์ที่จะอัปโหลด หรือข้อมูลภาพ JPEG ในหน่วยความจำ
             folder_id (str): ID ของโฟลเดอร์ใน Google Drive
             file_name (str, optional): ชื่อไฟล์ที่ต้องการ (ถ้าไม่ระบุจะใช้ชื่อจากไฟล์)
             
@@ -179,13 +259,19 @@ class GoogleAPIClient:
             raise Exception("Google Drive Service is not initialized")
         
         def _upload():
-            actual_file_name = file_name or os.path.basename(file_path)
+            if isinstance(file_path, (bytes, bytearray)):
+                # อัปโหลดจากหน่วยความจำโดยตรง (ไม่ต้องเขียนไฟล์ชั่วคราว)
+                actual_file_name = file_name or 'image.jpg'
+                media = MediaIoBaseUpload(io.BytesIO(file_path), mimetype='image/jpeg', resumable=True)
+            else:
+                actual_file_name = file_name or os.path.basename(file_path)
+                media = MediaFileUpload(file_path, resumable=True)
+            
             file_metadata = {
                 'name': actual_file_name,
                 'parents': [folder_id]
             }
             
-            media = MediaFileUpload(file_path, resumable=True)
             file = self.drive_service.files().create(
                 body=file_metadata,
                 media_body=media,
@@ -198,61 +284,68 @@ class GoogleAPIClient:
     
     def save_to_sheets(self, spreadsheet_id, values, session_data=None):
         """
-        บันทึกข้อมูลลงใน Google Sheets โดยใช้ Grid API พร้อม Auto Retry
+        เพิ่มแถวข้อมูลต่อท้ายชีตใน Google Sheets ด้วย request เดียว พร้อม Auto Retry
+        (ไม่ต้องอ่านคอลัมน์ A ทั้งคอลัมน์เพื่อหาแถวว่าง)
         
         Args:
             spreadsheet_id (str): ID ของ Spreadsheet
             values (list): ข้อมูลที่จะบันทึก
-            session_data (dict, optional): ข้อมูล session ที่มี data_sheet_id
+            session_data (dict, optional): ข้อมูล session ที่มี data_sheet_id / data_sheet_title
+                (ถ้าต้องค้นหาชีตเอง จะเก็บผลลงใน session_data เพื่อใช้ครั้งต่อไป)
+            
+        Returns:
+            dict: ผลลัพธ์การบันทึก (มี 'row_number' ถ้าทราบตำแหน่งแถว)
+        """
+        result = self.append_rows(spreadsheet_id, [values], session_data)
+        result['row_number'] = result['row_numbers'][0] if result.get('row_numbers') else None
+        return result
+    
+    def append_rows(self, spreadsheet_id, rows, session_data=None):
+        """
+        เพิ่มหลายแถวต่อท้ายชีตใน request เดียว พร้อม Auto Retry
+        
+        Args:
+            spreadsheet_id (str): ID ของ Spreadsheet
+            rows (list): รายการแถวข้อมูล (list ของ list)
+            session_data (dict, optional): ข้อมูล session ที่มี data_sheet_id / data_sheet_title
+                (ถ้าต้องค้นหาชีตเอง จะเก็บผลลงใน session_data เพื่อใช้ครั้งต่อไป)
             
         Returns:
-            dict: ผลลัพธ์การบันทึก
+            dict: ผลลัพธ์การบันทึก (มี 'row_numbers' ถ้าทราบตำแหน่งแถว มิฉะนั้น None)
         """
         if not self.sheets_service:
             raise Exception("Google Sheets Service is not initialized")
         
-        def _save_to_sheets():
+        values = [[str(value) for value in row] for row in rows]
+        
+        def _append_rows():
             try:
-                # 1. ดึง data_sheet_id จาก session_data ถ้ามี
+                # 1. ดึง data_sheet_id / data_sheet_title จาก session_data ถ้ามี
                 data_sheet_id = None
+                data_sheet_title = None
                 if session_data:
                     data_sheet_id = session_data.get('data_sheet_id')
+                    data_sheet_title = session_data.get('data_sheet_title')
                 
-                # 2. ถ้าไม่มี data_sheet_id ในเซสชัน ให้ดึงข้อมูลชีตเอง
-                if not data_sheet_id:
-                    # ดึงข้อมูลของ spreadsheet เพื่อหา sheet ID ของชีตแรก
-                    sheet_metadata = self.sheets_service.spreadsheets().get(
-                        spreadsheetId=spreadsheet_id
-                    ).execute()
-                    
-                    # ใช้ชีตแรกถ้าไม่สามารถหา data_sheet_id ได้
-                    if sheet_metadata.get('sheets'):
-                        data_sheet_id = sheet_metadata.get('sheets')[0].get('properties', {}).get('sheetId')
+                # 2. ถ้าไม่รู้จักชีตเลย ให้ดึงข้อมูลชีตครั้งเดียวแล้วเก็บไว้ใน session_data
+                if data_sheet_id is None and not data_sheet_title:
+                    data_sheet_id, data_sheet_title = self.find_data_sheet(spreadsheet_id)
+                    if session_data is not None and data_sheet_id is not None:
+                        session_data['data_sheet_id'] = data_sheet_id
+                        session_data['data_sheet_title'] = data_sheet_title
                 
-                # 3. หาแถวว่างถัดไปโดยดูจำนวนข้อมูลในคอลัมน์ A
-                result = self.sheets_service.spreadsheets().values().get(
-                    spreadsheetId=spreadsheet_id,
-                    range="A:A"
-                ).execute()
-                
-                values_list = result.get('values', [])
-                next_row = len(values_list) + 1
-                
-                # 4. ถ้ามี data_sheet_id ให้ใช้ Grid API (batchUpdate)
-                if data_sheet_id:
+                # 3. รู้แค่ sheetId: appendCells ของ Grid API (ไม่คืนตำแหน่งแถว)
+                if data_sheet_id is not None and not data_sheet_title:
                     update_body = {
                         "requests": [
                             {
-                                "updateCells": {
-                                    "start": {
-                                        "sheetId": data_sheet_id,
-                                        "rowIndex": next_row - 1,  # row indices are 0-based
-                                        "columnIndex": 0
-                                    },
+                                "appendCells": {
+                                    "sheetId": data_sheet_id,
                                     "rows": [
                                         {
-                                            "values": [{"userEnteredValue": {"stringValue": str(value)}} for value in values]
+                                            "values": [{"userEnteredValue": {"stringValue": value}} for value in row]
                                         }
+                                        for row in values
                                     ],
                                     "fields": "userEnteredValue"
                                 }
@@ -265,28 +358,102 @@ class GoogleAPIClient:
                         body=update_body
                     ).execute()
                     
+                    result['row_numbers'] = None
                     return result
                 
-                # 5. ถ้าไม่มี data_sheet_id ให้ใช้วิธี A1 notation
-                else:
-                    body = {
-                        'values': [values]
-                    }
-                    
-                    result = self.sheets_service.spreadsheets().values().update(
-                        spreadsheetId=spreadsheet_id,
-                        range=f"A{next_row}",
-                        valueInputOption='RAW',
-                        body=body
-                    ).execute()
-                    
-                    return result
+                # 4. values().append (คืนตำแหน่งแถวที่เพิ่มใน updatedRange)
+                # ถ้าไม่พบชีต - ต่อท้ายชีตแรกด้วย A1 notation
+                sheet_range = f"{self.quote_sheet_title(data_sheet_title)}!A:I" if data_sheet_title else "A:I"
+                result = self.sheets_service.spreadsheets().values().append(
+                    spreadsheetId=spreadsheet_id,
+                    range=sheet_range,
+                    valueInputOption='RAW',
+                    insertDataOption='INSERT_ROWS',
+                    body={'values': values}
+                ).execute()
+                
+                updated_range = result.get('updates', {}).get('updatedRange', '')
+                match = re.search(r'!\D*(\d+)', updated_range)
+                first_row = int(match.group(1)) if match else None
+                result['row_numbers'] = list(range(first_row, first_row + len(values))) if first_row else None
+                return result
                     
             except Exception as e:
                 print(f"Error saving to sheets: {e}")
                 raise Exception(f"Failed to save data to sheets: {str(e)}")
         
-        return self._execute_with_retry(_save_to_sheets)
+        return self._execute_with_retry(_append_rows)
+    
+    def find_data_sheet(self, spreadsheet_id):
+        """
+        หาชีตข้อมูล (ชีตชื่อ Data หรือชีตแรก) ของ Spreadsheet
+        
+        Returns:
+            tuple: (sheetId, title) หรือ (None, None) ถ้าไม่พบ
+        """
+        sheet_metadata = self.sheets_service.spreadsheets().get(
+            spreadsheetId=spreadsheet_id,
+            fields='sheets.properties(sheetId,title)'
+        ).execute()
+        
+        sheets = [sheet.get('properties', {}) for sheet in sheet_metadata.get('sheets', [])]
+        for properties in sheets:
+            if properties.get('title') == 'Data':
+                return properties.get('sheetId'), properties.get('title')
+        if sheets:
+            return sheets[0].get('sheetId'), sheets[0].get('title')
+        return None, None
+    
+    @staticmethod
+    def quote_sheet_title(title):
+        """ใส่เครื่องหมายคำพูดให้ชื่อชีตสำหรับ A1 notation"""
+        return "'" + title.replace("'", "''") + "'"
+    
+    def update_sheet_cell(self, spreadsheet_id, data_sheet_id, row_number, column_index, value):
+        """
+        แก้ไขค่าของเซลล์เดียวในแถวที่บันทึกไว้แล้ว (เช่น เติมลิงก์รูปภาพภายหลัง) พร้อม Auto Retry
+        
+        Args:
+            spreadsheet_id (str): ID ของ Spreadsheet
+            data_sheet_id (int, optional): sheetId ของชีตข้อมูล (None = ใช้ A1 notation กับชีตแรก)
+            row_number (int): หมายเลขแถว (เริ่มที่ 1)
+            column_index (int): ตำแหน่งคอลัมน์ (เริ่มที่ 0)
+            value (str): ค่าใหม่
+        """
+        if not self.sheets_service:
+            raise Exception("Google Sheets Service is not initialized")
+        
+        def _update_cell():
+            if data_sheet_id is not None:
+                body = {
+                    "requests": [
+                        {
+                            "updateCells": {
+                                "start": {
+                                    "sheetId": data_sheet_id,
+                                    "rowIndex": row_number - 1,
+                                    "columnIndex": column_index
+                                },
+                                "rows": [{"values": [{"userEnteredValue": {"stringValue": str(value)}}]}],
+                                "fields": "userEnteredValue"
+                            }
+                        }
+                    ]
+                }
+                return self.sheets_service.spreadsheets().batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body=body
+                ).execute()
+            
+            column_letter = chr(ord('A') + column_index)
+            return self.sheets_service.spreadsheets().values().update(
+                spreadsheetId=spreadsheet_id,
+                range=f"{column_letter}{row_number}",
+                valueInputOption='RAW',
+                body={'values': [[value]]}
+            ).execute()
+        
+        return self._execute_with_retry(_update_cell)
     
     def get_file_web_link(self, file_id):
         """
@@ -311,6 +478,129 @@ class GoogleAPIClient:
         
         return self._execute_with_retry(_get_link)
         
+    def resolve_user_resources(self):
+        """
+        ค้นหา (หรือสร้าง) โฟลเดอร์ RoomMeterApp, โฟลเดอร์ย่อย RoomMeterPhoto และ Spreadsheet RoomMeterData
+        การค้นหาทั้งสามรายการรวมอยู่ใน batch request เดียว และสร้างเฉพาะรายการที่ยังไม่มี
+        
+        Returns:
+            dict: folder_id, photo_folder_id, sheet_id, data_sheet_id, data_sheet_title
+        """
+        folder_mime = 'application/vnd.google-apps.folder'
+        queries = {
+            'app': f"name='RoomMeterApp' and mimeType='{folder_mime}' and trashed=false",
+            'photo': f"name='RoomMeterPhoto' and mimeType='{folder_mime}' and trashed=false",
+            'data': "name='RoomMeterData' and mimeType='application/vnd.google-apps.spreadsheet' and trashed=false"
+        }
+        found = {}
+        errors = []
+        
+        def _collect(request_id, response, exception):
+            if exception is not None:
+                errors.append(exception)
+            else:
+                found[request_id] = response.get('files', [])
+        
+        def _lookup():
+            found.clear()
+            errors.clear()
+            batch = self.drive_service.new_batch_http_request(callback=_collect)
+            for request_id, query in queries.items():
+                batch.add(self.drive_service.files().list(
+                    q=query,
+                    spaces='drive',
+                    fields='files(id, name, parents)'
+                ), request_id=request_id)
+            batch.execute()
+            if errors:
+                raise errors[0]
+        
+        print("Searching for RoomMeterApp resources (batched)")
+        self._execute_with_retry(_lookup)
+        
+        def _create(metadata):
+            return self._execute_with_retry(
+                lambda: self.drive_service.files().create(body=metadata, fields='id').execute()).get('id')
+        
+        # โฟลเดอร์ "RoomMeterApp"
+        items = found.get('app', [])
+        if items:
+            folder_id = items[0]['id']
+            print(f"Found existing folder with ID: {folder_id}")
+        else:
+            print("Creating new RoomMeterApp folder")
+            folder_id = _create({'name': 'RoomMeterApp', 'mimeType': folder_mime})
+            print(f"Created folder with ID: {folder_id}")
+        
+        def _child_of_app(items):
+            return next((item['id'] for item in items if folder_id in item.get('parents', [])), None)
+        
+        # โฟลเดอร์ "RoomMeterPhoto" ภายใน "RoomMeterApp"
+        photo_folder_id = _child_of_app(found.get('photo', []))
+        if photo_folder_id:
+            print(f"Found existing photo folder with ID: {photo_folder_id}")
+        else:
+            print("Creating new RoomMeterPhoto subfolder")
+            photo_folder_id = _create({'name': 'RoomMeterPhoto', 'mimeType': folder_mime, 'parents': [folder_id]})
+            print(f"Created photo folder with ID: {photo_folder_id}")
+        
+        # Sheets "RoomMeterData" ในโฟลเดอร์
+        sheet_id = _child_of_app(found.get('data', []))
+        if sheet_id:
+            print(f"Found existing spreadsheet with ID: {sheet_id}")
+            data_sheet_id, data_sheet_title = self._execute_with_retry(lambda: self.find_data_sheet(sheet_id))
+        else:
+            print("Creating new RoomMeterData spreadsheet")
+            sheet_id = _create({
+                'name': 'RoomMeterData',
+                'mimeType': 'application/vnd.google-apps.spreadsheet',
+                'parents': [folder_id]
+            })
+            print(f"Created spreadsheet with ID: {sheet_id}")
+            
+            # สร้างชีทใหม่ที่มีชื่อชัดเจน (sheetId อยู่ในผลลัพธ์ของ addSheet ไม่ต้องดึงข้อมูลชีตอีก)
+            body = {
+                'requests': [
+                    {
+                        'addSheet': {
+                            'properties': {
+                                'title': 'Data',
+                                'index': 0
+                            }
+                        }
+                    }
+                ]
+            }
+            reply = self._execute_with_retry(lambda: self.sheets_service.spreadsheets().batchUpdate(
+                spreadsheetId=sheet_id,
+                body=body
+            ).execute())
+            data_sheet_id = reply['replies'][0]['addSheet']['properties']['sheetId']
+            data_sheet_title = 'Data'
+            
+            # สร้างคอลัมน์หัวตาราง
+            try:
+                print("Adding header row to spreadsheet")
+                headers = [['วันที่เวลา', 'เลขห้อง', 'สถานะเลขห้อง', 'เลขมิเตอร์', 'สถานะเลขมิเตอร์', 
+                          'เลขทศนิยม', 'สถานะเลขทศนิยม', 'เลขมิเตอร์เต็ม', 'ลิงก์รูปภาพ']]
+                self.sheets_service.spreadsheets().values().update(
+                    spreadsheetId=sheet_id,
+                    range="Data!A1:I1",
+                    valueInputOption='RAW',
+                    body={'values': headers}
+                ).execute()
+                print("Successfully added header row")
+            except Exception as header_error:
+                print(f"Error adding header row: {header_error}")
+        
+        return {
+            'folder_id': folder_id,
+            'photo_folder_id': photo_folder_id,
+            'sheet_id': sheet_id,
+            'data_sheet_id': data_sheet_id,
+            'data_sheet_title': data_sheet_title
+        }
+    
     def get_folder_web_link(self, folder_id):
         """
         ดึงลิงก์สำหรับเปิดโฟลเดอร์บนเว็บ
@@ -331,42 +621,45 @@ class GoogleAPIClient:
             dict: credentials ที่อัปเดตแล้ว
         """
         if self.oauth_credentials_dict and self.credentials:
+            # token อาจถูกต่ออายุโดย transport หรือ credential_manager (background) หลังสร้าง client
+            if self.credentials.token and self.oauth_credentials_dict.get('token') != self.credentials.token:
+                self._sync_credentials_dict()
             return self.oauth_credentials_dict
         return None
 
 # ฟังก์ชันระดับ module ที่ย้ายมาจาก google_auth.py
 
 def get_drive_service():
-    """สร้าง Drive service จาก credentials"""
+    """Drive service ของผู้ใช้ใน session (ใช้ client จาก client pool)"""
     from google_auth import get_valid_credentials
+    from google_client_pool import client_pool
     
-    credentials = get_valid_credentials()
-    if not credentials:
+    if not get_valid_credentials():
         return None
     
     try:
-        return build('drive', 'v3', credentials=credentials)
+        return client_pool.get(session.get('user_email'), session['credentials']).drive_service
     except Exception as e:
         print(f"Error creating Drive service: {e}")
         return None
 
 def get_sheets_service():
-    """สร้าง Sheets service จาก credentials"""
+    """Sheets service ของผู้ใช้ใน session (ใช้ client จาก client pool)"""
     from google_auth import get_valid_credentials
+    from google_client_pool import client_pool
     
-    credentials = get_valid_credentials()
-    if not credentials:
+    if not get_valid_credentials():
         return None
     
     try:
-        return build('sheets', 'v4', credentials=credentials)
+        return client_pool.get(session.get('user_email'), session['credentials']).sheets_service
     except Exception as e:
         print(f"Error creating Sheets service: {e}")
         return None
 
 def create_user_resources(user_email):
     """
-    สร้างโฟลเดอร์และ Sheets สำหรับผู้ใช้
+    หาโฟลเดอร์และ Sheets ของผู้ใช้ (ใช้ค่าจากแคชถ้ามี มิฉะนั้นค้นหา / สร้างใหม่) แล้วเก็บลง session
     
     Args:
         user_email (str): อีเมลของผู้ใช้
@@ -374,184 +667,47 @@ def create_user_resources(user_email):
     Returns:
         tuple: (folder_id, sheet_id)
     """
-    drive_service = get_drive_service()
-    sheets_service = get_sheets_service()
+    from resource_cache import resource_cache
     
-    if not drive_service or not sheets_service:
-        print("Error: Drive or Sheets service is not initialized")
-        return None, None
-    
-    # ตรวจสอบว่ามีโฟลเดอร์ "RoomMeterApp" หรือไม่
-    try:
-        print(f"Searching for RoomMeterApp folder for user {user_email}")
-        results = drive_service.files().list(
-            q="name='RoomMeterApp' and mimeType='application/vnd.google-apps.folder' and trashed=false",
-            spaces='drive',
-            fields='files(id, name)'
-        ).execute()
-        
-        folder_id = None
-        items = results.get('files', [])
-        
-        if not items:
-            print("Creating new RoomMeterApp folder")
-            # สร้างโฟลเดอร์ใหม่
-            folder_metadata = {
-                'name': 'RoomMeterApp',
-                'mimeType': 'application/vnd.google-apps.folder'
-            }
-            folder = drive_service.files().create(body=folder_metadata, fields='id').execute()
-            folder_id = folder.get('id')
-            print(f"Created folder with ID: {folder_id}")
-        else:
-            folder_id = items[0]['id']
-            print(f"Found existing folder with ID: {folder_id}")
-        
-        # สร้างโฟลเดอร์ "RoomMeterPhoto" ภายใน "RoomMeterApp"
-        photo_folder_id = None
-        print("Searching for RoomMeterPhoto subfolder")
-        results = drive_service.files().list(
-            q=f"name='RoomMeterPhoto' and mimeType='application/vnd.google-apps.folder' and '{folder_id}' in parents and trashed=false",
-            spaces='drive',
-            fields='files(id, name)'
-        ).execute()
-        
-        items = results.get('files', [])
-        
-        if not items:
-            print("Creating new RoomMeterPhoto subfolder")
-            # สร้างโฟลเดอร์ย่อยใหม่
-            photo_folder_metadata = {
-                'name': 'RoomMeterPhoto',
-                'mimeType': 'application/vnd.google-apps.folder',
-                'parents': [folder_id]
-            }
-            photo_folder = drive_service.files().create(body=photo_folder_metadata, fields='id').execute()
-            photo_folder_id = photo_folder.get('id')
-            print(f"Created photo folder with ID: {photo_folder_id}")
-        else:
-            photo_folder_id = items[0]['id']
-            print(f"Found existing photo folder with ID: {photo_folder_id}")
-        
-        # ตรวจสอบว่ามี Sheets "RoomMeterData" ในโฟลเดอร์หรือไม่
-        sheet_id = None
-        print("Searching for RoomMeterData spreadsheet")
-        results = drive_service.files().list(
-            q=f"name='RoomMeterData' and mimeType='application/vnd.google-apps.spreadsheet' and '{folder_id}' in parents and trashed=false",
-            spaces='drive',
-            fields='files(id, name)'
-        ).execute()
+    # ล็อกอินครั้งถัดไปไม่ต้องเรียก API - ถ้าโฟลเดอร์ถูกลบ API จะตอบ 404 แล้วค่อยค้นหาใหม่
+    resources = resource_cache.lookup(user_email)
+    if resources:
+        print(f"Using cached resources for {user_email}")
+    else:
+        from google_client_pool import client_pool
         
-        items = results.get('files', [])
-        
-        if not items:
-            print("Creating new RoomMeterData spreadsheet")
-            # สร้าง Sheets ใหม่
-            sheet_metadata = {
-                'name': 'RoomMeterData',
-                'mimeType': 'application/vnd.google-apps.spreadsheet',
-                'parents': [folder_id]
-            }
-            sheet = drive_service.files().create(body=sheet_metadata, fields='id').execute()
-            sheet_id = sheet.get('id')
-            print(f"Created spreadsheet with ID: {sheet_id}")
-            
-            # สร้างชีทใหม่ที่มีชื่อชัดเจน
-            body = {
-                'requests': [
-                    {
-                        'addSheet': {
-                            'properties': {
-                                'title': 'Data',
-                                'index': 0
-                            }
-                        }
-                    }
-                ]
-            }
-            
-            # เพิ่มชีทใหม่
-            sheets_service.spreadsheets().batchUpdate(
-                spreadsheetId=sheet_id,
-                body=body
-            ).execute()
-            
-            # ดึงข้อมูลชีตเพื่อเก็บ sheet ID
-            sheet_metadata = sheets_service.spreadsheets().get(
-                spreadsheetId=sheet_id
-            ).execute()
+        try:
+            google_client = client_pool.get(user_email, session['credentials'])
+            if not google_client.drive_service or not google_client.sheets_service:
+                print("Error: Drive or Sheets service is not initialized")
+                return None, None
             
-            # เก็บ sheet ID ของชีต Data
-            data_sheet_id = None
-            for sheet in sheet_metadata.get('sheets', []):
-                if sheet.get('properties', {}).get('title') == 'Data':
-                    data_sheet_id = sheet.get('properties', {}).get('sheetId')
-                    break
+            resources = google_client.resolve_user_resources()
+            resource_cache.put(user_email, resources)
+            resources = resource_cache.get(user_email)
             
-            # เก็บ sheet ID ลงใน session
-            if data_sheet_id is not None:
-                session['data_sheet_id'] = data_sheet_id
-                print(f"Saved Data sheet ID: {data_sheet_id}")
-            
-            # สร้างคอลัมน์หัวตาราง
-            try:
-                print("Adding header row to spreadsheet")
-                headers = [['วันที่เวลา', 'เลขห้อง', 'สถานะเลขห้อง', 'เลขมิเตอร์', 'สถานะเลขมิเตอร์', 
-                          'เลขทศนิยม', 'สถานะเลขทศนิยม', 'เลขมิเตอร์เต็ม', 'ลิงก์รูปภาพ']]
-                
-                # ใช้ Range โดยระบุเป็น A1 notation แบบมี sheet name
-                sheets_service.spreadsheets().values().update(
-                    spreadsheetId=sheet_id,
-                    range="Data!A1:I1",
-                    valueInputOption='RAW',
-                    body={'values': headers}
-                ).execute()
-                print("Successfully added header row")
-            except Exception as header_error:
-                print(f"Error adding header row: {header_error}")
+        except HttpError as http_error:
+            print(f"HTTP Error in create_user_resources: {http_error}")
+            # ถ้าเป็น error เกี่ยวกับ authorization ให้ลบ session และให้ login ใหม่
+            if http_error.resp.status in [401, 403]:
+                print("Authorization error detected, clearing session")
+                session.clear()
+            return None, None
+        except Exception as e:
+            print(f"Error in create_user_resources: {e}")
+            return None, None
+    
+    # บันทึกข้อมูลลงใน session
+    apply_resources_to_session(resources)
+    print("Saved folder and sheet IDs to session")
+    
+    return resources['folder_id'], resources['sheet_id']
 
+def apply_resources_to_session(resources):
+    """เก็บ ID ของโฟลเดอร์และ Sheets ลงใน session พร้อม version ของแคช"""
+    for key in ('folder_id', 'photo_folder_id', 'sheet_id', 'data_sheet_id', 'data_sheet_title'):
+        if resources.get(key) is not None:
+            session[key] = resources[key]
         else:
-            sheet_id = items[0]['id']
-            print(f"Found existing spreadsheet with ID: {sheet_id}")
-            
-            # ดึงข้อมูลชีตเพื่อเก็บ sheet ID
-            sheet_metadata = sheets_service.spreadsheets().get(
-                spreadsheetId=sheet_id
-            ).execute()
-            
-            # เก็บ sheet ID ของชีตแรก (ใช้ชีตแรกเป็นหลัก ไม่ว่าจะชื่ออะไร)
-            data_sheet_id = None
-            for sheet in sheet_metadata.get('sheets', []):
-                # ถ้ามีชีตชื่อ Data ให้ใช้ชีตนั้น
-                if sheet.get('properties', {}).get('title') == 'Data':
-                    data_sheet_id = sheet.get('properties', {}).get('sheetId')
-                    break
-                
-            # ถ้าไม่มีชีตชื่อ Data ให้ใช้ชีตแรก
-            if data_sheet_id is None and sheet_metadata.get('sheets'):
-                data_sheet_id = sheet_metadata.get('sheets')[0].get('properties', {}).get('sheetId')
-            
-            # เก็บ sheet ID ลงใน session
-            if data_sheet_id is not None:
-                session['data_sheet_id'] = data_sheet_id
-                print(f"Found and saved Data sheet ID: {data_sheet_id}")
-        
-        # บันทึกข้อมูลลงใน session
-        if 'session' in globals() or 'session' in locals():
-            session['folder_id'] = folder_id
-            session['photo_folder_id'] = photo_folder_id
-            session['sheet_id'] = sheet_id
-            print("Saved folder and sheet IDs to session")
-        
-        return folder_id, sheet_id
-        
-    except HttpError as http_error:
-        print(f"HTTP Error in create_user_resources: {http_error}")
-        # ถ้าเป็น error เกี่ยวกับ authorization ให้ลบ session และให้ login ใหม่
-        if http_error.resp.status in [401, 403]:
-            print("Authorization error detected, clearing session")
-            session.clear()
-        return None, None
-    except Exception as e:
-        print(f"Error in create_user_resources: {e}")
-        return None, None
\ No newline at end of file
+            session.pop(key, None)
+    session['resources_version'] = resources.get('version')
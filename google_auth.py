@@ -2,9 +2,9 @@
 from flask import redirect, session, url_for, request, jsonify
 import os
 import pathlib
-from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from functools import wraps
+from credential_manager import credential_manager
 from dotenv import load_dotenv
 import json
 import time
@@ -42,14 +42,26 @@ def create_flow():
             scopes=SCOPES,
             redirect_uri=redirect_uri
         )
+        # แลก authorization code ผ่าน connection pool ที่ใช้ร่วมกัน
+        from google_transport import adapter
+        flow.oauth2session.mount('https://', adapter)
         return flow
     except Exception as e:
         print(f"Error using GOOGLE_CLIENT_SECRET: {e}")
         raise ValueError("No valid OAuth credentials found. Please set GOOGLE_CLIENT_SECRET environment variable.")
 
+def _sync_session_credentials(credentials):
+    """อัปเดต session ถ้า token ในแคชถูกต่ออายุแล้ว (เช่น โดย background refresh)"""
+    if credentials.token != session['credentials'].get('token'):
+        session['credentials'] = credential_manager.to_dict(credentials)
+        session['credentials_refreshed_at'] = time.time()
+        session.permanent = True
+
 def refresh_credentials():
     """
     ฟังก์ชันสำหรับต่ออายุ credentials
+    ต่ออายุผ่าน credential_manager เฉพาะเมื่อ token ใกล้หมดอายุหรือไม่ทราบเวลาหมดอายุ
+    (ถ้ามี request อื่นกำลังต่ออายุอยู่ จะรอและใช้ token ใหม่ร่วมกัน)
     
     Returns:
         bool: True ถ้าต่ออายุสำเร็จ, False ถ้าไม่สำเร็จ
@@ -59,39 +71,28 @@ def refresh_credentials():
         return False
     
     try:
-        # สร้าง Credentials object จาก session
-        credentials = Credentials(**session['credentials'])
+        owner = session.get('user_email')
+        credentials = credential_manager.get(owner, session['credentials'])
+        if credentials is None:
+            print("Refresh token is no longer valid")
+            return False
         
-        # ตรวจสอบว่า credentials หมดอายุหรือไม่
-        if not credentials.expired:
+        # ตรวจสอบว่า credentials ใกล้หมดอายุหรือไม่
+        expires_in = credential_manager.expires_in(credentials)
+        if expires_in is not None and expires_in > credential_manager.refresh_margin:
+            _sync_session_credentials(credentials)
             print("Credentials are still valid")
             return True
         
-        print("Credentials expired, attempting to refresh...")
-        
         # ตรวจสอบว่ามี refresh_token หรือไม่
         if not credentials.refresh_token:
             print("No refresh token available")
             return False
         
-        # Import ที่จำเป็นสำหรับการ refresh
-        from google.auth.transport.requests import Request
-        
-        # ต่ออายุ credentials
-        credentials.refresh(Request())
+        credentials = credential_manager.refresh(owner, stale_token=credentials.token)
         
         # อัปเดต session ด้วย credentials ใหม่
-        session['credentials'] = {
-            'token': credentials.token,
-            'refresh_token': credentials.refresh_token,
-            'token_uri': credentials.token_uri,
-            'client_id': credentials.client_id,
-            'client_secret': credentials.client_secret,
-            'scopes': credentials.scopes
-        }
-        
-        # เพิ่มเวลาที่ refresh
-        session['credentials_refreshed_at'] = time.time()
+        _sync_session_credentials(credentials)
         
         print("Credentials refreshed successfully")
         return True
@@ -102,7 +103,7 @@ def refresh_credentials():
 
 def get_valid_credentials():
     """
-    ดึง credentials ที่ยังใช้งานได้ (refresh อัตโนมัติถ้าจำเป็น)
+    ดึง credentials ที่ยังใช้งานได้จาก credential_manager (refresh อัตโนมัติเฉพาะเมื่อหมดอายุแล้ว)
     
     Returns:
         Credentials: credentials object ที่ใช้งานได้ หรือ None ถ้าไม่สำเร็จ
@@ -111,16 +112,16 @@ def get_valid_credentials():
         return None
     
     try:
-        credentials = Credentials(**session['credentials'])
+        owner = session.get('user_email')
+        credentials = credential_manager.get(owner, session['credentials'])
+        if credentials is None:
+            return None
         
-        # ถ้า credentials หมดอายุ ให้ลองต่ออายุ
+        # ถ้า credentials หมดอายุ ให้ลองต่ออายุ (ปกติ background refresh ต่ออายุไว้ก่อนแล้ว)
         if credentials.expired and credentials.refresh_token:
-            if refresh_credentials():
-                # ดึง credentials ใหม่หลังจาก refresh
-                credentials = Credentials(**session['credentials'])
-            else:
-                return None
+            credentials = credential_manager.refresh(owner, stale_token=credentials.token)
         
+        _sync_session_credentials(credentials)
         return credentials
         
     except Exception as e:
@@ -134,13 +135,18 @@ def login_required(f):
         if 'credentials' not in session:
             return redirect(url_for('login_page'))
         
-        # ตรวจสอบและต่ออายุ credentials ถ้าจำเป็น
-        credentials = get_valid_credentials()
+        # อ่าน credentials จากแคช (ไม่เรียกเครือข่าย) - token ถูกต่ออายุล่วงหน้าใน background
+        try:
+            credentials = credential_manager.get(session.get('user_email'), session['credentials'])
+        except Exception as e:
+            print(f"Error reading cached credentials: {e}")
+            credentials = None
         if not credentials:
-            # ถ้าไม่สามารถต่ออายุได้ ให้ล้าง session และ redirect ไป login
+            # ถ้า refresh token ใช้ไม่ได้แล้ว ให้ล้าง session และ redirect ไป login
             session.clear()
             return redirect(url_for('login_page'))
         
+        _sync_session_credentials(credentials)
         return f(*args, **kwargs)
     return decorated_function
 
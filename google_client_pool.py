@@ -0,0 +1,98 @@
+# google_client_pool.py - เก็บ GoogleAPIClient ของแต่ละผู้ใช้ไว้ใช้ซ้ำทั้ง process
+import os
+import time
+import threading
+from collections import OrderedDict
+from google_api_client import GoogleAPIClient
+
+class GoogleClientPool:
+    """
+    LRU pool ของ GoogleAPIClient แยกตามผู้ใช้
+    - client ใน pool มี drive_service / sheets_service ที่สร้างไว้แล้ว (สร้างจาก discovery document ที่แคชไว้)
+    - เมื่อ token ใน session เปลี่ยน จะเปลี่ยน credentials ใน client เดิมแทนการสร้างใหม่
+    - client ที่ไม่ถูกใช้นานเกิน idle_ttl หรือเกิน max_size (ตัวที่ใช้ล่าสุดนานที่สุดก่อน) จะถูกลบออก
+    """
+
+    def __init__(self, max_size=256, idle_ttl=1800):
+        """
+        Args:
+            max_size (int): จำนวน client สูงสุดใน pool
+            idle_ttl (int): เวลาที่ client ไม่ถูกใช้ก่อนถูกลบออก (วินาที)
+        """
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._clients = OrderedDict()  # owner -> (client, last_used)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+
+    def get(self, owner, oauth_credentials):
+        """
+        ดึง client ของผู้ใช้ (สร้างใหม่ถ้ายังไม่มี)
+
+        Args:
+            owner (str): เจ้าของ client (email) - None = ไม่เก็บใน pool
+            oauth_credentials (dict): OAuth credentials ล่าสุดของผู้ใช้
+
+        Returns:
+            GoogleAPIClient: client ที่พร้อมใช้งาน
+        """
+        if not owner:
+            return GoogleAPIClient(oauth_credentials=dict(oauth_credentials))
+
+        with self._lock:
+            self._evict()
+            entry = self._clients.get(owner)
+            if entry and entry[0].credentials:
+                client = entry[0]
+                self._clients[owner] = (client, time.time())
+                self._clients.move_to_end(owner)
+                self._hits += 1
+            else:
+                client = None
+                self._misses += 1
+
+        if client:
+            client.update_credentials(oauth_credentials)
+            return client
+
+        # สร้าง client นอก lock (อาจต้องต่ออายุ token ผ่านเครือข่าย)
+        client = GoogleAPIClient(oauth_credentials=dict(oauth_credentials), owner=owner)
+        if client.credentials:
+            with self._lock:
+                self._clients[owner] = (client, time.time())
+                self._clients.move_to_end(owner)
+                self._evict()
+        return client
+
+    def discard(self, owner):
+        """ลบ client ของผู้ใช้ออกจาก pool (เช่น เมื่อออกจากระบบ)"""
+        with self._lock:
+            self._clients.pop(owner, None)
+
+    def _evict(self):
+        now = time.time()
+        while self._clients:
+            owner, (client, last_used) = next(iter(self._clients.items()))
+            if len(self._clients) <= self.max_size and now - last_used < self.idle_ttl:
+                break
+            self._clients.popitem(last=False)
+            self._evicted += 1
+
+    def stats(self):
+        with self._lock:
+            self._evict()
+            return {
+                'clients': len(self._clients),
+                'max_size': self.max_size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evicted': self._evicted
+            }
+
+# pool เดียวใช้ร่วมกันทั้ง process (request, คิวอัปโหลด และบัฟเฟอร์ Sheets)
+client_pool = GoogleClientPool(
+    max_size=int(os.environ.get('GOOGLE_CLIENT_POOL_SIZE', 256)),
+    idle_ttl=int(os.environ.get('GOOGLE_CLIENT_IDLE_TTL', 1800))
+)
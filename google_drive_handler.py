@@ -16,7 +16,7 @@ class GoogleDriveHandler:
         อัปโหลดไฟล์ไปยัง Google Drive พร้อม Error Handling ที่ดีขึ้น
         
         Args:
-            file_path: เส้นทางของไฟล์ที่จะอัปโหลด
+            file_path: เส้นทางของไฟล์ที่จะอัปโหลด หรือข้อมูลภาพ (bytes)
             file_name: ชื่อที่จะใช้บน Google Drive
             session_data: ข้อมูลเซสชันที่มี credentials
             google_client: GoogleAPIClient instance
@@ -0,0 +1,119 @@
+# google_transport.py - HTTP transport แบบ keep-alive ที่ใช้ร่วมกันสำหรับทุกการเรียก Google API
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from google.auth.transport.requests import Request
+
+class TransportMetrics:
+    """นับจำนวน request และจำนวน connection ใหม่ (TLS handshake) ของ transport"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.token_requests = 0
+
+    def count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'token_requests': self.token_requests,
+                'new_connections': self.connections,
+                'connection_reuse_ratio': 1 - self.connections / self.requests if self.requests else None
+            }
+
+metrics = TransportMetrics()
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        metrics.count('connections')
+        return super()._new_conn()
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        metrics.count('connections')
+        return super()._new_conn()
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter ที่นับ connection ใหม่ทุกครั้งที่ urllib3 ต้องเปิด connection"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool
+        }
+
+POOL_SIZE = int(os.environ.get('GOOGLE_HTTP_POOL_SIZE', 20))
+CONNECT_TIMEOUT = float(os.environ.get('GOOGLE_HTTP_CONNECT_TIMEOUT', 10))
+READ_TIMEOUT = float(os.environ.get('GOOGLE_HTTP_READ_TIMEOUT', 60))
+
+# adapter และ session เดียวใช้ร่วมกันทั้ง process (connection pool ของ urllib3 thread-safe)
+adapter = PooledHTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=0)
+shared_session = requests.Session()
+shared_session.mount('https://', adapter)
+shared_session.mount('http://', adapter)
+
+class _CountingRequest(Request):
+    """Request ของ google-auth (ใช้ต่ออายุ token) ที่ส่งผ่าน session ที่ใช้ร่วมกัน"""
+
+    def __call__(self, url, method='GET', body=None, headers=None, timeout=None, **kwargs):
+        metrics.count('requests')
+        metrics.count('token_requests')
+        return super().__call__(url, method=method, body=body, headers=headers,
+                                timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+
+_auth_request = _CountingRequest(session=shared_session)
+
+def auth_request():
+    """Request สำหรับ credentials.refresh() ที่ใช้ connection pool ร่วมกัน"""
+    return _auth_request
+
+class _Response(dict):
+    """response แบบเดียวกับ httplib2.Response (dict ของ header ตัวพิมพ์เล็ก + status / reason)"""
+
+    def __init__(self, response):
+        super().__init__((key.lower(), value) for key, value in response.headers.items())
+        self.status = response.status_code
+        self.reason = response.reason
+        self['status'] = str(response.status_code)
+
+class AuthorizedTransport:
+    """
+    http object สำหรับ googleapiclient (interface request() แบบ httplib2)
+    ใส่ token ของ credentials ในทุก request และส่งผ่าน connection pool ที่ใช้ร่วมกัน
+    """
+
+    def __init__(self, credentials, timeout=None):
+        """
+        Args:
+            credentials: google.auth credentials
+            timeout (tuple, optional): (connect, read) timeout (วินาที)
+        """
+        self.credentials = credentials
+        self.timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None, **kwargs):
+        headers = dict(headers or {})
+        if self.credentials is not None:
+            self.credentials.before_request(_auth_request, method, uri, headers)
+
+        metrics.count('requests')
+        response = shared_session.request(
+            method, uri, data=body, headers=headers, timeout=self.timeout,
+            allow_redirects=method in ('GET', 'HEAD') and redirections > 0)
+        return _Response(response), response.content
+
+    def close(self):
+        """connection เป็นของ pool ที่ใช้ร่วมกัน จึงไม่ต้องปิด"""
+        pass
+
+def stats():
+    """metrics ของ transport: จำนวน request, handshake ใหม่ และสัดส่วนการใช้ connection ซ้ำ"""
+    return dict(metrics.stats(), pool_size=POOL_SIZE)
@@ -0,0 +1,58 @@
+# image_store.py - เก็บภาพที่ประมวลผลแล้ว (JPEG) ในหน่วยความจำชั่วคราว
+import time
+import threading
+from collections import OrderedDict
+
+class ProcessedImageStore:
+    """
+    เก็บภาพ JPEG ที่ประมวลผลแล้วในหน่วยความจำแทนการเขียนลงดิสก์
+    ลบอัตโนมัติเมื่อเกินอายุ (ttl_seconds) หรือเมื่อขนาดรวมเกิน max_bytes (ลบตัวที่เก่าที่สุดก่อน)
+    """
+
+    def __init__(self, ttl_seconds=300, max_bytes=256 * 1024 * 1024):
+        """
+        Args:
+            ttl_seconds (int): อายุของภาพ (วินาที)
+            max_bytes (int): ขนาดรวมสูงสุดของภาพทั้งหมด
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()  # filename -> (data, expires_at)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, filename, data):
+        """เก็บภาพ"""
+        with self._lock:
+            self._remove(filename)
+            self._images[filename] = (data, time.time() + self.ttl_seconds)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def get(self, filename):
+        """
+        Returns:
+            bytes: ข้อมูลภาพ หรือ None ถ้าไม่พบ/หมดอายุ
+        """
+        with self._lock:
+            self._evict()
+            entry = self._images.get(filename)
+            return entry[0] if entry else None
+
+    def _remove(self, filename):
+        entry = self._images.pop(filename, None)
+        if entry:
+            self._total_bytes -= len(entry[0])
+
+    def _evict(self):
+        now = time.time()
+        # ภาพถูกเพิ่มตามลำดับเวลา ตัวแรกจึงหมดอายุก่อนเสมอ
+        while self._images:
+            filename, (data, expires_at) = next(iter(self._images.items()))
+            if expires_at > now and self._total_bytes <= self.max_bytes:
+                break
+            self._remove(filename)
+
+    def stats(self):
+        with self._lock:
+            return {'images': len(self._images), 'bytes': self._total_bytes}
@@ -0,0 +1,202 @@
+# inference_backends.py - โหลด/export โมเดล YOLO และ recognizer ของ EasyOCR สำหรับ backend ที่เร็วบน CPU
+import os
+import shutil
+
+BACKENDS = ['torch', 'onnx', 'openvino']
+PRECISIONS = ['fp32', 'fp16', 'int8']
+
+# ความสูงภาพของ recognizer EasyOCR และความกว้างตัวอย่างสำหรับ export (ความกว้างจริงเป็น dynamic)
+RECOGNIZER_HEIGHT = 64
+RECOGNIZER_EXPORT_WIDTH = 256
+
+
+def _check_backend(backend, precision):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+    if backend == 'onnx' and precision == 'fp16':
+        raise ValueError("ONNX Runtime backend on CPU supports only fp32 and int8; use openvino for fp16")
+
+
+def get_exported_yolo_path(model_path, backend, precision='fp32'):
+    """
+    คืนเส้นทางของโมเดล YOLO ที่ export แล้วตาม backend/precision
+    เช่น bestMR.pt -> bestMR_int8.onnx หรือ bestMR_fp16_openvino_model/
+    """
+    if backend == 'torch':
+        return model_path
+    stem = os.path.splitext(model_path)[0]
+    if backend == 'onnx':
+        return f"{stem}_{precision}.onnx"
+    return f"{stem}_{precision}_openvino_model"
+
+
+def get_exported_recognizer_path(models_dir, precision='fp32'):
+    """คืนเส้นทางของ recognizer ที่ export เป็น ONNX แล้ว"""
+    # OpenVINO fp16 ใช้ไฟล์ fp32 แล้วกำหนด precision ตอน compile
+    file_precision = 'int8' if precision == 'int8' else 'fp32'
+    return os.path.join(models_dir, f"easyocr_recognizer_{file_precision}.onnx")
+
+
+def load_yolo_model(model_path, backend='torch', precision='fp32'):
+    """
+    โหลดโมเดล YOLO ตาม backend (ultralytics รองรับ ONNX/OpenVINO ผ่าน API เดิม)
+
+    Returns:
+        YOLO: โมเดลที่เรียกใช้ได้เหมือนเดิม
+    """
+    from ultralytics import YOLO
+
+    _check_backend(backend, precision)
+    path = get_exported_yolo_path(model_path, backend, precision)
+    if backend != 'torch' and not os.path.exists(path):
+        raise FileNotFoundError(
+            f"ไม่พบโมเดลที่ export แล้ว: {path} "
+            f"(รัน: python export_models.py --backend {backend} --precision {precision})")
+    print(f"YOLO backend: {backend} ({precision}) - {path}")
+    return YOLO(path, task='detect')
+
+
+class ExportedRecognizer:
+    """
+    ตัวแทน recognizer ของ EasyOCR ที่รันบน ONNX Runtime หรือ OpenVINO
+    มี interface เดียวกับ torch module ที่ easyocr.recognition.recognizer_predict เรียกใช้
+    (model.eval() และ model(image, text) -> tensor)
+    """
+
+    def __init__(self, onnx_path, backend='onnx', precision='fp32', num_threads=None):
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(
+                f"ไม่พบ recognizer ที่ export แล้ว: {onnx_path} "
+                f"(รัน: python export_models.py --backend {backend} --precision {precision})")
+
+        self.backend = backend
+        if backend == 'onnx':
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if num_threads:
+                options.intra_op_num_threads = num_threads
+            self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+            self.input_names = [i.name for i in self.session.get_inputs()]
+        else:
+            import openvino as ov
+
+            core = ov.Core()
+            config = {'INFERENCE_PRECISION_HINT': 'f16' if precision == 'fp16' else 'f32'}
+            if num_threads:
+                config['INFERENCE_NUM_THREADS'] = num_threads
+            self.compiled_model = core.compile_model(core.read_model(onnx_path), 'CPU', config)
+            self.input_names = [i.get_any_name() for i in self.compiled_model.inputs]
+        print(f"Recognizer backend: {backend} ({precision}) - {onnx_path}")
+
+    def eval(self):
+        return self
+
+    def __call__(self, image, text=None):
+        import torch
+
+        feeds = {'image': image.detach().cpu().numpy()}
+        # input text ไม่ถูกใช้โดยโมเดล CTC และมักถูกตัดออกจาก graph ตอน export
+        if 'text' in self.input_names and text is not None:
+            feeds['text'] = text.detach().cpu().numpy()
+
+        if self.backend == 'onnx':
+            output = self.session.run(None, feeds)[0]
+        else:
+            output = self.compiled_model(feeds)[self.compiled_model.output(0)]
+        return torch.from_numpy(output)
+
+
+def load_recognizer(models_dir, backend='onnx', precision='fp32', num_threads=None):
+    """โหลด recognizer ที่ export แล้วสำหรับใช้แทน reader.recognizer"""
+    _check_backend(backend, precision)
+    path = get_exported_recognizer_path(models_dir, precision)
+    return ExportedRecognizer(path, backend, precision, num_threads)
+
+
+def export_yolo(model_path, backend, precision='fp32', data=None, imgsz=640):
+    """
+    Export โมเดล YOLO เป็น ONNX/OpenVINO แล้วย้ายไปยังชื่อที่ load_yolo_model ใช้
+
+    Args:
+        data (str, optional): dataset yaml สำหรับ calibrate INT8 (OpenVINO)
+    """
+    from ultralytics import YOLO
+
+    _check_backend(backend, precision)
+    if backend == 'torch':
+        return model_path
+    if backend == 'onnx' and precision == 'int8':
+        # ultralytics ไม่รองรับ INT8 สำหรับ ONNX - ใช้ dynamic quantization ของ ONNX Runtime
+        fp32_path = export_yolo(model_path, 'onnx', 'fp32', imgsz=imgsz)
+        target = get_exported_yolo_path(model_path, backend, precision)
+        _quantize_onnx(fp32_path, target)
+        return target
+
+    model = YOLO(model_path)
+    kwargs = {'imgsz': imgsz, 'dynamic': True}
+    if backend == 'onnx':
+        exported = model.export(format='onnx', simplify=True, **kwargs)
+    else:
+        if precision == 'int8':
+            kwargs['int8'] = True
+            if data:
+                kwargs['data'] = data
+        exported = model.export(format='openvino', half=(precision == 'fp16'), **kwargs)
+
+    target = get_exported_yolo_path(model_path, backend, precision)
+    if os.path.abspath(exported) != os.path.abspath(target):
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        elif os.path.exists(target):
+            os.remove(target)
+        shutil.move(exported, target)
+    print(f"✅ Exported YOLO ({backend}, {precision}): {target}")
+    return target
+
+
+def export_recognizer(reader, models_dir, precision='fp32'):
+    """
+    Export recognizer ของ EasyOCR (CRNN) เป็น ONNX โดยให้ batch และความกว้างเป็น dynamic
+
+    Args:
+        reader: easyocr.Reader ที่โหลด recognizer แบบ PyTorch ไว้แล้ว
+        models_dir: โฟลเดอร์ปลายทาง
+        precision: 'fp32' หรือ 'int8' (fp16 ใช้ไฟล์ fp32 กับ OpenVINO)
+    """
+    import torch
+
+    fp32_path = get_exported_recognizer_path(models_dir, 'fp32')
+    model = getattr(reader.recognizer, 'module', reader.recognizer)  # DataParallel บน GPU
+    model = model.float().cpu().eval()
+
+    dummy_image = torch.randn(1, 1, RECOGNIZER_HEIGHT, RECOGNIZER_EXPORT_WIDTH)
+    dummy_text = torch.zeros(1, RECOGNIZER_EXPORT_WIDTH // 10 + 1, dtype=torch.long)
+    with torch.no_grad():
+        torch.onnx.export(
+            model, (dummy_image, dummy_text), fp32_path,
+            input_names=['image', 'text'],
+            output_names=['preds'],
+            dynamic_axes={'image': {0: 'batch', 3: 'width'},
+                          'text': {0: 'batch', 1: 'length'},
+                          'preds': {0: 'batch', 1: 'steps'}},
+            opset_version=17
+        )
+    print(f"✅ Exported recognizer (fp32): {fp32_path}")
+
+    if precision == 'int8':
+        target = get_exported_recognizer_path(models_dir, 'int8')
+        _quantize_onnx(fp32_path, target)
+        return target
+    return fp32_path
+
+
+def _quantize_onnx(source_path, target_path):
+    """INT8 dynamic quantization ด้วย ONNX Runtime"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(source_path, target_path, weight_type=QuantType.QInt8)
+    print(f"✅ Quantized to INT8: {target_path}")
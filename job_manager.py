@@ -0,0 +1,149 @@
+# job_manager.py - จัดการงานประมวลผลภาพแบบ asynchronous (ติดตามสถานะ/ความคืบหน้าของแต่ละงาน)
+import time
+import uuid
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class JobManager:
+    """
+    เก็บสถานะของงานที่รันใน background thread พร้อมรายการ event ของแต่ละขั้น
+    (เช่น detected, ocr_done, uploaded) ให้ client ดึงผ่าน polling หรือ server-sent events
+    """
+
+    FINISHED_STATUSES = ('done', 'error')
+
+    def __init__(self, max_workers=4, ttl_seconds=600, max_pending=32):
+        """
+        Args:
+            max_workers (int): จำนวน thread ที่รันงานพร้อมกัน
+            ttl_seconds (int): เวลาที่เก็บงานที่เสร็จแล้วไว้ให้ client ดึงผลลัพธ์ (วินาที)
+            max_pending (int): จำนวนงานที่ยังไม่เสร็จ (รอคิว + กำลังรัน) สูงสุด
+                (งานที่รอคิวถือข้อมูลภาพไว้ในหน่วยความจำ จึงต้องจำกัด)
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._condition = threading.Condition()
+
+    def create(self, owner=None):
+        """
+        สร้างงานใหม่
+
+        Args:
+            owner (str, optional): เจ้าของงาน (เช่น email ของผู้ใช้) สำหรับตรวจสิทธิ์
+
+        Returns:
+            str: job id
+
+        Raises:
+            queue.Full: ถ้ามีงานที่ยังไม่เสร็จครบ max_pending แล้ว
+        """
+        self._expire_finished()
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._condition:
+            unfinished = sum(1 for job in self._jobs.values() if job['status'] not in self.FINISHED_STATUSES)
+            if self.max_pending and unfinished >= self.max_pending:
+                raise queue.Full(f"{unfinished} jobs pending")
+            self._jobs[job_id] = {
+                'id': job_id,
+                'owner': owner,
+                'status': 'queued',
+                'stage': 'queued',
+                'events': [{'stage': 'queued', 'info': None, 'time': now}],
+                'result': None,
+                'error': None,
+                'session_updates': None,
+                'created_at': now,
+                'updated_at': now
+            }
+        return job_id
+
+    def submit(self, job_id, fn, *args, **kwargs):
+        """รันงานใน background: fn(*args, **kwargs) ต้องคืนผลลัพธ์สุดท้าย (dict)"""
+        def run():
+            self.update(job_id, 'running', status='running')
+            try:
+                result = fn(*args, **kwargs)
+                self.update(job_id, 'done', status='done', result=result)
+            except Exception as e:
+                print(f"❌ Job {job_id} failed: {e}")
+                self.update(job_id, 'error', {'error': str(e)}, status='error', error=str(e))
+
+        self.executor.submit(run)
+
+    def update(self, job_id, stage, info=None, **fields):
+        """
+        บันทึก event ของขั้นใหม่ และอัปเดตข้อมูลอื่นของงาน (status, result, error, session_updates)
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if not job:
+                return
+            now = time.time()
+            job['stage'] = stage
+            job['events'].append({'stage': stage, 'info': info, 'time': now})
+            job.update(fields)
+            job['updated_at'] = now
+            self._condition.notify_all()
+
+    def get(self, job_id):
+        """คืนข้อมูลของงาน (สำเนา) หรือ None ถ้าไม่พบ"""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+            return dict(job, events=list(job['events']))
+
+    def pop_session_updates(self, job_id):
+        """ดึงข้อมูลที่ต้องอัปเดตลง session (เช่น credentials ที่ถูกต่ออายุ) ครั้งเดียว"""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+            updates, job['session_updates'] = job['session_updates'], None
+            return updates
+
+    def wait_for_events(self, job_id, since=0, timeout=15):
+        """
+        รอจนกว่างานจะมี event ใหม่หลังตำแหน่ง since หรือหมดเวลา
+
+        Returns:
+            tuple: (รายการ event ใหม่, ตำแหน่งถัดไป, งานเสร็จแล้วหรือไม่) หรือ None ถ้าไม่พบงาน
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                job = self._jobs.get(job_id)
+                if not job:
+                    return None
+                events = job['events'][since:]
+                finished = job['status'] in self.FINISHED_STATUSES
+                remaining = deadline - time.time()
+                if events or finished or remaining <= 0:
+                    return events, since + len(events), finished
+                self._condition.wait(remaining)
+
+    def public_view(self, job):
+        """ข้อมูลของงานสำหรับส่งให้ client"""
+        return {
+            'job_id': job['id'],
+            'status': job['status'],
+            'stage': job['stage'],
+            'events': [{'stage': e['stage'], 'info': e['info']} for e in job['events']],
+            'result': job['result'],
+            'error': job['error']
+        }
+
+    def _expire_finished(self):
+        """ลบงานที่เสร็จแล้วและเกิน ttl"""
+        cutoff = time.time() - self.ttl_seconds
+        with self._condition:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job['status'] in self.FINISHED_STATUSES and job['updated_at'] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
@@ -0,0 +1,230 @@
+# ocr_stats.py - สถิติการชนะของแต่ละวิธี OCR (ภาพ × config) แยกตาม class
+import os
+import json
+import time
+import random
+import threading
+
+class OCRStrategyStats:
+    """
+    เก็บตัวนับว่าแต่ละวิธี OCR (เช่น clahe_segment, rotated_3_blur) ถูกรันกี่ครั้ง
+    และเป็นผู้ให้ผลลัพธ์ที่ถูกเลือกกี่ครั้ง แยกตาม class (roomN/meter/meter1)
+    พร้อมบันทึกลงไฟล์ JSON เพื่อใช้ต่อหลังรีสตาร์ท
+    """
+
+    def __init__(self, path=None, autosave_every=20):
+        """
+        Args:
+            path (str, optional): ไฟล์ JSON สำหรับบันทึกสถิติ (None = เก็บในหน่วยความจำอย่างเดียว)
+            autosave_every (int, optional): บันทึกลงไฟล์ทุกๆ กี่ box ที่บันทึกสถิติ
+                (None = ไม่บันทึกอัตโนมัติ เช่นใน worker process ที่ส่งสถิติให้ process หลัก)
+        """
+        self.path = path
+        self.autosave_every = autosave_every
+        self._lock = threading.Lock()
+        self._pending_saves = 0
+        self._stats = {}
+        self._delta = {}  # สถิติที่ยังไม่ถูกส่งออกผ่าน drain_delta
+        self.load()
+
+    def load(self):
+        """โหลดสถิติจากไฟล์ (ถ้ามี)"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            with self._lock:
+                self._stats = data.get('classes', {})
+            print(f"📈 Loaded OCR strategy stats from {self.path}")
+        except Exception as e:
+            print(f"Error loading OCR strategy stats: {e}")
+
+    def save(self):
+        """บันทึกสถิติลงไฟล์แบบ atomic"""
+        if not self.path:
+            return
+        with self._lock:
+            data = {'updated_at': time.time(), 'classes': json.loads(json.dumps(self._stats))}
+            self._pending_saves = 0
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Error saving OCR strategy stats: {e}")
+
+    def record_box(self, class_name, strategies_run, winning_methods=()):
+        """
+        บันทึกผลของ box หนึ่ง box
+
+        Args:
+            class_name (str): class ของ box
+            strategies_run (iterable): ชื่อวิธีที่ถูกรันกับ box นี้ (เช่น 'gray_base')
+            winning_methods (iterable, optional): ทุกวิธีที่อ่านได้ตรงกับผลลัพธ์ที่ถูกเลือก
+                (แต่ละวิธีได้ 1 win)
+        """
+        with self._lock:
+            for stats in (self._stats, self._delta):
+                class_stats = stats.setdefault(class_name, {'boxes': 0, 'strategies': {}})
+                class_stats['boxes'] += 1
+                strategies = class_stats['strategies']
+                for strategy in strategies_run:
+                    strategies.setdefault(strategy, {'runs': 0, 'wins': 0})['runs'] += 1
+                for winning_method in set(winning_methods):
+                    strategies.setdefault(winning_method, {'runs': 0, 'wins': 0})['wins'] += 1
+
+            self._pending_saves += 1
+            should_save = self._should_autosave()
+
+        if should_save:
+            self.save()
+
+    def record_cache(self, class_name, hit, time_saved=0.0, rejected=False):
+        """
+        บันทึกผลการค้นหาแคช crop (ดู PerceptualCropCache)
+
+        Args:
+            class_name (str): class ของ box
+            hit (bool): ใช้ผล OCR จากแคชหรือไม่
+            time_saved (float): เวลา OCR ที่ประหยัดได้หักเวลาที่ใช้ยืนยันผล (วินาที, ติดลบได้เมื่อยืนยันไม่ผ่าน)
+            rejected (bool): พบในแคชแต่การอ่านซ้ำได้ตัวเลขไม่ตรงกัน (นับเป็น miss)
+        """
+        with self._lock:
+            for stats in (self._stats, self._delta):
+                class_stats = stats.setdefault(class_name, {'boxes': 0, 'strategies': {}})
+                cache = class_stats.setdefault('cache', {'hits': 0, 'misses': 0, 'rejected': 0, 'time_saved': 0.0})
+                cache['hits' if hit else 'misses'] += 1
+                cache['rejected'] = cache.get('rejected', 0) + (1 if rejected else 0)
+                cache['time_saved'] += time_saved
+
+    def drain_delta(self):
+        """
+        คืนสถิติที่บันทึกตั้งแต่การเรียกครั้งก่อน แล้วล้างออก
+        (ใช้ส่งสถิติจาก worker process ไปรวมที่ process หลัก)
+        """
+        with self._lock:
+            delta, self._delta = self._delta, {}
+        return delta
+
+    def merge(self, delta):
+        """รวมสถิติจาก drain_delta ของ process อื่นเข้ามา"""
+        if not delta:
+            return
+        with self._lock:
+            for class_name, class_delta in delta.items():
+                class_stats = self._stats.setdefault(class_name, {'boxes': 0, 'strategies': {}})
+                class_stats['boxes'] += class_delta['boxes']
+                for strategy, counts in class_delta['strategies'].items():
+                    target = class_stats['strategies'].setdefault(strategy, {'runs': 0, 'wins': 0})
+                    target['runs'] += counts['runs']
+                    target['wins'] += counts['wins']
+                if 'cache' in class_delta:
+                    cache = class_stats.setdefault('cache', {'hits': 0, 'misses': 0, 'rejected': 0, 'time_saved': 0.0})
+                    for field in ('hits', 'misses', 'rejected', 'time_saved'):
+                        cache[field] = cache.get(field, 0) + class_delta['cache'].get(field, 0)
+            self._pending_saves += sum(class_delta['boxes'] for class_delta in delta.values())
+            should_save = self._should_autosave()
+
+        if should_save:
+            self.save()
+
+    def snapshot(self):
+        """คืนสำเนาของสถิติสะสมทั้งหมด (ใช้ส่งให้ worker process ตัดสินใจปิดวิธี OCR)"""
+        with self._lock:
+            return json.loads(json.dumps(self._stats))
+
+    def replace(self, stats):
+        """
+        แทนที่สถิติสะสมด้วย snapshot จาก process หลัก (สถิติใน drain_delta ที่ยังไม่ส่งไม่ถูกล้าง)
+
+        Args:
+            stats (dict): ผลลัพธ์จาก snapshot() ของ process หลัก
+        """
+        with self._lock:
+            self._stats = stats
+
+    def _should_autosave(self):
+        return bool(self.path) and self.autosave_every is not None and self._pending_saves >= self.autosave_every
+
+    def get_stats(self):
+        """
+        คืนสถิติทั้งหมดพร้อม win rate (wins / runs) เรียงจากมากไปน้อย
+
+        Returns:
+            dict: class -> {'boxes': int, 'strategies': [{name, variant, config, runs, wins, win_rate}, ...],
+                            'crop_cache': {hits, misses, rejected, time_saved, hit_rate} (ถ้ามี)}
+        """
+        snapshot = self.snapshot()
+
+        result = {}
+        for class_name, class_stats in snapshot.items():
+            strategies = []
+            for name, counts in class_stats['strategies'].items():
+                variant, _, config = name.rpartition('_')
+                strategies.append({
+                    'name': name,
+                    'variant': variant,
+                    'config': config,
+                    'runs': counts['runs'],
+                    'wins': counts['wins'],
+                    'win_rate': counts['wins'] / counts['runs'] if counts['runs'] else 0.0
+                })
+            strategies.sort(key=lambda s: (s['win_rate'], s['wins']), reverse=True)
+            result[class_name] = {'boxes': class_stats['boxes'], 'strategies': strategies}
+            cache = class_stats.get('cache')
+            if cache:
+                lookups = cache['hits'] + cache['misses']
+                result[class_name]['crop_cache'] = dict(
+                    cache, time_saved=round(cache['time_saved'], 2),
+                    hit_rate=cache['hits'] / lookups if lookups else 0.0)
+        return result
+
+    def disabled_strategies(self, class_name, threshold, min_runs, explore_rate=0.0):
+        """
+        หาวิธีที่ควรปิดการใช้งาน: รันมาแล้วอย่างน้อย min_runs ครั้งแต่ win rate ต่ำกว่า threshold
+        (จะไม่ปิดวิธีที่ชนะมากที่สุดของ class เสมอ)
+
+        Args:
+            explore_rate (float): โอกาสที่วิธีที่ถูกปิดจะถูกเปิดให้รันกับ box นี้ เพื่อให้สถิติของวิธีนั้น
+                ยังอัปเดตต่อ และกลับมาใช้งานได้เมื่อ win rate สูงขึ้น (0 = ปิดถาวร เช่นสำหรับการแสดงผล)
+
+        Returns:
+            set: ชื่อวิธีที่ถูกปิด
+        """
+        with self._lock:
+            class_stats = self._stats.get(class_name)
+            if not class_stats:
+                return set()
+            strategies = dict(class_stats['strategies'])
+
+        top_strategy = max(strategies, key=lambda name: strategies[name]['wins'], default=None)
+        return {
+            name for name, counts in strategies.items()
+            if name != top_strategy
+            and counts['runs'] >= min_runs
+            and counts['wins'] / counts['runs'] < threshold
+            and not (explore_rate and random.random() < explore_rate)
+        }
+
+    def summary(self, prune_enabled=False, threshold=0.0, min_runs=0):
+        """
+        สถิติทั้งหมดพร้อมรายชื่อวิธีที่ถูกปิดของแต่ละ class (สำหรับ API)
+        """
+        stats = self.get_stats()
+        for class_name, class_stats in stats.items():
+            class_stats['disabled'] = sorted(
+                self.disabled_strategies(class_name, threshold, min_runs)) if prune_enabled else []
+        return {
+            'prune_enabled': prune_enabled,
+            'prune_threshold': threshold,
+            'prune_min_runs': min_runs,
+            'classes': stats
+        }
+
+    def reset(self):
+        """ล้างสถิติทั้งหมด"""
+        with self._lock:
+            self._stats = {}
+        self.save()
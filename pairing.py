@@ -0,0 +1,97 @@
+# pairing.py - ฟังก์ชันคำนวณสำหรับจับคู่เลขห้อง/มิเตอร์/ทศนิยม (ระยะห่างแบบ matrix และ assignment ที่ดีที่สุด)
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment as _scipy_linear_sum_assignment
+except ImportError:
+    _scipy_linear_sum_assignment = None
+
+def centers_array(detections):
+    """
+    Returns:
+        numpy.ndarray: จุดกึ่งกลางของ detection รูปร่าง (n, 2)
+    """
+    return np.array([d['center'] for d in detections], dtype=np.float64).reshape(-1, 2)
+
+def distance_matrix(points_a, points_b):
+    """
+    ระยะห่างแบบ Euclidean ของทุกคู่จุด
+
+    Args:
+        points_a (numpy.ndarray): รูปร่าง (n, 2)
+        points_b (numpy.ndarray): รูปร่าง (m, 2)
+
+    Returns:
+        numpy.ndarray: รูปร่าง (n, m)
+    """
+    diff = points_a[:, None, :] - points_b[None, :, :]
+    return np.sqrt((diff ** 2).sum(axis=2))
+
+def linear_sum_assignment(cost):
+    """
+    หา assignment ที่ผลรวม cost ต่ำที่สุด (Hungarian) - ใช้ scipy ถ้ามี มิฉะนั้นใช้ _hungarian
+
+    Args:
+        cost (numpy.ndarray): matrix รูปร่าง (n, m) (ไม่จำเป็นต้องเป็น matrix จัตุรัส)
+
+    Returns:
+        tuple: (row_ind, col_ind) แบบเดียวกับ scipy.optimize.linear_sum_assignment
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.size == 0:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    if _scipy_linear_sum_assignment is not None:
+        return _scipy_linear_sum_assignment(cost)
+    return _hungarian(cost)
+
+def _hungarian(cost):
+    """Hungarian algorithm แบบ shortest augmenting path (O(n^2 m)) โดยคำนวณทีละแถวด้วย NumPy"""
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    # index 0 ของ v / assigned_row / way เป็นคอลัมน์สมมติ (แถวเริ่มต้นของแต่ละรอบ)
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    assigned_row = np.zeros(m + 1, dtype=int)  # แถว (เริ่มที่ 1) ที่ถูกจับคู่กับคอลัมน์ j, 0 = ว่าง
+    way = np.zeros(m + 1, dtype=int)
+
+    for i in range(1, n + 1):
+        assigned_row[0] = i
+        j0 = 0
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = assigned_row[j0]
+            free = ~used[1:]
+            slack = cost[i0 - 1] - u[i0] - v[1:]
+            improved = free & (slack < min_slack[1:])
+            min_slack[1:][improved] = slack[improved]
+            way[1:][improved] = j0
+
+            candidates = np.where(free, min_slack[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+
+            u[assigned_row[used]] += delta
+            v[used] -= delta
+            min_slack[~used] -= delta
+
+            j0 = j1
+            if assigned_row[j0] == 0:
+                break
+
+        # สลับการจับคู่ตามเส้นทาง augmenting path
+        while j0:
+            j1 = way[j0]
+            assigned_row[j0] = assigned_row[j1]
+            j0 = j1
+
+    cols = np.nonzero(assigned_row[1:])[0]
+    rows = assigned_row[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
@@ -0,0 +1,192 @@
+# resource_cache.py - เก็บ ID ของโฟลเดอร์และ Spreadsheet ของแต่ละผู้ใช้ลง SQLite (ไม่ต้องค้นหาใหม่ทุกครั้งที่ล็อกอิน)
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from google.auth.exceptions import RefreshError
+from common import thread_local_connection
+
+RESOURCE_KEYS = ('folder_id', 'photo_folder_id', 'sheet_id', 'data_sheet_id', 'data_sheet_title')
+
+# เหตุผลของ 403 ที่หมายถึงไม่มีสิทธิ์จริง - 403 อื่น (เช่น userRateLimitExceeded, rateLimitExceeded)
+# เป็นการจำกัดอัตราชั่วคราวที่ลองใหม่ได้
+PERMISSION_ERROR_REASONS = {
+    'insufficientPermissions', 'insufficientFilePermissions', 'appNotAuthorizedToFile', 'forbidden',
+    'domainPolicy', 'authError', 'PERMISSION_DENIED', 'ACCESS_TOKEN_SCOPE_INSUFFICIENT'
+}
+
+class UserResourceCache:
+    """
+    แคช folder_id / photo_folder_id / sheet_id / data_sheet_id ของแต่ละ email
+    - ล็อกอินครั้งถัดไปใช้ค่าจากแคชทันทีโดยไม่เรียก Drive / Sheets
+    - ไม่ตรวจสอบล่วงหน้า: ถ้า API ตอบ 404 (ผู้ใช้ลบโฟลเดอร์/ไฟล์) จะค้นหาใหม่ใน background
+    - version ของแต่ละ email ใช้บอก session ที่ยังถือค่าเก่าให้อัปเดต
+    """
+
+    def __init__(self, db_path='user_resources.db'):
+        """
+        Args:
+            db_path (str): ไฟล์ SQLite ของแคช
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._memory = {}        # email -> dict (รวม version) หรือ None ถ้าไม่มีในแคช
+        self._resolving = set()  # email ที่กำลังค้นหาใหม่อยู่
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='resource-resolve')
+        self._hits = 0
+        self._misses = 0
+        self._reresolved = 0
+        self._init_db()
+
+    def _conn(self):
+        return thread_local_connection(self._local, self.db_path)
+
+    def _init_db(self):
+        conn = self._conn()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_resources (
+                    email TEXT PRIMARY KEY,
+                    folder_id TEXT,
+                    photo_folder_id TEXT,
+                    sheet_id TEXT,
+                    data_sheet_id INTEGER,
+                    data_sheet_title TEXT,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+
+    def get(self, email):
+        """
+        Returns:
+            dict: ID ของผู้ใช้ (RESOURCE_KEYS + 'version') หรือ None ถ้าไม่มีในแคช
+        """
+        if not email:
+            return None
+        with self._lock:
+            if email in self._memory:
+                return self._memory[email]
+        row = self._conn().execute('SELECT * FROM user_resources WHERE email = ?', (email,)).fetchone()
+        resources = None
+        if row and row['folder_id'] and row['sheet_id']:
+            resources = {key: row[key] for key in RESOURCE_KEYS}
+            resources['version'] = row['updated_at']
+        with self._lock:
+            self._memory[email] = resources
+        return resources
+
+    def lookup(self, email):
+        """get() สำหรับการล็อกอิน (นับ hit / miss)"""
+        resources = self.get(email)
+        with self._lock:
+            if resources:
+                self._hits += 1
+            else:
+                self._misses += 1
+        return resources
+
+    def put(self, email, resources):
+        """บันทึก ID ของผู้ใช้ (แทนที่ค่าเดิมทั้งหมด)"""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                '''INSERT OR REPLACE INTO user_resources
+                   (email, folder_id, photo_folder_id, sheet_id, data_sheet_id, data_sheet_title, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                (email,) + tuple(resources.get(key) for key in RESOURCE_KEYS) + (now,))
+        with self._lock:
+            self._memory[email] = dict({key: resources.get(key) for key in RESOURCE_KEYS}, version=now)
+
+    def update(self, email, **fields):
+        """อัปเดตบางค่า (เช่น data_sheet_id ที่ค้นพบทีหลัง) ถ้าผู้ใช้มีอยู่ในแคช"""
+        resources = self.get(email)
+        if not resources:
+            return
+        if all(resources.get(key) == value for key, value in fields.items()):
+            return
+        self.put(email, dict(resources, **fields))
+
+    def report_not_found(self, email, oauth_credentials):
+        """
+        แจ้งว่า API ตอบ 404 สำหรับโฟลเดอร์ / Spreadsheet ของผู้ใช้ - ค้นหา (หรือสร้าง) ใหม่ใน background
+        (ค้นหาครั้งเดียวแม้มีหลาย request แจ้งพร้อมกัน)
+        """
+        if not email or not oauth_credentials:
+            return
+        with self._lock:
+            if email in self._resolving:
+                return
+            self._resolving.add(email)
+        print(f"🔎 Resources of {email} not found, re-resolving in background")
+        self._executor.submit(self._reresolve, email, dict(oauth_credentials))
+
+    def _reresolve(self, email, oauth_credentials):
+        try:
+            from google_client_pool import client_pool
+            google_client = client_pool.get(email, oauth_credentials)
+            resources = google_client.resolve_user_resources()
+            self.put(email, resources)
+            with self._lock:
+                self._reresolved += 1
+            print(f"✅ Re-resolved resources of {email}")
+        except Exception as e:
+            print(f"❌ Could not re-resolve resources of {email}: {e}")
+        finally:
+            with self._lock:
+                self._resolving.discard(email)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'cached_users': sum(1 for value in self._memory.values() if value),
+                'login_hits': self._hits,
+                'login_misses': self._misses,
+                'reresolved': self._reresolved,
+                'resolving': len(self._resolving)
+            }
+
+def is_not_found_error(error):
+    """ตรวจว่า error มาจาก API ที่ตอบ 404 (รวมถึง error ที่ถูกห่อเป็นข้อความแล้ว)"""
+    resp = getattr(error, 'resp', None)
+    if resp is not None and getattr(resp, 'status', None) == 404:
+        return True
+    return 'HttpError 404' in str(error)
+
+def http_error_reasons(error):
+    """
+    เหตุผลของ error จาก Google API (errors[].reason, details[].reason และ status ของ response)
+
+    Returns:
+        set: เช่น {'userRateLimitExceeded'} (ว่างถ้าไม่ใช่ HttpError หรืออ่าน response ไม่ได้)
+    """
+    reasons = set()
+    details = getattr(error, 'error_details', None)
+    if isinstance(details, list):
+        reasons.update(detail.get('reason') for detail in details if isinstance(detail, dict))
+    try:
+        data = json.loads(getattr(error, 'content', None) or b'{}')['error']
+        reasons.add(data.get('status'))
+        for key in ('errors', 'details'):
+            reasons.update(item.get('reason') for item in data.get(key, []) if isinstance(item, dict))
+    except (ValueError, KeyError, TypeError, AttributeError):
+        pass
+    reasons.discard(None)
+    return reasons
+
+def is_auth_error(error):
+    """
+    ตรวจว่า error หมายถึงสิทธิ์ใช้งานไม่ได้ (ผู้ใช้ต้องเข้าสู่ระบบใหม่ ลองใหม่ไม่ช่วย):
+    refresh token ใช้ไม่ได้, 401 หรือ 403 ที่เป็นเรื่องสิทธิ์จริง (ไม่ใช่ 403 จากการจำกัดอัตรา)
+    """
+    if isinstance(error, RefreshError):
+        return True
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status == 401:
+        return True
+    return status == 403 and bool(http_error_reasons(error) & PERMISSION_ERROR_REASONS)
+
+# แคชเดียวใช้ร่วมกันทั้ง process
+resource_cache = UserResourceCache(db_path=os.environ.get('USER_RESOURCES_DB', 'user_resources.db'))
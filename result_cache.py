@@ -0,0 +1,287 @@
+# result_cache.py - แคชผลลัพธ์ของ process_image ตาม hash ของภาพ (ภาพซ้ำไม่ต้องรัน YOLO + OCR และไม่อัปโหลดซ้ำ)
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from common import thread_local_connection
+
+# ข้อมูลที่เป็นของการอัปโหลดแต่ละครั้ง ไม่เก็บในแคชผลลัพธ์ (เก็บแยกต่อผู้ใช้ใน uploads)
+PER_REQUEST_KEYS = ('processed_image_bytes', 'google_drive_link', 'upload_id', 'upload_status',
+                    'uploaded_filename', 'auth_error', 'error_message', 'image_path', 'processed_image_path')
+
+def config_version(models_config):
+    """
+    version ของ detector สำหรับใช้เป็นส่วนหนึ่งของ key (เปลี่ยนเมื่อ config หรือไฟล์โมเดลเปลี่ยน)
+
+    Args:
+        models_config (dict): config เดียวกับที่ส่งให้ detector
+
+    Returns:
+        str: version
+    """
+    parts = [json.dumps(models_config, sort_keys=True, default=str)]
+    try:
+        stat = os.stat(models_config['model_path'])
+        parts.append(f"{stat.st_size}:{int(stat.st_mtime)}")
+    except (KeyError, OSError):
+        pass
+    parts.append(os.environ.get('RESULT_CACHE_VERSION', ''))
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+class ResultCache:
+    """
+    แคชผลลัพธ์ของ process_image โดยใช้ SHA-256 ของภาพ + version ของ detector เป็น key
+    - ชั้นแรกเป็น LRU ในหน่วยความจำ (จำกัดจำนวนรายการและขนาดรวมของภาพที่ประมวลผลแล้ว)
+    - ชั้นที่สองเป็น SQLite (ถ้ากำหนด db_path) ที่ไม่หายเมื่อรีสตาร์ท
+    - ภาพเดียวกันที่ส่งเข้ามาพร้อมกัน (เช่น กดประมวลผลซ้ำ) จะรัน detector ครั้งเดียว
+    - เก็บ upload_id / google_drive_link ของแต่ละผู้ใช้ เพื่อไม่อัปโหลดภาพเดิมซ้ำ
+    """
+
+    def __init__(self, version, max_entries=256, max_bytes=64 * 1024 * 1024, db_path=None, ttl_seconds=7 * 24 * 3600):
+        """
+        Args:
+            version (str): version ของ detector (ดู config_version)
+            max_entries (int): จำนวนผลลัพธ์สูงสุดในหน่วยความจำ
+            max_bytes (int): ขนาดรวมสูงสุดของภาพที่ประมวลผลแล้วในหน่วยความจำ
+            db_path (str, optional): ไฟล์ SQLite (None = เก็บในหน่วยความจำอย่างเดียว)
+            ttl_seconds (int): อายุของผลลัพธ์ในแคช (วินาที)
+        """
+        self.version = version
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+
+        self._entries = OrderedDict()  # key -> dict(results, image, created_at)
+        self._uploads = OrderedDict()  # (key, owner) -> dict(upload_id, google_drive_link)
+        self._inflight = {}            # key -> Future
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._joined = 0
+        self._time_saved = 0.0
+
+        if db_path:
+            self._init_db()
+
+    def _conn(self):
+        return thread_local_connection(self._local, self.db_path)
+
+    def _init_db(self):
+        conn = self._conn()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    results TEXT NOT NULL,
+                    image BLOB,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS uploads (
+                    key TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    upload_id TEXT,
+                    google_drive_link TEXT,
+                    PRIMARY KEY (key, owner)
+                )
+            ''')
+            # ผลลัพธ์ของ version เก่าหรือหมดอายุแล้วใช้ไม่ได้อีก
+            expired = conn.execute('DELETE FROM results WHERE key NOT LIKE ? OR created_at < ?',
+                                   (f"{self.version}:%", time.time() - self.ttl_seconds)).rowcount
+            conn.execute('DELETE FROM uploads WHERE key NOT IN (SELECT key FROM results)')
+        if expired:
+            print(f"🧹 Removed {expired} stale cached results")
+
+    def key_for(self, image_bytes, mode='single'):
+        """
+        Args:
+            image_bytes (bytes): ข้อมูลไฟล์ภาพ
+            mode (str): 'single' หรือ 'panel' (ผลลัพธ์และภาพที่วาดต่างกัน จึงแยก key)
+
+        Returns:
+            str: key ของภาพ (version ของ detector + โหมด + SHA-256 ของข้อมูลไฟล์)
+        """
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        if mode == 'single':
+            return f"{self.version}:{digest}"
+        return f"{self.version}:{mode}:{digest}"
+
+    def get_or_process(self, key, process):
+        """
+        คืนผลลัพธ์จากแคช หรือเรียก process() ถ้ายังไม่มี (request อื่นที่ส่งภาพเดียวกันมาพร้อมกันจะรอผลเดียวกัน)
+
+        Args:
+            key (str): key จาก key_for
+            process (callable): คืนผลลัพธ์ของ detector.process_image (encode_image=True)
+
+        Returns:
+            tuple: (results (dict สำเนาใหม่ รวม processed_image_bytes), cached (bool))
+        """
+        entry = self._lookup(key)
+        if entry:
+            return self._copy(entry), True
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self._joined += 1
+
+        if not owner:
+            entry = future.result()
+            if entry is None:
+                # request แรกล้มเหลว - ประมวลผลเอง
+                return process(), False
+            return self._copy(entry), True
+
+        entry = None
+        try:
+            results = process()
+            if results and not results.get('error'):
+                entry = self._store(key, results)
+            return results, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(entry)
+
+    def get_upload(self, key, owner):
+        """
+        Returns:
+            dict: {'upload_id', 'google_drive_link'} ของภาพนี้ที่ผู้ใช้เคยอัปโหลด หรือ None
+        """
+        if not owner:
+            return None
+        with self._lock:
+            upload = self._uploads.get((key, owner))
+        if upload is None and self.db_path:
+            row = self._conn().execute('SELECT upload_id, google_drive_link FROM uploads WHERE key = ? AND owner = ?',
+                                       (key, owner)).fetchone()
+            if row:
+                upload = {'upload_id': row['upload_id'], 'google_drive_link': row['google_drive_link']}
+                with self._lock:
+                    self._remember_upload(key, owner, upload)
+        return dict(upload) if upload else None
+
+    def set_upload(self, key, owner, upload_id=None, google_drive_link=None):
+        """บันทึกการอัปโหลดของภาพนี้ (upload_id ของคิวอัปโหลด หรือลิงก์ถ้าอัปโหลดเสร็จแล้ว)"""
+        if not owner:
+            return
+        upload = {'upload_id': upload_id, 'google_drive_link': google_drive_link}
+        with self._lock:
+            self._remember_upload(key, owner, upload)
+        if self.db_path:
+            conn = self._conn()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO uploads (key, owner, upload_id, google_drive_link) VALUES (?, ?, ?, ?)',
+                             (key, owner, upload_id, google_drive_link))
+
+    def discard_upload(self, key, owner):
+        """ลืมการอัปโหลดเดิม (เช่น อัปโหลดล้มเหลว) ให้ภาพนี้อัปโหลดใหม่ได้"""
+        with self._lock:
+            self._uploads.pop((key, owner), None)
+        if self.db_path:
+            conn = self._conn()
+            with conn:
+                conn.execute('DELETE FROM uploads WHERE key = ? AND owner = ?', (key, owner))
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'hits': self._hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'joined_inflight': self._joined,
+                'hit_rate': self._hits / lookups if lookups else None,
+                'time_saved_seconds': round(self._time_saved, 2),
+                'persistent': bool(self.db_path)
+            }
+
+    def _lookup(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry['created_at'] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                self._time_saved += entry['results'].get('elapsed_time') or 0
+                return entry
+            if entry:
+                self._remove(key)
+
+        if self.db_path:
+            row = self._conn().execute('SELECT results, image, created_at FROM results WHERE key = ?',
+                                       (key,)).fetchone()
+            if row and now - row['created_at'] < self.ttl_seconds:
+                entry = {'results': json.loads(row['results']), 'image': row['image'], 'created_at': row['created_at']}
+                with self._lock:
+                    self._put_memory(key, entry)
+                    self._hits += 1
+                    self._disk_hits += 1
+                    self._time_saved += entry['results'].get('elapsed_time') or 0
+                return entry
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def _store(self, key, results):
+        cached = {name: value for name, value in results.items() if name not in PER_REQUEST_KEYS}
+        entry = {
+            'results': json.loads(json.dumps(cached, default=str)),
+            'image': results.get('processed_image_bytes'),
+            'created_at': time.time()
+        }
+        with self._lock:
+            self._put_memory(key, entry)
+        if self.db_path:
+            try:
+                conn = self._conn()
+                with conn:
+                    conn.execute('INSERT OR REPLACE INTO results (key, results, image, created_at) VALUES (?, ?, ?, ?)',
+                                 (key, json.dumps(entry['results']), entry['image'], entry['created_at']))
+            except sqlite3.Error as e:
+                print(f"❌ Could not persist cached result: {e}")
+        return entry
+
+    def _copy(self, entry):
+        results = json.loads(json.dumps(entry['results']))
+        results['google_drive_link'] = None
+        results['image_path'] = None
+        results['processed_image_path'] = None
+        if entry['image']:
+            results['processed_image_bytes'] = entry['image']
+        return results
+
+    def _put_memory(self, key, entry):
+        self._remove(key)
+        self._entries[key] = entry
+        self._total_bytes += len(entry['image'] or b'')
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def _remember_upload(self, key, owner, upload):
+        self._uploads[(key, owner)] = upload
+        self._uploads.move_to_end((key, owner))
+        while len(self._uploads) > self.max_entries * 4:
+            self._uploads.popitem(last=False)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._total_bytes -= len(entry['image'] or b'')
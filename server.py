@@ -9,5 +9,6 @@ port = int(os.environ.get("PORT", 8080))
 if __name__ == '__main__':
     print(f"Starting Room Meter App on port {port}...")
     # ให้ Waitress รับการเชื่อมต่อจากทุก interface
-    serve(app, host='0.0.0.0', port=port)
+    # (SSE ของ /jobs/<id>/events ถือ thread ไว้ตลอดงาน จึงต้องมี thread มากกว่า JOB_SSE_MAX_STREAMS)
+    serve(app, host='0.0.0.0', port=port, threads=int(os.environ.get('WAITRESS_THREADS', 16)))
     print("Server started. Press Ctrl+C to stop.")
\ No newline at end of file
@@ -0,0 +1,447 @@
+# sheets_writer.py - บัฟเฟอร์แถวข้อมูลของแต่ละผู้ใช้แล้วเขียนลง Google Sheets ทีละหลายแถว
+import os
+import json
+import time
+import threading
+from collections import deque, OrderedDict
+from common import thread_local_connection, percentile
+from google_client_pool import client_pool
+from resource_cache import is_not_found_error, is_auth_error
+
+class SheetsWriteBuffer:
+    """
+    รวมแถวที่ผู้ใช้บันทึกไว้ แล้วเขียนลง Sheets ด้วย append ครั้งเดียว
+    - flush เมื่อจำนวนแถวครบ max_rows, เมื่อแถวแรกรอนานเกิน max_age หรือเมื่อสั่ง flush เอง
+    - ถ้าเขียนไม่สำเร็จ แถวจะกลับเข้าบัฟเฟอร์และลองใหม่แบบ backoff
+    - ถ้ากำหนด db_path แถวที่รออยู่จะถูกเก็บใน SQLite ก่อนตอบ client (ไม่หายเมื่อรีสตาร์ทหรือโปรแกรมล่ม)
+    - แถวที่มี reading_id (สร้างโดย client) ถูกเขียนครั้งเดียว: client ที่ส่งซ้ำหลังได้ error
+      (ขณะที่แถวเดิมยังรอลองใหม่อยู่ในบัฟเฟอร์) จะไม่ทำให้เกิดแถวซ้ำ
+    - แถวที่รอลิงก์จากคิวอัปโหลดจะถูกผูกกับตำแหน่งแถวหลัง flush เพื่อให้ worker เติมลิงก์ภายหลัง
+    """
+
+    QUOTA_WINDOW = 60  # โควตาการเขียนของ Sheets API นับต่อนาที
+
+    def __init__(self, max_rows=20, max_age=5.0, upload_queue=None, link_column_index=8, max_backoff=300,
+                 resource_cache=None, db_path=None, dedupe_ttl=7 * 24 * 3600):
+        """
+        Args:
+            max_rows (int): จำนวนแถวที่ทำให้ flush ทันที
+            max_age (float): เวลาสูงสุดที่แถวรออยู่ในบัฟเฟอร์ (วินาที)
+            upload_queue (UploadQueue, optional): คิวอัปโหลด สำหรับผูกแถวที่รอลิงก์รูปภาพ
+            link_column_index (int): คอลัมน์ของลิงก์รูปภาพในแถว
+            max_backoff (float): เวลารอสูงสุดระหว่างการลองใหม่เมื่อเขียนไม่สำเร็จ (วินาที)
+            resource_cache (UserResourceCache, optional): แคช ID ของ Spreadsheet ของผู้ใช้
+            db_path (str, optional): ไฟล์ SQLite สำหรับเก็บแถวที่รออยู่ (None = เก็บในหน่วยความจำอย่างเดียว)
+            dedupe_ttl (int): ระยะเวลาที่จำ reading_id ที่เขียนแล้ว เพื่อกันการส่งซ้ำ (วินาที)
+        """
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.upload_queue = upload_queue
+        self.link_column_index = link_column_index
+        self.max_backoff = max_backoff
+        self.resource_cache = resource_cache
+        self.db_path = db_path
+        self.dedupe_ttl = dedupe_ttl
+
+        # owner -> dict(rows, first_at, retry_at, failures, credentials, target, ...)
+        # rows เป็น list ของ (แถว, upload_id, reading_id, id ของแถวใน SQLite)
+        self._buffers = {}
+        self._written = OrderedDict()  # (owner, reading_id) -> เวลาที่เขียนลง Sheets แล้ว
+        self._flush_locks = {}      # owner -> Lock (flush ของผู้ใช้คนเดียวกันต้องเรียงลำดับ)
+        self._refreshed_credentials = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+
+        # metrics
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._rows_written = 0
+        self._api_requests = 0
+        self._flush_latencies = deque(maxlen=1000)
+        self._rows_per_flush = deque(maxlen=1000)
+        self._request_times = deque()  # เวลาของ request ที่ใช้โควตาในหน้าต่างล่าสุด
+
+        self._local = threading.local()
+        if db_path:
+            self._init_db()
+
+        self._thread = threading.Thread(target=self._run, name='sheets-writer', daemon=True)
+        self._thread.start()
+        print(f"🧾 Sheets write buffer enabled (max {max_rows} rows, max age {max_age}s)")
+
+    def _conn(self):
+        return thread_local_connection(self._local, self.db_path)
+
+    def _init_db(self):
+        """สร้างตารางและโหลดแถวที่ยังไม่ถูกเขียนจากรอบก่อนกลับเข้าบัฟเฟอร์"""
+        conn = self._conn()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sheet_rows (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    owner TEXT NOT NULL,
+                    row TEXT NOT NULL,
+                    upload_id TEXT,
+                    reading_id TEXT,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sheet_buffers (
+                    owner TEXT PRIMARY KEY,
+                    credentials TEXT NOT NULL,
+                    target TEXT NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS written_readings (
+                    owner TEXT NOT NULL,
+                    reading_id TEXT NOT NULL,
+                    written_at REAL NOT NULL,
+                    PRIMARY KEY (owner, reading_id)
+                )
+            ''')
+            conn.execute('DELETE FROM written_readings WHERE written_at < ?', (time.time() - self.dedupe_ttl,))
+            # credentials ไม่ต้องเก็บต่อถ้าไม่มีแถวรออยู่
+            conn.execute('DELETE FROM sheet_buffers WHERE owner NOT IN (SELECT DISTINCT owner FROM sheet_rows)')
+        try:
+            os.chmod(self.db_path, 0o600)  # มี OAuth credentials
+        except OSError:
+            pass
+
+        for row in conn.execute('SELECT owner, reading_id, written_at FROM written_readings ORDER BY written_at'):
+            self._written[(row['owner'], row['reading_id'])] = row['written_at']
+
+        buffers = {row['owner']: row for row in conn.execute('SELECT * FROM sheet_buffers')}
+        recovered = 0
+        for row in conn.execute('SELECT * FROM sheet_rows ORDER BY id'):
+            saved = buffers.get(row['owner'])
+            if saved is None:
+                continue
+            buffer = self._buffers.get(row['owner'])
+            if buffer is None:
+                buffer = self._buffers[row['owner']] = {
+                    'rows': [], 'first_at': time.time(), 'retry_at': None, 'failures': 0, 'last_error': None,
+                    'credentials': json.loads(saved['credentials']), 'target': json.loads(saved['target'])
+                }
+            buffer['rows'].append((json.loads(row['row']), row['upload_id'], row['reading_id'], row['id']))
+            recovered += 1
+        if recovered:
+            print(f"♻️ Recovered {recovered} buffered Sheets rows")
+
+    def _save_buffer_state(self, owner, buffer):
+        """บันทึก credentials / ชีตปลายทางของบัฟเฟอร์ (เรียกขณะถือ _condition)"""
+        if not self.db_path:
+            return
+        conn = self._conn()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO sheet_buffers (owner, credentials, target) VALUES (?, ?, ?)',
+                         (owner, json.dumps(buffer['credentials']), json.dumps(buffer['target'])))
+
+    def _is_duplicate(self, owner, buffer, reading_id):
+        """reading_id นี้รออยู่ในบัฟเฟอร์ กำลังถูกเขียน หรือถูกเขียนไปแล้ว (เรียกขณะถือ _condition)"""
+        if not reading_id:
+            return False
+        if (owner, reading_id) in self._written:
+            return True
+        return any(entry[2] == reading_id for entry in buffer['rows'] + buffer.get('inflight', []))
+
+    def add(self, owner, rows, credentials, target, upload_ids=None, reading_ids=None):
+        """
+        เพิ่มแถวเข้าบัฟเฟอร์ของผู้ใช้
+
+        Args:
+            owner (str): เจ้าของข้อมูล (email)
+            rows (list): แถวข้อมูล (list ของ list)
+            credentials (dict): OAuth credentials ล่าสุดของผู้ใช้
+            target (dict): {'sheet_id', 'data_sheet_id', 'data_sheet_title'}
+            upload_ids (list, optional): upload id ของแต่ละแถวที่ยังรอลิงก์ (None = ไม่รอ)
+            reading_ids (list, optional): id ของแต่ละการอ่านจาก client (แถวที่ id ซ้ำจะถูกข้าม)
+
+        Returns:
+            int: จำนวนแถวที่รออยู่ในบัฟเฟอร์
+        """
+        upload_ids = upload_ids or [None] * len(rows)
+        reading_ids = reading_ids or [None] * len(rows)
+        with self._condition:
+            buffer = self._buffers.get(owner)
+            switched = buffer is not None and buffer['target'].get('sheet_id') != target.get('sheet_id')
+        if switched:
+            # ผู้ใช้เปลี่ยน Spreadsheet - เขียนแถวของชีตเดิมให้เสร็จก่อน
+            self.flush(owner)
+
+        with self._condition:
+            buffer = self._buffers.get(owner)
+            if buffer is None or buffer['target'].get('sheet_id') != target.get('sheet_id'):
+                buffer = self._buffers[owner] = {
+                    'rows': [], 'first_at': None, 'retry_at': None, 'failures': 0,
+                    'last_error': None, 'target': dict(target)
+                }
+            buffer['credentials'] = credentials
+            for key, value in target.items():
+                if value is not None:
+                    buffer['target'][key] = value
+            now = time.time()
+            new_entries = []
+            for row, upload_id, reading_id in zip(rows, upload_ids, reading_ids):
+                if self._is_duplicate(owner, buffer, reading_id) or \
+                        (reading_id and any(entry[2] == reading_id for entry in new_entries)):
+                    print(f"♻️ ข้ามแถวที่ส่งซ้ำ (reading {reading_id})")
+                    continue
+                new_entries.append((row, upload_id, reading_id))
+
+            if new_entries and self.db_path:
+                # เก็บลง SQLite ก่อนตอบ client
+                self._save_buffer_state(owner, buffer)
+                conn = self._conn()
+                with conn:
+                    ids = [conn.execute(
+                        'INSERT INTO sheet_rows (owner, row, upload_id, reading_id, created_at) VALUES (?, ?, ?, ?, ?)',
+                        (owner, json.dumps(row), upload_id, reading_id, now)).lastrowid
+                        for row, upload_id, reading_id in new_entries]
+            else:
+                ids = [None] * len(new_entries)
+
+            if new_entries and not buffer['rows']:
+                buffer['first_at'] = now
+            buffer['rows'].extend((row, upload_id, reading_id, row_id)
+                                  for (row, upload_id, reading_id), row_id in zip(new_entries, ids))
+            pending = len(buffer['rows'])
+            self._condition.notify()
+        return pending
+
+    def flush(self, owner):
+        """
+        เขียนแถวที่รออยู่ของผู้ใช้ทันที
+
+        Returns:
+            dict: {'written', 'row_numbers', 'pending', 'error'}
+        """
+        with self._condition:
+            lock = self._flush_locks.setdefault(owner, threading.Lock())
+        with lock:
+            return self._flush(owner)
+
+    def pending(self, owner):
+        """
+        Returns:
+            dict: {'pending', 'failures', 'last_error'} ของผู้ใช้
+        """
+        with self._condition:
+            buffer = self._buffers.get(owner)
+            if not buffer:
+                return {'pending': 0, 'failures': 0, 'last_error': None}
+            return {'pending': len(buffer['rows']), 'failures': buffer['failures'],
+                    'last_error': buffer['last_error']}
+
+    def pop_refreshed_credentials(self, owner):
+        """credentials ที่ถูกต่ออายุระหว่าง flush (ถ้ามี) สำหรับอัปเดต session ของเจ้าของ"""
+        with self._condition:
+            return self._refreshed_credentials.pop(owner, None)
+
+    def stop(self, timeout=10):
+        """หยุด thread และเขียนแถวที่ค้างอยู่ทั้งหมด"""
+        with self._condition:
+            self._stopped = True
+            owners = [owner for owner, buffer in self._buffers.items() if buffer['rows']]
+            self._condition.notify()
+        deadline = time.time() + timeout
+        for owner in owners:
+            if time.time() > deadline:
+                break
+            self.flush(owner)
+
+    def _flush(self, owner):
+        with self._condition:
+            buffer = self._buffers.get(owner)
+            if not buffer or not buffer['rows']:
+                return {'written': 0, 'row_numbers': None, 'pending': 0, 'error': None}
+            entries = buffer['rows']
+            buffer['rows'] = []
+            buffer['inflight'] = entries
+            buffer['first_at'] = None
+            credentials = buffer['credentials']
+            target = buffer['target']
+            if self.resource_cache:
+                # ใช้ Spreadsheet ล่าสุดจากแคช (เช่น ถูกสร้างใหม่หลัง 404 ระหว่างที่แถวรออยู่)
+                cached = self.resource_cache.get(owner)
+                if cached and cached.get('sheet_id'):
+                    if cached['sheet_id'] != target.get('sheet_id'):
+                        target.clear()
+                    for key in ('sheet_id', 'data_sheet_id', 'data_sheet_title'):
+                        if cached.get(key) is not None:
+                            target[key] = cached[key]
+
+        start_time = time.time()
+        requests_made = 0
+        try:
+            old_token = credentials.get('token')
+            google_client = client_pool.get(owner, credentials)
+
+            had_sheet = target.get('data_sheet_id') is not None or bool(target.get('data_sheet_title'))
+            if any(entry[1] for entry in entries) and not target.get('data_sheet_title'):
+                # ต้องรู้ตำแหน่งแถวเพื่อเติมลิงก์ภายหลัง จึงค้นหาชื่อชีตครั้งเดียว
+                target['data_sheet_id'], target['data_sheet_title'] = google_client.find_data_sheet(target['sheet_id'])
+                requests_made += 1
+                had_sheet = True
+
+            result = google_client.append_rows(target['sheet_id'], [entry[0] for entry in entries], target)
+            requests_made += 1 if had_sheet else 2
+
+            if self.resource_cache:
+                self.resource_cache.update(owner, data_sheet_id=target.get('data_sheet_id'),
+                                           data_sheet_title=target.get('data_sheet_title'))
+
+            row_numbers = result.get('row_numbers')
+            if row_numbers:
+                requests_made += self._attach_upload_links(google_client, target, entries, row_numbers)
+
+            updated = google_client.get_updated_credentials()
+            with self._condition:
+                buffer['inflight'] = []
+                self._mark_written(owner, entries)
+                if updated and updated.get('token') != old_token:
+                    self._refreshed_credentials[owner] = dict(updated)
+                    buffer['credentials'] = dict(updated)
+                    if buffer['rows']:
+                        self._save_buffer_state(owner, buffer)
+                buffer['failures'] = 0
+                buffer['retry_at'] = None
+                buffer['last_error'] = None
+                pending = len(buffer['rows'])
+            self._record_flush(len(entries), time.time() - start_time, requests_made)
+            print(f"✅ บันทึก {len(entries)} แถวลง Google Sheets ในครั้งเดียว")
+            return {'written': len(entries), 'row_numbers': row_numbers, 'pending': pending, 'error': None}
+
+        except Exception as e:
+            with self._condition:
+                # แถวที่เขียนไม่สำเร็จกลับไปอยู่หน้าบัฟเฟอร์ (รักษาลำดับเดิม)
+                buffer['inflight'] = []
+                buffer['rows'] = entries + buffer['rows']
+                buffer['first_at'] = start_time
+                buffer['failures'] += 1
+                buffer['last_error'] = str(e)
+                buffer['retry_at'] = time.time() + min(self.max_backoff, 5 * 2 ** (buffer['failures'] - 1))
+                pending = len(buffer['rows'])
+                self._failed_flushes += 1
+            self._record_requests(max(requests_made, 1))
+            if self.resource_cache and is_not_found_error(e):
+                self.resource_cache.report_not_found(owner, credentials)
+            print(f"❌ บันทึกข้อมูลลง Google Sheets ไม่สำเร็จ (ครั้งที่ {buffer['failures']}, รอ {pending} แถว): {e}")
+            return {'written': 0, 'row_numbers': None, 'pending': pending, 'error': str(e),
+                    'auth_error': is_auth_error(e)}
+
+    def _attach_upload_links(self, google_client, target, entries, row_numbers):
+        """ผูกแถวที่รอลิงก์กับคิวอัปโหลด ถ้าอัปโหลดเสร็จแล้วให้เติมลิงก์ทันที (คืนจำนวน request ที่ใช้)"""
+        if not self.upload_queue:
+            return 0
+        requests_made = 0
+        for (_, upload_id, _, _), row_number in zip(entries, row_numbers):
+            if not upload_id:
+                continue
+            link = self.upload_queue.attach_sheet_row(upload_id, target['sheet_id'],
+                                                      target.get('data_sheet_id'), row_number)
+            if link:
+                try:
+                    google_client.update_sheet_cell(target['sheet_id'], target.get('data_sheet_id'),
+                                                    row_number, self.link_column_index, link)
+                    requests_made += 1
+                except Exception as e:
+                    print(f"❌ ไม่สามารถเติมลิงก์รูปภาพใน Sheets: {e}")
+        return requests_made
+
+    def _mark_written(self, owner, entries):
+        """ลบแถวที่เขียนแล้วออกจาก SQLite และจำ reading_id ไว้กันการส่งซ้ำ (เรียกขณะถือ _condition)"""
+        now = time.time()
+        for _, _, reading_id, _ in entries:
+            if reading_id:
+                self._written[(owner, reading_id)] = now
+                self._written.move_to_end((owner, reading_id))
+        while self._written and next(iter(self._written.values())) < now - self.dedupe_ttl:
+            self._written.popitem(last=False)
+
+        if not self.db_path:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany('DELETE FROM sheet_rows WHERE id = ?',
+                             [(row_id,) for _, _, _, row_id in entries if row_id is not None])
+            conn.executemany('INSERT OR REPLACE INTO written_readings (owner, reading_id, written_at) VALUES (?, ?, ?)',
+                             [(owner, reading_id, now) for _, _, reading_id, _ in entries if reading_id])
+            if not self._buffers[owner]['rows']:
+                conn.execute('DELETE FROM sheet_buffers WHERE owner = ?', (owner,))
+
+    def _record_flush(self, rows, latency, requests_made):
+        with self._condition:
+            self._flushes += 1
+            self._rows_written += rows
+            self._flush_latencies.append(latency)
+            self._rows_per_flush.append(rows)
+        self._record_requests(requests_made)
+
+    def _record_requests(self, count):
+        now = time.time()
+        with self._condition:
+            self._api_requests += count
+            self._request_times.extend([now] * count)
+            while self._request_times and self._request_times[0] < now - self.QUOTA_WINDOW:
+                self._request_times.popleft()
+
+    def _next_due(self):
+        """(owner, เวลาที่ต้อง flush) ของบัฟเฟอร์ที่ถึงกำหนดเร็วที่สุด"""
+        due_owner, due_at = None, None
+        for owner, buffer in self._buffers.items():
+            if not buffer['rows']:
+                continue
+            if buffer['retry_at']:
+                at = buffer['retry_at']
+            elif len(buffer['rows']) >= self.max_rows:
+                at = 0
+            else:
+                at = buffer['first_at'] + self.max_age
+            if due_at is None or at < due_at:
+                due_owner, due_at = owner, at
+        return due_owner, due_at
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                owner, due_at = self._next_due()
+                wait = None if due_at is None else due_at - time.time()
+                if wait is None or wait > 0:
+                    self._condition.wait(wait)
+                    continue
+            self.flush(owner)
+
+    def get_metrics(self):
+        """สถิติการเขียน: เวลาต่อ flush, จำนวนแถวต่อ flush และจำนวน request ที่ใช้โควตา"""
+        now = time.time()
+        with self._condition:
+            latencies = list(self._flush_latencies)
+            rows_per_flush = list(self._rows_per_flush)
+            while self._request_times and self._request_times[0] < now - self.QUOTA_WINDOW:
+                self._request_times.popleft()
+            return {
+                'max_rows': self.max_rows,
+                'max_age_seconds': self.max_age,
+                'buffered_rows': sum(len(buffer['rows']) for buffer in self._buffers.values()),
+                'buffered_users': sum(1 for buffer in self._buffers.values() if buffer['rows']),
+                'flushes': self._flushes,
+                'failed_flushes': self._failed_flushes,
+                'rows_written': self._rows_written,
+                'rows_per_flush': {
+                    'avg': sum(rows_per_flush) / len(rows_per_flush) if rows_per_flush else None,
+                    'max': max(rows_per_flush) if rows_per_flush else None
+                },
+                'flush_latency_ms': {
+                    'avg': sum(latencies) / len(latencies) * 1000 if latencies else None,
+                    'p50': percentile(latencies, 50) * 1000 if latencies else None,
+                    'p99': percentile(latencies, 99) * 1000 if latencies else None
+                },
+                'quota': {
+                    'api_requests': self._api_requests,
+                    'requests_last_minute': len(self._request_times)
+                }
+            }
@@ -22,6 +22,11 @@ document.addEventListener('DOMContentLoaded', function() {
     const googleDriveLink = document.getElementById('googleDriveLink');
     const uploadStatus = document.getElementById('uploadStatus');
     const saveTooltip = document.getElementById('saveTooltip');
+    const processStage = document.getElementById('processStage');
+    const panelModeToggle = document.getElementById('panelModeToggle');
+    const panelReadingsContainer = document.getElementById('panelReadingsContainer');
+    const panelReadingsList = document.getElementById('panelReadingsList');
+    const panelPairCount = document.getElementById('panelPairCount');
     
     // สำหรับเก็บข้อมูลผลลัพธ์
     let resultData = null;
@@ -269,16 +274,15 @@ document.addEventListener('DOMContentLoaded', function() {
             // สร้าง FormData
             const formData = new FormData();
             formData.append('file', fileInput.files[0]);
+            // โหมดแผงมิเตอร์: อ่านทุกคู่ห้อง-มิเตอร์ในภาพเดียว
+            formData.append('mode', panelModeToggle && panelModeToggle.checked ? 'panel' : 'single');
             
-            // ส่ง request ไปยัง API
-            fetch('/process', {
-                method: 'POST',
-                body: formData
-            })
-            .then(response => response.json())
+            // ส่งไฟล์เพื่อสร้างงาน แล้วติดตามความคืบหน้าจนเสร็จ
+            submitProcessJob(formData)
             .then(data => {
                 // ซ่อนการโหลด
                 loadingIndicator.style.display = 'none';
+                processStage.textContent = '';
                 processButton.disabled = false;
                 
                 // ตรวจสอบ auth error
@@ -292,8 +296,9 @@ document.addEventListener('DOMContentLoaded', function() {
                     return;
                 }
                 
-                // เก็บข้อมูลผลลัพธ์สำหรับการบันทึก
+                // เก็บข้อมูลผลลัพธ์สำหรับการบันทึก (reading_id ใช้กันแถวซ้ำเมื่อส่งข้อมูลเดิมอีกครั้ง)
                 resultData = data;
+                resultData.reading_id = newReadingId();
                 
                 // แสดงผลลัพธ์
                 displayResults(data);
@@ -312,12 +317,96 @@ document.addEventListener('DOMContentLoaded', function() {
             .catch(error => {
                 console.error('Error:', error);
                 loadingIndicator.style.display = 'none';
+                processStage.textContent = '';
                 processButton.disabled = false;
                 alert('เกิดข้อผิดพลาดในการเชื่อมต่อ: ' + error);
             });
         }
     });
 
+    // *** งานประมวลผลแบบ asynchronous: POST /jobs แล้วติดตามผ่าน SSE (หรือ polling) ***
+    const STAGE_LABELS = {
+        queued: 'กำลังรอคิว...',
+        running: 'กำลังเริ่มประมวลผล...',
+        batched: 'กำลังตรวจจับและอ่านตัวเลข...',
+        detected: 'ตรวจจับตำแหน่งแล้ว กำลังอ่านตัวเลข...',
+        ocr_done: 'อ่านตัวเลขเสร็จแล้ว กำลังบันทึกภาพ...',
+        cached: 'พบผลลัพธ์ของภาพนี้แล้ว (เคยประมวลผล)',
+        upload_queued: 'เพิ่มภาพเข้าคิวอัปโหลดแล้ว',
+        uploaded: 'อัปโหลดภาพไปยัง Google Drive แล้ว'
+    };
+
+    function showStage(stage) {
+        if (STAGE_LABELS[stage]) {
+            processStage.textContent = STAGE_LABELS[stage];
+        }
+    }
+
+    async function submitProcessJob(formData) {
+        const response = await fetch('/jobs', {
+            method: 'POST',
+            body: formData
+        });
+        const data = await response.json();
+        if (data.error) {
+            return data;
+        }
+        showStage('queued');
+        return await watchJob(data);
+    }
+
+    function watchJob(job) {
+        if (!window.EventSource) {
+            return pollJob(job.status_url);
+        }
+
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(job.events_url);
+            let finished = false;
+
+            Object.keys(STAGE_LABELS).forEach(stage => {
+                source.addEventListener(stage, () => showStage(stage));
+            });
+
+            source.addEventListener('result', () => {
+                finished = true;
+                source.close();
+                // ดึงผลลัพธ์ผ่าน GET เพื่อให้ server อัปเดต session (เช่น token ที่ถูกต่ออายุ)
+                pollJob(job.status_url).then(resolve, reject);
+            });
+
+            source.onerror = () => {
+                if (finished) {
+                    return;
+                }
+                // SSE ใช้ไม่ได้ (เช่น ถูก proxy ตัด) - เปลี่ยนไปใช้ polling
+                console.warn('⚠️ SSE unavailable, falling back to polling');
+                finished = true;
+                source.close();
+                pollJob(job.status_url).then(resolve, reject);
+            };
+        });
+    }
+
+    async function pollJob(statusUrl) {
+        while (true) {
+            const response = await fetch(statusUrl);
+            const job = await response.json();
+            if (job.error && !job.status) {
+                return job;
+            }
+
+            showStage(job.stage);
+            if (job.status === 'done') {
+                return job.result;
+            }
+            if (job.status === 'error') {
+                return { error: job.error };
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+
     // บันทึกลง Google Sheets (ปรับปรุงแล้ว - มี Auth Error Handling)
     saveToSheetsButton.addEventListener('click', function() {
         if (!resultData || !resultData.can_upload) {
@@ -325,6 +414,12 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
 
+        // โหมดแผงมิเตอร์: บันทึกทุกคู่ในครั้งเดียว
+        if (resultData.pairs && resultData.pairs.length) {
+            savePanelReadings();
+            return;
+        }
+
         // ตรวจสอบอีกครั้งว่ามีข้อมูลครบ
         const roomNumberInput = document.getElementById('roomNumberInput');
         const meterNumberInput = document.getElementById('meterNumberInput');
@@ -353,6 +448,8 @@ document.addEventListener('DOMContentLoaded', function() {
             decimal_edited: decimalNumberInput.dataset.edited === 'true',
             full_meter: document.getElementById('fullMeterDisplay').textContent,
             google_drive_link: resultData.google_drive_link,
+            upload_id: resultData.upload_id,
+            reading_id: resultData.reading_id,
             processed_image_path: resultData.processed_image_path
         };
 
@@ -381,6 +478,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 saveErrorMessage.textContent = data.error;
                 saveErrorMessage.classList.remove('hide');
             } else {
+                saveSuccessMessage.textContent = data.message || 'บันทึกข้อมูลเรียบร้อยแล้ว';
                 saveSuccessMessage.classList.remove('hide');
                 // ปิดปุ่มบันทึกหลังจากบันทึกสำเร็จ
                 saveToSheetsButton.disabled = true;
@@ -388,12 +486,192 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .catch(error => {
             console.error('Error:', error);
+            savingIndicator.style.display = 'none';
+            saveResultMessage.classList.remove('hide');
+            // เชื่อมต่อไม่ได้ - เก็บไว้ในเครื่องแล้วส่งแบบกลุ่มเมื่อกลับมาออนไลน์
+            queueOfflineReading(dataToBeSaved);
+            saveToSheetsButton.disabled = true;
+            saveErrorMessage.textContent = 'ไม่สามารถเชื่อมต่อได้ บันทึกไว้ในเครื่องแล้ว จะส่งอัตโนมัติเมื่อกลับมาออนไลน์';
+            saveErrorMessage.classList.remove('hide');
+        });
+    });
+
+    // id ของการอ่านแต่ละครั้ง - ส่งซ้ำด้วย id เดิม (เช่น หลังเกิด error หรือจากข้อมูลออฟไลน์) เซิร์ฟเวอร์จะไม่เขียนแถวซ้ำ
+    function newReadingId() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    }
+
+    // *** โหมดแผงมิเตอร์: แสดงและบันทึกทุกคู่ที่พบในภาพ ***
+    function renderPanelReadings(data) {
+        panelReadingsList.innerHTML = '';
+        if (!data.pairs || !data.pairs.length) {
+            panelReadingsContainer.classList.add('hide');
+            return;
+        }
+
+        panelPairCount.textContent = data.pairs.length;
+        data.pairs.forEach((pair, index) => {
+            const row = document.createElement('div');
+            row.className = 'panel-reading grid grid-cols-4 gap-2 items-center text-sm';
+            row.dataset.readingId = newReadingId();
+            const label = document.createElement('span');
+            label.className = 'font-bold text-gray-700';
+            label.textContent = `#${index + 1}`;
+            row.appendChild(label);
+            row.appendChild(createPanelInput('room', 'ห้อง', pair.room_number));
+            row.appendChild(createPanelInput('meter', 'มิเตอร์', pair.meter_number));
+            row.appendChild(createPanelInput('decimal', 'ทศนิยม', pair.decimal_number));
+            panelReadingsList.appendChild(row);
+        });
+        panelReadingsContainer.classList.remove('hide');
+    }
+
+    function createPanelInput(field, placeholder, number) {
+        const input = document.createElement('input');
+        input.type = 'text';
+        input.className = 'border-b border-gray-300 focus:outline-none focus:border-blue-500 w-full font-medium';
+        input.placeholder = placeholder;
+        input.value = number && number.value !== null ? number.value : '';
+        input.dataset.field = field;
+        input.dataset.originalValue = input.value;
+        input.title = number && number.value !== null
+            ? `ความเชื่อมั่น: ${(number.confidence * 100).toFixed(1)}%`
+            : 'ไม่พบข้อมูล';
+        return input;
+    }
+
+    function collectPanelReadings() {
+        return Array.from(panelReadingsList.querySelectorAll('.panel-reading')).map(row => {
+            const inputs = {};
+            row.querySelectorAll('input').forEach(input => {
+                inputs[input.dataset.field] = input;
+            });
+            const meter = inputs.meter.value.trim();
+            const decimal = inputs.decimal.value.trim();
+            return {
+                room_number: inputs.room.value.trim(),
+                room_edited: inputs.room.value !== inputs.room.dataset.originalValue,
+                meter_number: meter,
+                meter_edited: inputs.meter.value !== inputs.meter.dataset.originalValue,
+                decimal_number: decimal,
+                decimal_edited: inputs.decimal.value !== inputs.decimal.dataset.originalValue,
+                full_meter: decimal ? `${meter}.${decimal}` : meter,
+                google_drive_link: resultData.google_drive_link,
+                upload_id: resultData.upload_id,
+                reading_id: row.dataset.readingId
+            };
+        });
+    }
+
+    function savePanelReadings() {
+        const readings = collectPanelReadings();
+        if (readings.some(reading => !reading.room_number || !reading.meter_number)) {
+            alert('กรุณากรอกเลขห้องและเลขมิเตอร์ของทุกคู่ให้ครบถ้วน');
+            return;
+        }
+
+        savingIndicator.style.display = 'block';
+        saveToSheetsButton.disabled = true;
+        saveResultMessage.classList.add('hide');
+        saveSuccessMessage.classList.add('hide');
+        saveErrorMessage.classList.add('hide');
+
+        // ส่งทุกคู่เป็น list เดียว - เซิร์ฟเวอร์เขียนทุกแถวในการเรียก Sheets ครั้งเดียว
+        fetch('/save-to-sheets', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(readings)
+        })
+        .then(response => response.json())
+        .then(data => {
             savingIndicator.style.display = 'none';
             saveToSheetsButton.disabled = false;
             saveResultMessage.classList.remove('hide');
-            saveErrorMessage.textContent = 'เกิดข้อผิดพลาดในการเชื่อมต่อ';
+
+            if (data.auth_error) {
+                handleAuthError(data);
+                return;
+            }
+
+            if (data.error) {
+                saveErrorMessage.textContent = data.error;
+                saveErrorMessage.classList.remove('hide');
+            } else {
+                const rejected = data.rejected ? data.rejected.length : 0;
+                saveSuccessMessage.textContent = (data.message || 'บันทึกข้อมูลเรียบร้อยแล้ว') +
+                    (rejected ? ` (ข้าม ${rejected} รายการที่ข้อมูลไม่ครบ)` : '');
+                saveSuccessMessage.classList.remove('hide');
+                saveToSheetsButton.disabled = true;
+            }
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            savingIndicator.style.display = 'none';
+            saveResultMessage.classList.remove('hide');
+            readings.forEach(queueOfflineReading);
+            saveToSheetsButton.disabled = true;
+            saveErrorMessage.textContent = 'ไม่สามารถเชื่อมต่อได้ บันทึกไว้ในเครื่องแล้ว จะส่งอัตโนมัติเมื่อกลับมาออนไลน์';
             saveErrorMessage.classList.remove('hide');
         });
+    }
+
+    // ข้อมูลที่บันทึกตอนออฟไลน์ (เก็บใน localStorage และส่งผ่าน /save-to-sheets/bulk)
+    const OFFLINE_READINGS_KEY = 'pendingReadings';
+
+    function loadOfflineReadings() {
+        try {
+            return JSON.parse(localStorage.getItem(OFFLINE_READINGS_KEY)) || [];
+        } catch (error) {
+            return [];
+        }
+    }
+
+    function queueOfflineReading(reading) {
+        const now = new Date();
+        const pad = n => String(n).padStart(2, '0');
+        reading.recorded_at = `${now.getFullYear()}-${pad(now.getMonth() + 1)}-${pad(now.getDate())} ` +
+            `${pad(now.getHours())}:${pad(now.getMinutes())}:${pad(now.getSeconds())}`;
+        const readings = loadOfflineReadings();
+        readings.push(reading);
+        localStorage.setItem(OFFLINE_READINGS_KEY, JSON.stringify(readings));
+    }
+
+    async function sendOfflineReadings() {
+        const readings = loadOfflineReadings();
+        if (!readings.length || !navigator.onLine) return;
+
+        try {
+            const response = await fetch('/save-to-sheets/bulk', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ readings: readings })
+            });
+            const data = await response.json();
+            if (data.auth_error) {
+                handleAuthError(data);
+                return;
+            }
+            if (data.success || (data.rejected && data.rejected.length === readings.length)) {
+                // รายการที่ข้อมูลไม่ครบจะไม่มีวันบันทึกได้ จึงลบออกพร้อมกัน
+                localStorage.removeItem(OFFLINE_READINGS_KEY);
+                console.log(`✅ ส่งข้อมูลที่บันทึกตอนออฟไลน์แล้ว ${data.saved || 0} รายการ`);
+            }
+        } catch (error) {
+            console.error('Error sending offline readings:', error);
+        }
+    }
+
+    window.addEventListener('online', sendOfflineReadings);
+    sendOfflineReadings();
+
+    // เขียนแถวที่รออยู่ในบัฟเฟอร์ของเซิร์ฟเวอร์ก่อนปิดหน้าเว็บ
+    window.addEventListener('pagehide', function() {
+        if (navigator.sendBeacon) {
+            navigator.sendBeacon('/save-to-sheets/flush');
+        }
     });
 
     // แสดงเหตุผลที่ไม่สามารถบันทึกได้
@@ -534,6 +812,9 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         });
         
+        // ทุกคู่ที่พบ (โหมดแผงมิเตอร์)
+        renderPanelReadings(data);
+        
         // เวลาที่ใช้
         document.getElementById('elapsedTime').textContent = `${data.elapsed_time.toFixed(2)} วินาที`;
         
@@ -549,6 +830,14 @@ document.addEventListener('DOMContentLoaded', function() {
             uploadStatus.textContent = 'อัปโหลดสำเร็จ';
             uploadStatus.className = 'badge badge-success mr-2 mb-1 sm:mb-0';
             googleDriveLink.classList.remove('hide');
+        } else if (data.upload_id) {
+            // ภาพอยู่ในคิวอัปโหลด - ติดตามสถานะจนได้ลิงก์
+            googleDriveContainer.classList.remove('hide');
+            googleDriveLink.href = '#';
+            uploadStatus.textContent = 'กำลังอัปโหลด...';
+            uploadStatus.className = 'badge badge-warning mr-2 mb-1 sm:mb-0';
+            googleDriveLink.classList.add('hide');
+            watchUpload(data);
         } else if (data.can_upload) {
             googleDriveContainer.classList.remove('hide');
             googleDriveLink.href = '#';
@@ -570,11 +859,45 @@ document.addEventListener('DOMContentLoaded', function() {
         }, 100);
     }
 
+    // *** ติดตามสถานะของภาพในคิวอัปโหลด Google Drive ***
+    async function watchUpload(data) {
+        const uploadId = data.upload_id;
+        while (resultData === data) {
+            await new Promise(resolve => setTimeout(resolve, 2000));
+            try {
+                const response = await fetch(`/uploads/${uploadId}/status`);
+                const upload = await response.json();
+                if (resultData !== data || upload.error) {
+                    return;
+                }
+
+                if (upload.status === 'done' && upload.google_drive_link) {
+                    data.google_drive_link = upload.google_drive_link;
+                    googleDriveLink.href = upload.google_drive_link;
+                    uploadStatus.textContent = 'อัปโหลดสำเร็จ';
+                    uploadStatus.className = 'badge badge-success mr-2 mb-1 sm:mb-0';
+                    googleDriveLink.classList.remove('hide');
+                    updateSaveTooltip(data);
+                    return;
+                }
+                if (upload.status === 'failed') {
+                    uploadStatus.textContent = 'ไม่สามารถอัปโหลดได้';
+                    uploadStatus.className = 'badge badge-error mr-2 mb-1 sm:mb-0';
+                    return;
+                }
+            } catch (error) {
+                console.error('Error checking upload status:', error);
+            }
+        }
+    }
+
     // อัพเดทข้อความใน tooltip สำหรับแสดงข้อมูลที่จะบันทึก
     function updateSaveTooltip(data) {
         let tooltipText = '';
         
-        if (data.room_number && data.room_number.value) {
+        if (data.pairs && data.pairs.length) {
+            tooltipText += `บันทึก ${data.pairs.length} รายการ (ทุกคู่ในภาพ), `;
+        } else if (data.room_number && data.room_number.value) {
             tooltipText += `เลขห้อง: ${data.room_number.value}, `;
         } else {
             tooltipText += 'เลขห้อง: ไม่พบข้อมูล, ';
@@ -590,6 +913,8 @@ document.addEventListener('DOMContentLoaded', function() {
         
         if (data.google_drive_link) {
             tooltipText += ', พร้อมลิงก์รูปภาพ';
+        } else if (data.upload_id) {
+            tooltipText += ', ลิงก์รูปภาพจะถูกเติมเมื่ออัปโหลดเสร็จ';
         } else {
             tooltipText += ', ไม่มีลิงก์รูปภาพ';
         }
@@ -0,0 +1,105 @@
+# test_crop_cache.py - ภาพถ่ายซ้ำของป้ายเดิมต้องใช้แคชได้ และป้ายเลขห้องที่ต่างกันต้องไม่ใช้ผล OCR ของกันและกัน
+import random
+import itertools
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+np = pytest.importorskip('numpy')
+
+from crop_cache import PerceptualCropCache
+
+ROOM_NUMBERS = ['101', '102', '103', '104', '105', '106', '107', '108', '109', '110', '111',
+                '201', '301', '501', '801', '1101', '1102']
+
+def plate(text, shift=0, scale=1.0):
+    """สร้างภาพป้ายเลขห้อง (ตัวอักษรสีดำบนพื้นขาว) เลื่อนไปทางขวา shift pixel และย่อ/ขยาย scale เท่า"""
+    img = np.full((60, 160, 3), 255, dtype=np.uint8)
+    cv2.putText(img, text, (15 + shift, 45), cv2.FONT_HERSHEY_SIMPLEX, 1.4, (0, 0, 0), 3)
+    if scale != 1.0:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return img
+
+def reshoot(text, rng):
+    """
+    จำลองการถ่ายป้ายเดิมซ้ำ: ป้ายบนผนัง หมุน/ย่อขยาย/เลื่อนเล็กน้อย เปลี่ยนแสง เบลอ มี noise
+    บีบอัด JPEG แล้ว crop ตามกรอบที่คลาดเคลื่อนแบบ YOLO
+    """
+    wall = np.full((200, 400, 3), 170, dtype=np.uint8)
+    cv2.rectangle(wall, (100, 60), (300, 140), (245, 245, 245), -1)
+    (w, h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 1.4, 2)
+    cv2.putText(wall, text, (200 - w // 2, 100 + h // 2), cv2.FONT_HERSHEY_SIMPLEX, 1.4, (20, 20, 20), 2)
+
+    matrix = cv2.getRotationMatrix2D((200, 100), rng.uniform(-2, 2), 1 + rng.uniform(-0.06, 0.06))
+    matrix[:, 2] += [rng.uniform(-8, 8), rng.uniform(-8, 8)]
+    img = cv2.warpAffine(wall, matrix, (400, 200), borderValue=(170, 170, 170))
+    img = cv2.convertScaleAbs(img, alpha=rng.uniform(0.8, 1.2), beta=rng.uniform(-25, 25))
+    if rng.random() < 0.5:
+        img = cv2.GaussianBlur(img, (3, 3), 0)
+    noise = np.random.default_rng(rng.randrange(1 << 30)).normal(0, 4, img.shape)
+    img = np.clip(img + noise, 0, 255).astype(np.uint8)
+    _, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, rng.randint(60, 95)])
+    img = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+
+    box = np.array([[[100 + rng.randint(-6, 6), 60 + rng.randint(-6, 6)]],
+                    [[300 + rng.randint(-6, 6), 140 + rng.randint(-6, 6)]]], dtype=np.float32)
+    (x1, y1), (x2, y2) = cv2.transform(box, matrix).reshape(-1, 2).astype(int)
+    return img[max(y1, 0):y2, max(x1, 0):x2]
+
+@pytest.mark.parametrize('shift,scale', [(1, 1.0), (2, 1.0), (3, 1.0), (0, 0.96), (0, 1.04), (2, 0.96)])
+def test_slightly_reframed_plate_hits(shift, scale):
+    cache = PerceptualCropCache()
+    cache.put('roomN', cache.key_for(plate('101')), ('101', 0.9, 'gray_base'), 0.5)
+    found = cache.lookup('roomN', cache.key_for(plate('101', shift, scale)))
+    assert found is not None
+    assert found['result'][0] == '101'
+
+def test_adjacent_room_numbers_never_collide():
+    cache = PerceptualCropCache()
+    for number in ROOM_NUMBERS:
+        cache.put('roomN', cache.key_for(plate(number)), (number, 0.9, 'gray_base'), 0.5)
+
+    for number in ROOM_NUMBERS:
+        for shift, scale in [(0, 1.0), (3, 1.0), (0, 0.96), (0, 1.04)]:
+            found = cache.lookup('roomN', cache.key_for(plate(number, shift, scale)))
+            assert found is not None
+            assert found['result'][0] == number
+
+def test_different_plate_is_a_miss():
+    for cached, other in itertools.permutations(ROOM_NUMBERS, 2):
+        cache = PerceptualCropCache()
+        cache.put('roomN', cache.key_for(plate(cached)), (cached, 0.9, 'gray_base'), 0.5)
+        for shift, scale in [(0, 1.0), (3, 1.0), (0, 0.96), (0, 1.04)]:
+            assert cache.lookup('roomN', cache.key_for(plate(other, shift, scale))) is None, (cached, other)
+
+def test_reshoots_hit_without_returning_another_room():
+    rng = random.Random(0)
+    cache = PerceptualCropCache()
+    for number in ROOM_NUMBERS:
+        cache.put('roomN', cache.key_for(reshoot(number, rng)), (number, 0.9, 'gray_base'), 0.5)
+
+    hits = direct_hits = lookups = 0
+    for number in ROOM_NUMBERS:
+        for _ in range(5):
+            found = cache.lookup('roomN', cache.key_for(reshoot(number, rng)))
+            lookups += 1
+            if found is None:
+                continue
+            # ผลที่ใช้ได้โดยไม่ต้องอ่านซ้ำต้องเป็นห้องเดียวกันเสมอ
+            assert found['needs_confirm'] or found['result'][0] == number
+            hits += found['result'][0] == number
+            direct_hits += not found['needs_confirm']
+    assert hits / lookups >= 0.8
+    assert direct_hits / lookups >= 0.4
+
+def test_crop_without_glyphs_is_not_cached():
+    cache = PerceptualCropCache()
+    blank = np.full((60, 160, 3), 255, dtype=np.uint8)
+    assert cache.key_for(blank) is None
+    cache.put('roomN', cache.key_for(blank), ('101', 0.9, 'gray_base'), 0.5)
+    assert cache.lookup('roomN', cache.key_for(blank)) is None
+
+def test_classes_are_separate():
+    cache = PerceptualCropCache(classes=('roomN', 'meter'))
+    key = cache.key_for(plate('101'))
+    cache.put('roomN', key, ('101', 0.9, 'gray_base'), 0.5)
+    assert cache.lookup('meter', key) is None
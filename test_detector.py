@@ -1,18 +1,18 @@
 # test_detector.py
 import os
-import cv2
 import time
 from detector import ImageDetector
 import glob
 from pathlib import Path
 
-def test_detector_batch(test_folder_path, output_folder):
+def test_detector_batch(test_folder_path, output_folder, batch_size=8):
     """
     ทดสอบ detector กับรูปทั้งหมดใน folder และบันทึกผลลัพธ์แยกตามประเภท
     
     Args:
         test_folder_path: เส้นทางของ folder ที่มีรูปทดสอบ
         output_folder: folder สำหรับเก็บผลลัพธ์
+        batch_size: จำนวนรูปต่อ batch ของ YOLO
     """
     
     # สร้าง detector
@@ -78,24 +78,29 @@ def test_detector_batch(test_folder_path, output_folder):
     all_meter1_results = []
     summary_results = []
     
-    # ประมวลผลทีละไฟล์ (Real-time)
-    for i, image_path in enumerate(image_files, 1):
+    # ประมวลผลเป็น batch (YOLO ของ batch ถัดไปทำงานระหว่าง OCR) และแสดงผลทีละไฟล์ (Real-time)
+    detections_iter = detector.iter_detections(image_files, batch_size=batch_size)
+    for index, img, detections_by_class, detect_time, error in detections_iter:
+        i = index + 1
+        image_path = image_files[index]
         filename = os.path.basename(image_path)
         print(f"\n[{i}/{total_files}] ประมวลผล: {filename}")
         
         try:
             start_time = time.time()
             
-            # อ่านภาพ
-            img = cv2.imread(image_path)
+            # ตรวจจับหรือ OCR ภาพนี้ไม่สำเร็จ - ข้ามไปภาพถัดไป
+            if error:
+                print(f"  ❌ เกิดข้อผิดพลาด: {error}")
+                error_files += 1
+                continue
+            
+            # อ่านภาพไม่ได้
             if img is None:
                 print(f"  ❌ ไม่สามารถอ่านไฟล์ได้: {filename}")
                 error_files += 1
                 continue
             
-            # ตรวจจับทุก bounding box และแยกตาม class
-            detections_by_class = detector.get_detections_by_class(img)
-            
             room_detections = detections_by_class['roomN']
             meter_detections = detections_by_class['meter']
             decimal_detections = detections_by_class['meter1']
@@ -104,7 +109,7 @@ def test_detector_batch(test_folder_path, output_folder):
             best_pair = detector.find_best_pairs_unified(detections_by_class)
             
             end_time = time.time()
-            process_time = end_time - start_time
+            process_time = detect_time + (end_time - start_time)
             total_time += process_time
             
             print(f"  📊 พบ: ห้อง {len(room_detections)}, มิเตอร์ {len(meter_detections)}, ทศนิยม {len(decimal_detections)}")
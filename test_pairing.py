@@ -0,0 +1,139 @@
+# test_pairing.py - Hungarian แบบไม่ใช้ scipy (ที่ใช้จริงใน production) และการจับคู่ห้อง ↔ มิเตอร์ ↔ ทศนิยม
+import math
+import random
+import itertools
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import pairing
+from pairing import linear_sum_assignment
+
+def brute_force_cost(cost):
+    """cost รวมที่ต่ำที่สุดของการจับคู่แบบ 1:1 (ลองทุกแบบ)"""
+    rows, cols = cost.shape
+    if rows <= cols:
+        return min(sum(cost[r, c] for r, c in zip(range(rows), perm))
+                   for perm in itertools.permutations(range(cols), rows))
+    return min(sum(cost[r, c] for r, c in zip(perm, range(cols)))
+               for perm in itertools.permutations(range(rows), cols))
+
+def assert_optimal(cost):
+    for solve in (pairing._hungarian, linear_sum_assignment):
+        rows, cols = solve(cost)
+        assert len(rows) == len(cols) == min(cost.shape)
+        assert len(set(rows)) == len(rows) and len(set(cols)) == len(cols)
+        assert cost[rows, cols].sum() == pytest.approx(brute_force_cost(cost))
+
+@pytest.mark.parametrize('shape', [(1, 1), (1, 4), (4, 1), (2, 5), (5, 2), (3, 3), (4, 6), (6, 4), (5, 5)])
+def test_hungarian_matches_brute_force(shape):
+    rng = np.random.default_rng(shape[0] * 10 + shape[1])
+    for _ in range(20):
+        assert_optimal(rng.uniform(-2, 0, shape))
+
+@pytest.mark.parametrize('shape', [(3, 3), (2, 5), (5, 2), (4, 6), (6, 4)])
+def test_hungarian_with_masked_pairs_matches_brute_force(shape):
+    # เหมือน find_all_pairs: คู่ที่อยู่ไกลเกินได้ cost 1e6
+    rng = np.random.default_rng(100 + shape[0] * 10 + shape[1])
+    for _ in range(20):
+        cost = rng.uniform(-2, 0, shape)
+        cost[rng.random(shape) < 0.5] = 1e6
+        assert_optimal(cost)
+
+def test_empty_matrix():
+    rows, cols = pairing._hungarian(np.zeros((0, 3)))
+    assert len(rows) == len(cols) == 0
+
+REFERENCE_SHAPE = (3000, 4000)  # เส้นทแยงมุม 5000 = PAIR_REFERENCE_DIAGONAL (ระยะเท่ากับแบบเดิม)
+
+@pytest.fixture
+def detector():
+    # detector.py import ultralytics / easyocr - ข้ามถ้าไม่ได้ติดตั้ง
+    module = pytest.importorskip('detector')
+    instance = module.ImageDetector.__new__(module.ImageDetector)
+    instance.PAIR_MAX_DISTANCE = 1000
+    instance.PAIR_DECIMAL_DISTANCE = 200
+    instance.FALLBACK_DECIMAL_DISTANCE = 600
+    instance.PAIR_REFERENCE_DIAGONAL = 5000
+    instance.PAIR_ASSIGNMENT = 'hungarian'
+    return instance
+
+def detection(rng, number, x, y):
+    return {'number': number, 'center': (x, y), 'box': (x - 20, y - 10, x + 20, y + 10),
+            'confidence': rng.uniform(0.3, 1.0), 'detection_confidence': rng.uniform(0.3, 1.0),
+            'method': 'gray_base'}
+
+def random_detections(rng, n_rooms, n_meters, n_decimals, size=REFERENCE_SHAPE):
+    def make(prefix, count):
+        return [detection(rng, f"{prefix}{i}", rng.uniform(0, size[1]), rng.uniform(0, size[0]))
+                for i in range(count)]
+    return {'roomN': make('R', n_rooms), 'meter': make('M', n_meters), 'meter1': make('D', n_decimals)}
+
+def old_best_pair(detections_by_class):
+    """find_best_pairs_unified แบบเดิม (ลูปห้อง × มิเตอร์ × ทศนิยม ระยะคงที่ 1000 / 200)"""
+    def dist(a, b):
+        return math.sqrt((a[0] - b[0])**2 + (a[1] - b[1])**2)
+
+    best_pair, best_score = None, -1
+    for room in detections_by_class['roomN']:
+        for meter in detections_by_class['meter']:
+            distance = dist(room['center'], meter['center'])
+            closest_decimal, min_decimal_distance = None, float('inf')
+            for decimal in detections_by_class['meter1']:
+                decimal_distance = dist(meter['center'], decimal['center'])
+                if decimal_distance < min_decimal_distance:
+                    min_decimal_distance, closest_decimal = decimal_distance, decimal
+            total_score = (max(0, 1000 - distance) / 1000 * 0.4
+                           + room['confidence'] * 0.3 + room['detection_confidence'] * 0.2
+                           + meter['confidence'] * 0.3 + meter['detection_confidence'] * 0.2)
+            if closest_decimal and min_decimal_distance < 200:
+                total_score += closest_decimal['confidence'] * 0.1
+            if total_score > best_score:
+                best_score = total_score
+                best_pair = {'room': room, 'meter': meter,
+                             'decimal': closest_decimal if closest_decimal and min_decimal_distance < 200 else None,
+                             'distance': distance, 'score': total_score}
+    return best_pair
+
+def test_best_pair_matches_old_loop_at_reference_diagonal(detector):
+    rng = random.Random(0)
+    for _ in range(200):
+        # รวมกรณีที่ทุกอย่างอยู่ใกล้กัน (มีทศนิยมในระยะ 200) และกรณีที่ไม่มีทศนิยม
+        size = rng.choice([REFERENCE_SHAPE, (400, 600)])
+        detections_by_class = random_detections(rng, rng.randint(1, 4), rng.randint(1, 4), rng.randint(0, 4), size)
+        expected = old_best_pair(detections_by_class)
+        pair = detector.find_best_pairs_unified(detections_by_class, REFERENCE_SHAPE)
+        assert pair['room'] is expected['room']
+        assert pair['meter'] is expected['meter']
+        assert pair['decimal'] is expected['decimal']
+        assert pair['distance'] == pytest.approx(expected['distance'])
+        assert pair['score'] == pytest.approx(expected['score'])
+
+def test_best_pair_needs_room_and_meter(detector):
+    rng = random.Random(1)
+    assert detector.find_best_pairs_unified(random_detections(rng, 0, 2, 1), REFERENCE_SHAPE) is None
+    assert detector.find_best_pairs_unified(random_detections(rng, 2, 0, 1), REFERENCE_SHAPE) is None
+
+@pytest.mark.parametrize('assignment', ['hungarian', 'greedy'])
+def test_all_pairs_use_each_detection_once(detector, assignment):
+    rng = random.Random(2)
+    for _ in range(100):
+        detections_by_class = random_detections(rng, rng.randint(1, 6), rng.randint(1, 6), rng.randint(0, 6),
+                                                (800, 1200))
+        pairs = detector.find_all_pairs(detections_by_class, REFERENCE_SHAPE, assignment)
+        assert pairs
+        for key in ('room', 'meter', 'decimal'):
+            used = [id(pair[key]) for pair in pairs if pair[key] is not None]
+            assert len(used) == len(set(used)), key
+
+def test_all_pairs_finds_every_meter_on_a_panel(detector):
+    # แผงมิเตอร์ 3 ตัว: ห้องอยู่เหนือมิเตอร์ และทศนิยมอยู่ข้างมิเตอร์ของตัวเอง
+    rng = random.Random(3)
+    detections_by_class = {
+        'roomN': [detection(rng, f"10{i}", 500 + i * 1200, 500) for i in range(3)],
+        'meter': [detection(rng, f"{i}234", 500 + i * 1200, 800) for i in range(3)],
+        'meter1': [detection(rng, f"{i}", 650 + i * 1200, 800) for i in range(3)]
+    }
+    pairs = detector.find_all_pairs(detections_by_class, REFERENCE_SHAPE)
+    assert [(p['room']['number'], p['meter']['number'], p['decimal']['number']) for p in pairs] == \
+        [('100', '0234', '0'), ('101', '1234', '1'), ('102', '2234', '2')]
@@ -0,0 +1,385 @@
+# upload_queue.py - คิวอัปโหลดภาพไปยัง Google Drive แบบ background ที่เก็บลง SQLite (ไม่หายเมื่อรีสตาร์ท)
+import os
+import json
+import time
+import uuid
+import threading
+from common import thread_local_connection
+from google_client_pool import client_pool
+from resource_cache import is_not_found_error, is_auth_error
+
+class UploadQueue:
+    """
+    คิวอัปโหลดไปยัง Google Drive ที่แยกออกจาก response ของ /process
+    - ภาพถูกเขียนลง spool_dir และงานถูกบันทึกใน SQLite ก่อนตอบ client
+    - worker thread ดึงงานไปอัปโหลด ถ้าล้มเหลว (เช่น Drive ล่ม) จะลองใหม่แบบ exponential backoff
+    - งานที่ค้างสถานะ uploading ตอนรีสตาร์ทจะกลับไปรอใหม่
+    - ถ้าแถวใน Sheets ถูกบันทึกก่อนอัปโหลดเสร็จ worker จะเติมลิงก์ลงในแถวนั้นภายหลัง
+      (หรือ FAILED_LINK_TEXT ถ้าอัปโหลดล้มเหลวถาวร)
+    - งานที่จบแล้ว (done/failed) ไม่เก็บ credentials ต่อ และถูกลบหลัง retention_seconds พร้อมไฟล์ใน spool
+    """
+
+    # คอลัมน์ของลิงก์ Google Drive ในแถวข้อมูล (คอลัมน์ I)
+    LINK_COLUMN_INDEX = 8
+    PENDING_LINK_TEXT = 'กำลังอัปโหลด...'
+    FAILED_LINK_TEXT = 'ไม่มีลิงก์ (อัปโหลดไม่สำเร็จ)'
+    PURGE_INTERVAL = 3600  # ลบงานที่หมดอายุทุกๆ กี่วินาที
+
+    def __init__(self, db_path='upload_queue.db', spool_dir='upload_spool', num_workers=2,
+                 max_attempts=20, max_backoff=900, resource_cache=None, retention_seconds=7 * 24 * 3600):
+        """
+        Args:
+            db_path (str): ไฟล์ SQLite ของคิว
+            spool_dir (str): โฟลเดอร์เก็บภาพที่รออัปโหลด
+            num_workers (int): จำนวน worker thread
+            max_attempts (int): จำนวนครั้งสูงสุดที่ลองอัปโหลดก่อนถือว่าล้มเหลว
+            max_backoff (int): เวลารอสูงสุดระหว่างการลองใหม่ (วินาที)
+            resource_cache (UserResourceCache, optional): แคช ID โฟลเดอร์ของผู้ใช้
+                (ถ้าโฟลเดอร์ถูกลบ จะค้นหาใหม่และใช้โฟลเดอร์ใหม่กับงานที่รออยู่)
+            retention_seconds (int): เก็บงานที่จบแล้วไว้นานเท่าไร (วินาที) ก่อนลบออกจากคิว
+        """
+        self.db_path = db_path
+        self.spool_dir = spool_dir
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.resource_cache = resource_cache
+        self.retention_seconds = retention_seconds
+        self._last_purge = 0.0
+        os.makedirs(spool_dir, exist_ok=True)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        # credentials ล่าสุดที่ถูกต่ออายุระหว่างอัปโหลด (owner -> dict) สำหรับอัปเดต session
+        self._refreshed_credentials = {}
+
+        self._init_db()
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f'drive-upload-{i}', daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _conn(self):
+        return thread_local_connection(self._local, self.db_path)
+
+    def _init_db(self):
+        conn = self._conn()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS uploads (
+                    id TEXT PRIMARY KEY,
+                    owner TEXT,
+                    file_path TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    folder_id TEXT NOT NULL,
+                    credentials TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    drive_link TEXT,
+                    error TEXT,
+                    sheet_target TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_uploads_pending ON uploads (status, next_attempt_at)')
+            # งานที่ค้างอยู่ระหว่างอัปโหลดตอนโปรแกรมหยุด ให้กลับไปรอใหม่
+            recovered = conn.execute(
+                "UPDATE uploads SET status = 'pending' WHERE status = 'uploading'").rowcount
+        try:
+            os.chmod(self.db_path, 0o600)  # มี OAuth credentials
+        except OSError:
+            pass
+        if recovered:
+            print(f"♻️ Recovered {recovered} interrupted Drive uploads")
+        self.purge()
+
+    def enqueue(self, image_data, file_name, folder_id, credentials, owner=None):
+        """
+        เพิ่มภาพเข้าคิวอัปโหลด
+
+        Args:
+            image_data (bytes): ข้อมูลภาพ JPEG
+            file_name (str): ชื่อไฟล์บน Google Drive
+            folder_id (str): โฟลเดอร์ปลายทาง
+            credentials (dict): OAuth credentials ของผู้ใช้
+            owner (str, optional): เจ้าของงาน (email)
+
+        Returns:
+            str: upload id
+        """
+        upload_id = str(uuid.uuid4())
+        file_path = os.path.join(self.spool_dir, f"{upload_id}.jpg")
+        with open(file_path, 'wb') as f:
+            f.write(image_data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                '''INSERT INTO uploads (id, owner, file_path, file_name, folder_id, credentials,
+                                        status, attempts, next_attempt_at, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, 'pending', 0, ?, ?, ?)''',
+                (upload_id, owner, file_path, file_name, folder_id, json.dumps(credentials), now, now, now))
+        self._wakeup.set()
+        return upload_id
+
+    def get(self, upload_id):
+        """
+        Returns:
+            dict: {'upload_id', 'owner', 'status', 'google_drive_link', 'attempts', 'error'} หรือ None
+        """
+        row = self._conn().execute('SELECT * FROM uploads WHERE id = ?', (upload_id,)).fetchone()
+        if not row:
+            return None
+        return {
+            'upload_id': row['id'],
+            'owner': row['owner'],
+            'status': row['status'],
+            'google_drive_link': row['drive_link'],
+            'attempts': row['attempts'],
+            'error': row['error']
+        }
+
+    def attach_sheet_row(self, upload_id, spreadsheet_id, data_sheet_id, row_number):
+        """
+        บันทึกตำแหน่งแถวใน Sheets ที่รอลิงก์ของงานนี้ เพื่อให้ worker เติมลิงก์เมื่ออัปโหลดเสร็จ
+        (ภาพเดียวอาจมีหลายแถว เช่น โหมดแผงมิเตอร์ ทุกแถวจะถูกเติมลิงก์)
+
+        Returns:
+            str: ลิงก์ ถ้าอัปโหลดเสร็จไปแล้ว หรือ FAILED_LINK_TEXT ถ้าล้มเหลวถาวร
+                (ผู้เรียกต้องเติมลงในแถวเอง) มิฉะนั้น None
+        """
+        target = {'spreadsheet_id': spreadsheet_id, 'data_sheet_id': data_sheet_id, 'row_number': row_number}
+        with self._lock:
+            conn = self._conn()
+            with conn:
+                row = conn.execute('SELECT status, drive_link, sheet_target FROM uploads WHERE id = ?',
+                                   (upload_id,)).fetchone()
+                if not row:
+                    return None
+                if row['status'] == 'done':
+                    return row['drive_link']
+                if row['status'] == 'failed':
+                    return self.FAILED_LINK_TEXT
+                targets = self._load_targets(row['sheet_target'])
+                if target not in targets:
+                    targets.append(target)
+                conn.execute('UPDATE uploads SET sheet_target = ?, updated_at = ? WHERE id = ?',
+                             (json.dumps(targets), time.time(), upload_id))
+        return None
+
+    def pop_refreshed_credentials(self, owner):
+        """credentials ที่ถูกต่ออายุโดย worker (ถ้ามี) สำหรับอัปเดต session ของเจ้าของ"""
+        with self._lock:
+            return self._refreshed_credentials.pop(owner, None)
+
+    def stats(self):
+        rows = self._conn().execute('SELECT status, COUNT(*) AS n FROM uploads GROUP BY status').fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def purge(self):
+        """ลบงานที่จบแล้ว (done/failed) ที่เก่ากว่า retention_seconds พร้อมไฟล์ภาพที่ยังเหลือใน spool"""
+        self._last_purge = time.time()
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            conn = self._conn()
+            with conn:
+                rows = conn.execute("SELECT id, file_path FROM uploads WHERE status IN ('done', 'failed') AND updated_at < ?",
+                                    (cutoff,)).fetchall()
+                conn.executemany('DELETE FROM uploads WHERE id = ?', [(row['id'],) for row in rows])
+                # งานเก่าจากก่อนที่จะล้าง credentials ตอนจบงาน
+                conn.execute("UPDATE uploads SET credentials = '{}' WHERE status IN ('done', 'failed') AND credentials != '{}'")
+        for row in rows:
+            self._remove_spool_file(row['file_path'])
+        if rows:
+            print(f"🧹 Purged {len(rows)} finished Drive uploads")
+        self._remove_orphaned_spool_files()
+
+    def _remove_orphaned_spool_files(self, min_age=3600):
+        """ลบไฟล์ใน spool ที่ไม่มีงานในคิวอ้างถึง (เช่น โปรแกรมหยุดระหว่าง enqueue)"""
+        referenced = {os.path.abspath(row['file_path'])
+                      for row in self._conn().execute("SELECT file_path FROM uploads WHERE status IN ('pending', 'uploading')")}
+        cutoff = time.time() - min_age
+        removed = 0
+        for entry in os.scandir(self.spool_dir):
+            try:
+                if entry.is_file() and os.path.abspath(entry.path) not in referenced and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            print(f"🧹 Removed {removed} orphaned spool files")
+
+    def _remove_spool_file(self, file_path):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+    def _claim_next(self):
+        """เลือกงานที่ถึงเวลาอัปโหลดแล้วและเปลี่ยนสถานะเป็น uploading"""
+        with self._lock:
+            conn = self._conn()
+            with conn:
+                row = conn.execute(
+                    '''SELECT * FROM uploads WHERE status = 'pending' AND next_attempt_at <= ?
+                       ORDER BY next_attempt_at LIMIT 1''', (time.time(),)).fetchone()
+                if not row:
+                    return None
+                conn.execute("UPDATE uploads SET status = 'uploading', updated_at = ? WHERE id = ?",
+                             (time.time(), row['id']))
+        return row
+
+    def _next_due_in(self):
+        row = self._conn().execute(
+            "SELECT MIN(next_attempt_at) AS due FROM uploads WHERE status = 'pending'").fetchone()
+        return None if row['due'] is None else max(0.0, row['due'] - time.time())
+
+    def _worker_loop(self):
+        while not self._stopped:
+            row = None
+            try:
+                if time.time() - self._last_purge > self.PURGE_INTERVAL:
+                    self.purge()
+                row = self._claim_next()
+                if row is None:
+                    due_in = self._next_due_in()
+                    self._wakeup.wait(min(due_in, 30) if due_in is not None else 30)
+                    self._wakeup.clear()
+                    continue
+                self._process(row)
+            except Exception as e:
+                # เช่น sqlite3.OperationalError "database is locked" - worker ต้องทำงานต่อ
+                # ไม่เช่นนั้นงานที่เหลือจะค้างสถานะ pending ไปตลอด
+                print(f"❌ Upload worker error: {e}")
+                if row is not None:
+                    self._release(row)
+                time.sleep(1)
+
+    def _release(self, row):
+        """คืนงานที่ค้างสถานะ uploading (บันทึกผลไม่สำเร็จ) กลับไปรอในคิว"""
+        try:
+            with self._lock:
+                conn = self._conn()
+                with conn:
+                    conn.execute(
+                        "UPDATE uploads SET status = 'pending', next_attempt_at = ?, updated_at = ? "
+                        "WHERE id = ? AND status = 'uploading'",
+                        (time.time() + 5, time.time(), row['id']))
+        except Exception as e:
+            print(f"❌ ไม่สามารถคืนงานอัปโหลด {row['id']} กลับเข้าคิว: {e}")
+
+    def _process(self, row):
+        upload_id = row['id']
+        credentials = json.loads(row['credentials'])
+        old_token = credentials.get('token')
+        try:
+            google_client = client_pool.get(row['owner'], credentials)
+            self._remember_credentials(row['owner'], google_client, old_token)
+
+            folder_id = row['folder_id']
+            if self.resource_cache:
+                resources = self.resource_cache.get(row['owner'])
+                if resources and resources.get('photo_folder_id'):
+                    folder_id = resources['photo_folder_id']
+
+            file_info = google_client.upload_to_drive(row['file_path'], folder_id, row['file_name'])
+            link = file_info.get('webViewLink')
+            self._mark_done(upload_id, link)
+            print(f"✅ อัปโหลดภาพสำเร็จ (background): {row['file_name']}")
+            self._remove_spool_file(row['file_path'])
+        except Exception as e:
+            self._mark_failed(row, e)
+
+    def _remember_credentials(self, owner, google_client, old_token):
+        """ถ้า token ถูกต่ออายุ ให้ใช้ credentials ใหม่กับงานที่รออยู่ของผู้ใช้คนเดียวกันด้วย"""
+        updated = google_client.get_updated_credentials()
+        if not updated or updated.get('token') == old_token:
+            return
+        updated = dict(updated)
+        with self._lock:
+            self._refreshed_credentials[owner] = updated
+            conn = self._conn()
+            with conn:
+                conn.execute("UPDATE uploads SET credentials = ? WHERE owner = ? AND status IN ('pending', 'uploading')",
+                             (json.dumps(updated), owner))
+
+    def _mark_done(self, upload_id, link):
+        with self._lock:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "UPDATE uploads SET status = 'done', drive_link = ?, error = NULL, updated_at = ? WHERE id = ?",
+                    (link, time.time(), upload_id))
+                row = conn.execute('SELECT owner, sheet_target, credentials FROM uploads WHERE id = ?',
+                                   (upload_id,)).fetchone()
+
+        for target in self._load_targets(row['sheet_target']):
+            self._patch_sheet_link(row['owner'], target, json.loads(row['credentials']), link)
+        self._forget_credentials(upload_id)
+
+    def _forget_credentials(self, upload_id):
+        """งานที่จบแล้วไม่ต้องใช้ OAuth credentials อีก จึงไม่เก็บไว้ใน SQLite"""
+        with self._lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("UPDATE uploads SET credentials = '{}' WHERE id = ?", (upload_id,))
+
+    @staticmethod
+    def _load_targets(sheet_target):
+        """แถวที่รอลิงก์ทั้งหมด (ข้อมูลเก่าเก็บเป็น dict เดียว)"""
+        if not sheet_target:
+            return []
+        targets = json.loads(sheet_target)
+        return targets if isinstance(targets, list) else [targets]
+
+    def _patch_sheet_link(self, owner, target, credentials, link):
+        """เติมลิงก์ (หรือ FAILED_LINK_TEXT) ลงในแถวที่ถูกบันทึกก่อนอัปโหลดเสร็จ"""
+        try:
+            google_client = client_pool.get(owner, credentials)
+            google_client.update_sheet_cell(
+                target['spreadsheet_id'], target['data_sheet_id'], target['row_number'],
+                self.LINK_COLUMN_INDEX, link)
+            print(f"✅ เติมลิงก์รูปภาพในแถว {target['row_number']} แล้ว")
+        except Exception as e:
+            print(f"❌ ไม่สามารถเติมลิงก์รูปภาพใน Sheets: {e}")
+
+    def _mark_failed(self, row, error):
+        attempts = row['attempts'] + 1
+        # refresh token ใช้ไม่ได้ / 401 / 403 ที่ไม่มีสิทธิ์จริง - ลองใหม่ไม่ช่วย ผู้ใช้ต้องเข้าสู่ระบบใหม่
+        # (403 จากการจำกัดอัตรา เช่น userRateLimitExceeded ลองใหม่ตาม backoff)
+        status = 'failed' if is_auth_error(error) or attempts >= self.max_attempts else 'pending'
+        backoff = min(self.max_backoff, 5 * 2 ** (attempts - 1))
+        if self.resource_cache and is_not_found_error(error):
+            # โฟลเดอร์ปลายทางถูกลบ - ค้นหา (หรือสร้าง) ใหม่ใน background แล้วลองใหม่ตาม backoff
+            self.resource_cache.report_not_found(row['owner'], json.loads(row['credentials']))
+        print(f"❌ อัปโหลดไปยัง Google Drive ไม่สำเร็จ (ครั้งที่ {attempts}, {status}): {error}")
+
+        with self._lock:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    '''UPDATE uploads SET status = ?, attempts = ?, next_attempt_at = ?, error = ?, updated_at = ?
+                       WHERE id = ?''',
+                    (status, attempts, time.time() + backoff, str(error), time.time(), row['id']))
+                sheet_target = conn.execute('SELECT sheet_target FROM uploads WHERE id = ?',
+                                            (row['id'],)).fetchone()['sheet_target']
+
+        if status == 'failed':
+            # ล้มเหลวถาวร: แถวที่รอลิงก์จะไม่ได้ลิงก์แล้ว แจ้งในแถวแทนข้อความ "กำลังอัปโหลด..."
+            for target in self._load_targets(sheet_target):
+                self._patch_sheet_link(row['owner'], target, json.loads(row['credentials']), self.FAILED_LINK_TEXT)
+            self._forget_credentials(row['id'])
+            self._remove_spool_file(row['file_path'])